@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Circuit breaker for the RunAI GPU Metrics Collector
+
+Tracks the outcome of recent API calls per (cluster, endpoint) circuit. When
+the share of failed calls in the window reaches the error rate, the circuit
+opens and further calls are refused immediately with CircuitOpenError instead
+of each running into timeouts and retries. After the cooldown the circuit is
+half-open: a single probe call is let through, and its outcome closes the
+circuit again or restarts the cooldown.
+
+The state can be saved to a JSON file so that runs started from cron probe a
+failing cluster once instead of hammering it again; in daemon mode the same
+breaker simply carries over from one cycle to the next.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose circuit is open"""
+    
+    def __init__(self, circuit: str, retry_in: float):
+        super().__init__(f"Circuit open for {circuit}; skipped (next probe in {retry_in:.0f}s)")
+        self.circuit = circuit
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Error-rate circuit breaker with one circuit per (cluster, endpoint)"""
+    
+    def __init__(self, error_rate: float = 0.5, min_calls: int = 5,
+                 window: int = 20, cooldown: float = 60):
+        """
+        Initialize the breaker
+        
+        Args:
+            error_rate: Share of failed calls in the window that opens a circuit
+            min_calls: Calls needed in the window before the error rate is evaluated
+            window: Number of most recent calls considered per circuit
+            cooldown: Seconds an open circuit waits before a half-open probe
+        """
+        self.error_rate = error_rate
+        self.min_calls = max(1, min_calls)
+        self.window = max(self.min_calls, window)
+        self.cooldown = cooldown
+        self._circuits: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def circuit_name(cluster_uuid: str, endpoint: str) -> str:
+        """Name of the circuit of an endpoint of a cluster"""
+        return f"{cluster_uuid}/{endpoint}"
+    
+    def _circuit(self, name: str) -> Dict:
+        """Get (creating if needed) the state of a circuit; caller holds the lock"""
+        circuit = self._circuits.get(name)
+        if circuit is None:
+            circuit = {
+                'state': CLOSED,
+                'opened_at': 0.0,
+                'probing': False,
+                'outcomes': deque(maxlen=self.window)
+            }
+            self._circuits[name] = circuit
+        return circuit
+    
+    def before_call(self, name: str):
+        """
+        Check that a call may be made on a circuit
+        
+        Moves an open circuit whose cooldown has passed to half-open and lets
+        the caller through as its probe.
+        
+        Args:
+            name: Circuit name
+        
+        Raises:
+            CircuitOpenError: If the circuit is open or its probe is in flight
+        """
+        with self._lock:
+            circuit = self._circuit(name)
+            if circuit['state'] == CLOSED:
+                return
+            
+            retry_in = circuit['opened_at'] + self.cooldown - time.time()
+            if circuit['state'] == OPEN and retry_in <= 0:
+                logger.info(f"Circuit {name} half-open, sending a probe request")
+                circuit['state'] = HALF_OPEN
+            if circuit['state'] == HALF_OPEN and not circuit['probing']:
+                circuit['probing'] = True
+                return
+            raise CircuitOpenError(name, max(0.0, retry_in))
+    
+    def record(self, name: str, success: bool):
+        """
+        Record the outcome of a call allowed by before_call()
+        
+        Args:
+            name: Circuit name
+            success: False if the call failed in a way that indicates an outage
+        """
+        with self._lock:
+            circuit = self._circuit(name)
+            if circuit['state'] == HALF_OPEN:
+                circuit['probing'] = False
+                circuit['outcomes'].clear()
+                if success:
+                    logger.info(f"Circuit {name} closed, probe succeeded")
+                    circuit['state'] = CLOSED
+                else:
+                    logger.warning(f"Circuit {name} re-opened, probe failed")
+                    circuit['state'] = OPEN
+                    circuit['opened_at'] = time.time()
+                return
+            if circuit['state'] == OPEN:
+                # Call started before the circuit opened
+                return
+            
+            outcomes = circuit['outcomes']
+            outcomes.append(success)
+            failures = outcomes.count(False)
+            if len(outcomes) >= self.min_calls and failures / len(outcomes) >= self.error_rate:
+                logger.warning(
+                    f"Circuit {name} opened after {failures} of {len(outcomes)} calls failed; "
+                    f"skipping it for {self.cooldown:.0f}s"
+                )
+                circuit['state'] = OPEN
+                circuit['opened_at'] = time.time()
+                outcomes.clear()
+    
+    def release(self, name: str):
+        """
+        Give up a call allowed by before_call() without recording an outcome
+        
+        For calls that say nothing about the endpoint, such as requests cut
+        off by the collection deadline. A half-open circuit stays half-open
+        and lets the next call through as its probe.
+        
+        Args:
+            name: Circuit name
+        """
+        with self._lock:
+            circuit = self._circuit(name)
+            if circuit['state'] == HALF_OPEN:
+                circuit['probing'] = False
+    
+    def state(self, name: str) -> str:
+        """Get the state of a circuit ('closed', 'open' or 'half_open')"""
+        with self._lock:
+            circuit = self._circuits.get(name)
+            return circuit['state'] if circuit else CLOSED
+    
+    def save(self, path: str):
+        """
+        Save the state of circuits that are not closed to a JSON file
+        
+        Args:
+            path: File to write
+        """
+        with self._lock:
+            # A probe interrupted by the end of the run is retried next time
+            state = {
+                name: {'state': OPEN, 'opened_at': circuit['opened_at']}
+                for name, circuit in self._circuits.items()
+                if circuit['state'] != CLOSED
+            }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, path)
+    
+    def load(self, path: str):
+        """
+        Restore circuit states saved by save(); a missing file is ignored
+        
+        Args:
+            path: File to read
+        """
+        try:
+            with open(path, 'r') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable circuit breaker state {path}: {e}")
+            return
+        
+        with self._lock:
+            for name, saved in state.items():
+                circuit = self._circuit(name)
+                circuit['state'] = OPEN
+                circuit['opened_at'] = float(saved.get('opened_at', 0))
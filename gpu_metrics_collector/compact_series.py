@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Compact time series for the RunAI GPU Metrics Collector
+
+Collected series ('all_values' of cluster metrics, 'gpu_utilization_series'
+of projects) arrive as one {'timestamp', 'value'} dict per sample, several
+hundred bytes each. CompactSeries keeps them as two contiguous arrays, int64
+epoch seconds and float64 values (NumPy arrays when NumPy is installed,
+array.array otherwise), about 16 bytes per sample.
+
+A CompactSeries reads like the list it replaces: len(), indexing and
+iteration give {'timestamp', 'value'} dicts, with timestamps rendered in the
+format of the source samples and values with their source type (int or
+float). Series are only packed when every sample renders back exactly;
+anything else stays a list. json_default writes a CompactSeries out as that
+list, so the JSON output keeps its shape; callers encoding with plain
+json.dumps should collect without compact series (see
+GPUMetricsCollector's compact_series option).
+"""
+
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from metrics_store import from_epoch, to_epoch
+
+try:
+    import numpy as np
+except ImportError:  # Optional: array.array is used instead
+    np = None
+
+
+# Timestamp formats a series can be rendered back in
+_FORMATS = {
+    'utc': lambda ts: datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+    'utc_offset': lambda ts: datetime.fromtimestamp(ts, timezone.utc).isoformat(),
+    'local': lambda ts: from_epoch(ts).isoformat(),
+    'epoch': lambda ts: ts
+}
+
+
+def _detect_format(timestamp: Any) -> Optional[str]:
+    """Format whose rendering reproduces a source timestamp exactly, if any"""
+    if isinstance(timestamp, bool):
+        return None
+    if isinstance(timestamp, int):
+        return 'epoch'
+    if not isinstance(timestamp, str):
+        return None
+    try:
+        ts = to_epoch(timestamp)
+    except ValueError:
+        return None
+    for name in ('utc', 'local', 'utc_offset'):
+        if _FORMATS[name](ts) == timestamp:
+            return name
+    return None
+
+
+# Integers a float64 holds exactly
+_MAX_EXACT_INT = 2 ** 53
+
+
+def _value_type(values: Sequence[Any]) -> Optional[str]:
+    """
+    'int' or 'float' if every value (or None) is of that type, else None
+    
+    Values of other types (strings, bools, NaN) or mixed int and float values
+    could not be rendered back exactly from a float64 array.
+    """
+    value_type = None
+    for value in values:
+        if value is None:
+            continue
+        if type(value) is int and -_MAX_EXACT_INT <= value <= _MAX_EXACT_INT:
+            kind = 'int'
+        elif type(value) is float and value == value:
+            kind = 'float'
+        else:
+            return None
+        if value_type is None:
+            value_type = kind
+        elif value_type != kind:
+            return None
+    return value_type or 'float'
+
+
+class CompactSeries:
+    """Time series stored as parallel int64 timestamp and float64 value arrays"""
+    
+    __slots__ = ('timestamps', 'values', 'timestamp_format', 'value_type')
+    
+    def __init__(self, timestamps: Sequence[int], values: Sequence[float],
+                 timestamp_format: str = 'utc', value_type: str = 'float'):
+        """
+        Wrap timestamp and value arrays
+        
+        Args:
+            timestamps: Epoch seconds of the samples
+            values: Sample values, NaN for missing ones
+            timestamp_format: How timestamps are rendered: 'utc'
+                ('2024-01-15T10:30:00Z'), 'utc_offset' ('...+00:00'),
+                'local' (naive local time, like datetime.isoformat()) or 'epoch'
+            value_type: How values are rendered: 'float' or 'int'
+        """
+        if len(timestamps) != len(values):
+            raise ValueError("timestamps and values differ in length")
+        if np is not None:
+            self.timestamps = np.asarray(timestamps, dtype=np.int64)
+            self.values = np.asarray(values, dtype=np.float64)
+        else:
+            self.timestamps = array('q', timestamps)
+            self.values = array('d', values)
+        self.timestamp_format = timestamp_format
+        self.value_type = value_type
+    
+    @classmethod
+    def from_samples(cls, samples: Sequence[Dict]) -> Union['CompactSeries', List[Dict]]:
+        """
+        Pack {'timestamp', 'value'} samples
+        
+        Args:
+            samples: Samples as returned by the API
+        
+        Returns:
+            A CompactSeries, or the samples themselves unless every sample
+            renders back exactly: samples with other keys, timestamps in
+            mixed or sub-second formats, values that are not all ints or all
+            floats (None is allowed)
+        """
+        if not samples:
+            return samples
+        try:
+            timestamp_format = _detect_format(samples[0].get('timestamp'))
+        except AttributeError:
+            return samples
+        if timestamp_format is None:
+            return samples
+        
+        render = _FORMATS[timestamp_format]
+        timestamps, values = [], []
+        try:
+            for sample in samples:
+                if len(sample) != 2:
+                    return samples
+                timestamp = sample['timestamp']
+                if timestamp_format == 'epoch':
+                    if type(timestamp) is not int:
+                        return samples
+                    ts = timestamp
+                else:
+                    if not isinstance(timestamp, str):
+                        return samples
+                    ts = to_epoch(timestamp)
+                    if render(ts) != timestamp:
+                        return samples
+                timestamps.append(ts)
+                values.append(sample['value'])
+        except (KeyError, ValueError, TypeError, AttributeError):
+            return samples
+        
+        value_type = _value_type(values)
+        if value_type is None:
+            return samples
+        nan = float('nan')
+        return cls(timestamps, [nan if value is None else value for value in values],
+                   timestamp_format, value_type)
+    
+    def __len__(self) -> int:
+        return len(self.timestamps)
+    
+    def _sample(self, index: int) -> Dict:
+        value = float(self.values[index])
+        return {
+            'timestamp': _FORMATS[self.timestamp_format](int(self.timestamps[index])),
+            'value': None if value != value else int(value) if self.value_type == 'int' else value
+        }
+    
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict, List[Dict]]:
+        if isinstance(index, slice):
+            return [self._sample(position) for position in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("series index out of range")
+        return self._sample(index)
+    
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self._sample(index)
+    
+    def __repr__(self) -> str:
+        return f"CompactSeries({len(self)} samples)"
+    
+    def to_list(self) -> List[Dict]:
+        """
+        Render the series in its JSON shape
+        
+        Returns:
+            List of {'timestamp', 'value'} dicts; missing values are None
+        """
+        render = _FORMATS[self.timestamp_format]
+        timestamps = self.timestamps.tolist()
+        values = self.values.tolist()
+        if self.value_type == 'int':
+            return [
+                {'timestamp': render(ts), 'value': None if value != value else int(value)}
+                for ts, value in zip(timestamps, values)
+            ]
+        return [
+            {'timestamp': render(ts), 'value': None if value != value else value}
+            for ts, value in zip(timestamps, values)
+        ]
+    
+    def nbytes(self) -> int:
+        """Size of the sample arrays in bytes"""
+        if np is not None:
+            return int(self.timestamps.nbytes + self.values.nbytes)
+        return len(self) * (self.timestamps.itemsize + self.values.itemsize)
+
+
+def json_default(value: Any) -> Any:
+    """
+    json.dump default hook writing CompactSeries as lists
+    
+    NumPy scalars are written as the Python number they hold.
+    
+    Raises:
+        TypeError: For any other value json cannot encode
+    """
+    if isinstance(value, CompactSeries):
+        return value.to_list()
+    if np is not None and isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
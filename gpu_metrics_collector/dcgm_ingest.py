@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+DCGM exporter ingestion for the RunAI GPU Metrics Collector
+
+The RunAI API only reports coarse GPU_UTILIZATION. With the DCGM profiling
+fields enabled (see advanced_gpu_metrics/README.md), every node's
+dcgm-exporter reports per-GPU series such as DCGM_FI_PROF_SM_ACTIVE,
+DCGM_FI_PROF_PIPE_TENSOR_ACTIVE, DCGM_FI_PROF_DRAM_ACTIVE and
+DCGM_FI_DEV_FB_USED, labeled with the namespace and pod using the GPU.
+
+DCGMScraper scrapes the exporters concurrently and aggregates the series per
+namespace and pod while the response streams in; annotate_dcgm joins the
+aggregates onto the project records of a collection, matching each project
+to its namespace (runai-<project name> by default).
+
+Scrapes of hundreds of nodes with thousands of series each stay cheap:
+
+- Responses are read line by line as bytes and never held whole.
+- Comment lines and series of fields that were not asked for are skipped on
+  the metric name alone; labels are only parsed for the fields kept.
+- Each target is aggregated separately and merged once at the end, so the
+  workers share no state.
+"""
+
+import logging
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FIELDS = (
+    'DCGM_FI_PROF_SM_ACTIVE',
+    'DCGM_FI_PROF_PIPE_TENSOR_ACTIVE',
+    'DCGM_FI_PROF_DRAM_ACTIVE',
+    'DCGM_FI_DEV_FB_USED'
+)
+
+# Namespace of a RunAI project is this prefix plus the project name
+DEFAULT_NAMESPACE_PREFIX = 'runai-'
+
+_LABEL = re.compile(rb'([A-Za-z_][A-Za-z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def field_key(field: str) -> str:
+    """
+    Key of a DCGM field in the annotated records
+    
+    Example: DCGM_FI_PROF_SM_ACTIVE -> sm_active, DCGM_FI_DEV_FB_USED -> fb_used
+    """
+    for prefix in ('DCGM_FI_PROF_', 'DCGM_FI_DEV_', 'DCGM_FI_'):
+        if field.startswith(prefix):
+            return field[len(prefix):].lower()
+    return field.lower()
+
+
+def parse_target(spec: str) -> Tuple[Optional[str], str]:
+    """
+    Parse a scrape target given as [CLUSTER_UUID=]URL
+    
+    Returns:
+        (cluster UUID or None for every cluster, URL)
+    """
+    scope, separator, url = spec.partition('=')
+    if separator and '://' not in scope:
+        return scope or None, url
+    return None, spec
+
+
+def parse_labels(block: bytes) -> Dict[str, str]:
+    """Parse the label block of a series ('name="value",...') into a dict"""
+    labels = {}
+    for name, value in _LABEL.findall(block):
+        if b'\\' in value:
+            value = value.replace(b'\\"', b'"').replace(b'\\n', b'\n').replace(b'\\\\', b'\\')
+        labels[name.decode()] = value.decode('utf-8', 'replace')
+    return labels
+
+
+def parse_exposition(lines: Iterable[bytes],
+                     fields: Sequence[str]) -> Iterator[Tuple[str, Dict[str, str], float]]:
+    """
+    Parse Prometheus text exposition, keeping only some metric names
+    
+    Args:
+        lines: Lines of the exposition as bytes
+        fields: Metric names to keep
+    
+    Yields:
+        (metric name, labels, value) of every kept series
+    """
+    wanted = {field.encode(): field for field in fields}
+    for line in lines:
+        if not line or line[0] == 35:  # '#'
+            continue
+        brace = line.find(b'{')
+        if brace < 0:
+            name, _, rest = line.partition(b' ')
+            block = b''
+        else:
+            name = line[:brace]
+            end = line.rfind(b'}')
+            block, rest = line[brace + 1:end], line[end + 1:]
+        field = wanted.get(name.strip())
+        if field is None:
+            continue
+        try:
+            # An optional timestamp may follow the value
+            value = float(rest.split(None, 1)[0])
+        except (IndexError, ValueError):
+            continue
+        if value != value:
+            continue
+        yield field, parse_labels(block), value
+
+
+class DCGMAggregate:
+    """DCGM series aggregated per (cluster scope, namespace, pod)"""
+    
+    def __init__(self):
+        # (scope, namespace) -> pod -> {'gpus': set of GPU ids, field: [sum, max, count]}
+        self.namespaces: Dict[Tuple[Optional[str], str], Dict[str, Dict]] = {}
+        # Target URL -> error of targets that could not be scraped
+        self.errors: Dict[str, str] = {}
+        self.targets = 0
+        self.series = 0
+        self.timestamp = datetime.now().isoformat()
+    
+    def add(self, scope: Optional[str], field: str, labels: Dict[str, str], value: float):
+        """Add one series; series of GPUs no pod is using are ignored"""
+        namespace = labels.get('namespace') or labels.get('exported_namespace')
+        pod = labels.get('pod') or labels.get('exported_pod')
+        if not namespace or not pod:
+            return
+        gpu = (labels.get('Hostname', ''), labels.get('UUID') or labels.get('gpu', ''))
+        entry = self.namespaces.setdefault((scope, namespace), {}).setdefault(pod, {'gpus': set()})
+        entry['gpus'].add(gpu)
+        stats = entry.get(field)
+        if stats is None:
+            entry[field] = [value, value, 1]
+        else:
+            stats[0] += value
+            if value > stats[1]:
+                stats[1] = value
+            stats[2] += 1
+        self.series += 1
+    
+    def merge(self, other: 'DCGMAggregate'):
+        """Add the series of another aggregate (e.g. of another target)"""
+        for key, pods in other.namespaces.items():
+            target = self.namespaces.setdefault(key, {})
+            for pod, entry in pods.items():
+                merged = target.get(pod)
+                if merged is None:
+                    target[pod] = entry
+                    continue
+                merged['gpus'] |= entry['gpus']
+                for field, stats in entry.items():
+                    if field == 'gpus':
+                        continue
+                    current = merged.get(field)
+                    if current is None:
+                        merged[field] = stats
+                    else:
+                        current[0] += stats[0]
+                        current[1] = max(current[1], stats[1])
+                        current[2] += stats[2]
+        self.errors.update(other.errors)
+        self.targets += other.targets
+        self.series += other.series
+    
+    def pods(self, cluster_uuid: Optional[str], namespace: str) -> Dict[str, Dict]:
+        """Pods of a namespace seen by the targets of a cluster and by unscoped targets"""
+        pods = dict(self.namespaces.get((None, namespace), {}))
+        if cluster_uuid is not None:
+            pods.update(self.namespaces.get((cluster_uuid, namespace), {}))
+        return pods
+
+
+def _summarize(entries: Iterable[Dict], fields: Sequence[str]) -> Dict:
+    """Metrics of one or more pods: GPU count and mean, max and sum of every field"""
+    gpus = set()
+    totals: Dict[str, List[float]] = {}
+    for entry in entries:
+        gpus |= entry['gpus']
+        for field in fields:
+            stats = entry.get(field)
+            if stats is None:
+                continue
+            total = totals.get(field)
+            if total is None:
+                totals[field] = list(stats)
+            else:
+                total[0] += stats[0]
+                total[1] = max(total[1], stats[1])
+                total[2] += stats[2]
+    summary = {'gpus': len(gpus)}
+    for field, (total, maximum, count) in totals.items():
+        summary[field_key(field)] = {'mean': total / count, 'max': maximum, 'sum': total}
+    return summary
+
+
+def annotate_dcgm(collection: Dict, aggregate: DCGMAggregate,
+                  fields: Sequence[str] = DEFAULT_FIELDS,
+                  namespace_prefix: str = DEFAULT_NAMESPACE_PREFIX,
+                  include_pods: bool = True) -> int:
+    """
+    Join DCGM aggregates onto the project records of a collection in place
+    
+    Projects get 'dcgm_metrics' with the number of pods and GPUs seen in the
+    project's namespace and, per field, the mean, max and sum over those
+    GPUs (e.g. 'sm_active': {'mean': 0.42, ...}; DCGM_FI_PROF_* fields are
+    ratios between 0 and 1, DCGM_FI_DEV_FB_USED is in MiB). With
+    include_pods, 'per_pod' maps each pod to the same summary of its own GPUs.
+    
+    Args:
+        collection: Document returned by collect_all_metrics, or any document
+            with 'clusters' of cluster entries
+        aggregate: Result of DCGMScraper.scrape
+        fields: DCGM fields to report
+        namespace_prefix: Prefix of project namespaces
+        include_pods: Add the per-pod breakdown
+    
+    Returns:
+        Number of projects with at least one pod on a GPU
+    """
+    matched = 0
+    for cluster in collection.get('clusters', []):
+        for project in cluster.get('project_level_metrics', []):
+            if 'project_name' not in project:
+                continue
+            cluster_uuid = project.get('cluster_uuid', cluster.get('cluster_uuid'))
+            pods = aggregate.pods(cluster_uuid, namespace_prefix + str(project['project_name']))
+            metrics = {'pods': len(pods), **_summarize(pods.values(), fields),
+                       'timestamp': aggregate.timestamp}
+            if include_pods:
+                metrics['per_pod'] = {pod: _summarize([entry], fields) for pod, entry in pods.items()}
+            project['dcgm_metrics'] = metrics
+            matched += bool(pods)
+    return matched
+
+
+class DCGMScraper:
+    """Scrapes dcgm-exporter endpoints concurrently into a DCGMAggregate"""
+    
+    def __init__(self, targets: Sequence[str], fields: Sequence[str] = DEFAULT_FIELDS,
+                 namespace_prefix: str = DEFAULT_NAMESPACE_PREFIX, include_pods: bool = True,
+                 max_workers: int = 32, connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0, session: Optional[requests.Session] = None):
+        """
+        Initialize the scraper
+        
+        Args:
+            targets: Exporter URLs as [CLUSTER_UUID=]URL, e.g.
+                http://node-1:9400/metrics; a cluster UUID restricts the
+                target's pods to the projects of that cluster
+            fields: DCGM fields to keep
+            namespace_prefix: Prefix of project namespaces (see annotate_dcgm)
+            include_pods: Add the per-pod breakdown to projects (see annotate_dcgm)
+            max_workers: Targets scraped at the same time
+            connect_timeout: Seconds to wait for a connection
+            read_timeout: Seconds to wait for the response to progress
+            session: HTTP session to scrape with; one is created and owned
+                by the scraper if omitted
+        """
+        self.targets = [parse_target(target) for target in targets]
+        self.fields = tuple(fields)
+        self.namespace_prefix = namespace_prefix
+        self.include_pods = include_pods
+        self.max_workers = max_workers
+        self.timeout = (connect_timeout, read_timeout)
+        self._owns_session = session is None
+        self.session = session or requests.Session()
+        # Enough pooled connections for every worker to reuse its own
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dcgm-scrape')
+    
+    def scrape_target(self, scope: Optional[str], url: str) -> DCGMAggregate:
+        """
+        Scrape and aggregate one exporter
+        
+        Errors are recorded in the returned aggregate instead of raised.
+        """
+        aggregate = DCGMAggregate()
+        try:
+            with self.session.get(url, timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                for field, labels, value in parse_exposition(
+                    response.iter_lines(chunk_size=65536), self.fields
+                ):
+                    aggregate.add(scope, field, labels, value)
+            aggregate.targets = 1
+        except (requests.exceptions.RequestException, OSError) as e:
+            logger.warning(f"Failed to scrape DCGM exporter {url}: {e}")
+            aggregate.errors[url] = str(e)
+        return aggregate
+    
+    def scrape(self, cluster_uuid: Optional[str] = None) -> DCGMAggregate:
+        """
+        Scrape every target, or the targets relevant to one cluster
+        
+        Args:
+            cluster_uuid: Only scrape the targets of this cluster and the
+                targets without a cluster
+        
+        Returns:
+            The merged aggregate; failed targets are listed in its errors
+        """
+        start = time.monotonic()
+        targets = [target for target in self.targets
+                   if cluster_uuid is None or target[0] in (None, cluster_uuid)]
+        result = DCGMAggregate()
+        if targets:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(targets)),
+                                    thread_name_prefix='dcgm') as executor:
+                for aggregate in executor.map(lambda target: self.scrape_target(*target), targets):
+                    result.merge(aggregate)
+        logger.info(f"Scraped {result.targets}/{len(targets)} DCGM exporters "
+                    f"({result.series} series) in {time.monotonic() - start:.1f}s")
+        return result
+    
+    def scrape_async(self, cluster_uuid: Optional[str] = None) -> 'Future[DCGMAggregate]':
+        """Start scrape() in the background, e.g. while the RunAI API is collected"""
+        return self._background.submit(self.scrape, cluster_uuid)
+    
+    def close(self):
+        """Wait for a running background scrape, then stop its thread and close the session"""
+        self._background.shutdown(wait=True)
+        if self._owns_session:
+            self.session.close()
+    
+    def annotate(self, collection: Dict, aggregate: DCGMAggregate) -> int:
+        """annotate_dcgm with the fields and options of this scraper"""
+        return annotate_dcgm(collection, aggregate, self.fields, self.namespace_prefix,
+                             self.include_pods)
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+GPU-hour accounting for the RunAI GPU Metrics Collector
+
+GPUHourLedger integrates collected series over time with the trapezoidal
+rule:
+
+- allocated GPU-hours of each cluster, from ALLOCATED_GPU
+- allocated GPU-hours of each project, from gpu_requested
+- used GPU-hours of each project, from gpu_requested x gpu_utilization / 100
+
+Each series keeps its last integrated point in the ledger, so the interval
+between two runs is integrated by the next run and samples a run has
+already seen (overlapping --hours-back windows) are skipped. Totals are kept
+per calendar month (UTC); an interval spanning a month boundary is split at
+the boundary. Intervals longer than max_gap (collector downtime) are not
+integrated.
+
+Series profiles give one point per sample; with the summary profile each run
+contributes one point per series. All series of a collection are integrated
+in one vectorized pass when NumPy is installed, with a pure-Python fallback
+that gives the same results.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from compact_series import CompactSeries
+from metrics_store import to_epoch
+
+try:
+    import numpy as np
+except ImportError:  # Optional: pure-Python fallback is used instead
+    np = None
+
+
+logger = logging.getLogger(__name__)
+
+LEDGER_VERSION = 1
+
+# Default longest interval between two points that is integrated, in seconds
+DEFAULT_MAX_GAP = 3600
+
+
+def _month_boundaries(start: int, end: int) -> Tuple[List[int], List[str]]:
+    """
+    Month starts (UTC) covering [start, end]
+    
+    Returns:
+        (epoch seconds of each month start, 'YYYY-MM' label of each month)
+    """
+    first = datetime.fromtimestamp(start, timezone.utc)
+    year, month = first.year, first.month
+    boundaries, labels = [], []
+    while True:
+        month_start = datetime(year, month, 1, tzinfo=timezone.utc)
+        if boundaries and month_start.timestamp() > end:
+            break
+        boundaries.append(int(month_start.timestamp()))
+        labels.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return boundaries, labels
+
+
+def _split_segment(t0: int, t1: int, v0: float, v1: float, boundaries: List[int],
+                   period: int) -> List[Tuple[int, float]]:
+    """
+    Trapezoid areas (value-hours) of a segment crossing period boundaries
+    
+    Args:
+        t0, t1: Segment start and end
+        v0, v1: Values at the start and end, linearly interpolated in between
+        boundaries: Period start times
+        period: Index of the period containing t0
+    
+    Returns:
+        (period index, area) for each part of the segment
+    """
+    parts = []
+    start, start_value = t0, v0
+    while start < t1:
+        end = boundaries[period + 1] if period + 1 < len(boundaries) else t1
+        end = min(end, t1)
+        end_value = v0 + (v1 - v0) * (end - t0) / (t1 - t0)
+        parts.append((period, (end - start) * (start_value + end_value) / 2 / 3600))
+        start, start_value = end, end_value
+        period += 1
+    return parts
+
+
+def integrate_series(series: List[Tuple[Sequence[int], Sequence[Sequence[float]]]],
+                     max_gap: float = DEFAULT_MAX_GAP) -> List[Dict[str, List[float]]]:
+    """
+    Integrate many series with the trapezoidal rule, split by calendar month
+    
+    Intervals that are not positive or longer than max_gap, and intervals
+    with a NaN at either end, contribute nothing.
+    
+    Args:
+        series: One (timestamps, columns) pair per series. Timestamps are
+            ascending epoch seconds; each column holds one value per timestamp.
+            Every series has the same number of columns.
+        max_gap: Longest interval that is integrated, in seconds
+    
+    Returns:
+        One {'YYYY-MM': [value-hours per column]} dictionary per series
+    """
+    results: List[Dict[str, List[float]]] = [{} for _ in series]
+    timed = [(index, t, columns) for index, (t, columns) in enumerate(series) if len(t) > 1]
+    if not timed:
+        return results
+    column_count = len(timed[0][2])
+    boundaries, labels = _month_boundaries(
+        min(int(t[0]) for _, t, _ in timed), max(int(t[-1]) for _, t, _ in timed)
+    )
+    
+    def add(index: int, period: int, column: int, area: float):
+        totals = results[index].setdefault(labels[period], [0.0] * column_count)
+        totals[column] += area
+    
+    if np is not None:
+        owner = np.concatenate([np.full(len(t), index, dtype=np.int64) for index, t, _ in timed])
+        t = np.concatenate([np.asarray(t, dtype=np.int64) for _, t, _ in timed])
+        values = np.stack([
+            np.concatenate([np.asarray(columns[column], dtype=np.float64) for _, _, columns in timed])
+            for column in range(column_count)
+        ], axis=1)
+        
+        dt = np.diff(t)
+        valid = (owner[1:] == owner[:-1]) & (dt > 0) & (dt <= max_gap)
+        period = np.searchsorted(np.asarray(boundaries, dtype=np.int64), t, side='right') - 1
+        crossing = valid & (period[1:] != period[:-1])
+        simple = valid & ~crossing
+        
+        areas = dt[:, None] * (values[1:] + values[:-1]) / 2 / 3600
+        areas = np.where(np.isnan(areas), 0.0, areas)
+        # One bin per (series, period) pair
+        bins = owner[:-1] * len(boundaries) + period[:-1]
+        for column in range(column_count):
+            sums = np.bincount(bins[simple], weights=areas[simple, column],
+                               minlength=len(results) * len(boundaries))
+            for bin_index in np.flatnonzero(sums):
+                add(int(bin_index) // len(boundaries), int(bin_index) % len(boundaries),
+                    column, float(sums[bin_index]))
+        
+        for position in np.flatnonzero(crossing):
+            for column in range(column_count):
+                v0, v1 = values[position, column], values[position + 1, column]
+                if np.isnan(v0) or np.isnan(v1):
+                    continue
+                for part, area in _split_segment(int(t[position]), int(t[position + 1]),
+                                                 float(v0), float(v1), boundaries,
+                                                 int(period[position])):
+                    add(int(owner[position]), part, column, area)
+        return results
+    
+    for index, t, columns in timed:
+        for position in range(len(t) - 1):
+            t0, t1 = int(t[position]), int(t[position + 1])
+            if not 0 < t1 - t0 <= max_gap:
+                continue
+            period = bisect_right(boundaries, t0) - 1
+            for column in range(column_count):
+                v0, v1 = float(columns[column][position]), float(columns[column][position + 1])
+                if math.isnan(v0) or math.isnan(v1):
+                    continue
+                for part, area in _split_segment(t0, t1, v0, v1, boundaries, period):
+                    add(index, part, column, area)
+    return results
+
+
+def _series_points(samples) -> Tuple[List[int], List[float]]:
+    """Timestamps and values of a collected series (CompactSeries or sample list)"""
+    if isinstance(samples, CompactSeries):
+        return samples.timestamps.tolist(), samples.values.tolist()
+    timestamps, values = [], []
+    for sample in samples:
+        try:
+            timestamps.append(to_epoch(sample['timestamp']))
+        except (KeyError, ValueError):
+            continue
+        try:
+            values.append(float(sample.get('value')))
+        except (TypeError, ValueError):
+            values.append(math.nan)
+    return timestamps, values
+
+
+class GPUHourLedger:
+    """Running GPU-hour totals per cluster and project, carried between runs"""
+    
+    def __init__(self, max_gap: float = DEFAULT_MAX_GAP):
+        """
+        Initialize an empty ledger
+        
+        Args:
+            max_gap: Longest interval between two points of a series that is
+                integrated, in seconds
+        """
+        self.max_gap = max_gap
+        # Series key -> {'cluster_uuid', 'project_id', 'project_name', 'last': [t, values...]}
+        self._series: Dict[str, Dict] = {}
+        # 'YYYY-MM' -> series key -> [allocated GPU-hours, used GPU-hours]
+        self._totals: Dict[str, Dict[str, List[float]]] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(cluster_uuid: str, project_id: Any = None) -> str:
+        return cluster_uuid if project_id is None else f"{cluster_uuid}/{project_id}"
+    
+    def _cluster_points(self, cluster: Dict) -> Optional[Tuple[List[int], List[List[float]]]]:
+        """Points of the ALLOCATED_GPU series of a cluster entry"""
+        metric = cluster.get('cluster_level_metrics', {}).get('metrics', {}).get('ALLOCATED_GPU')
+        if not metric:
+            return None
+        if 'all_values' in metric:
+            timestamps, allocated = _series_points(metric['all_values'])
+        else:
+            timestamps, allocated = _series_points([{
+                'timestamp': metric.get('timestamp'), 'value': metric.get('current_value')
+            }])
+        return timestamps, [allocated]
+    
+    @staticmethod
+    def _project_points(project: Dict) -> Optional[Tuple[List[int], List[List[float]]]]:
+        """Points of the allocated and used series of a project record"""
+        if 'error' in project or 'gpu_metrics' not in project:
+            return None
+        try:
+            allocated = float(project['gpu_metrics'].get('gpu_requested') or 0)
+        except (TypeError, ValueError):
+            return None
+        series = project.get('gpu_utilization_series')
+        if series:
+            timestamps, utilization = _series_points(series)
+        else:
+            timestamps, utilization = _series_points([{
+                'timestamp': project.get('timestamp'),
+                'value': project['gpu_metrics'].get('gpu_utilization')
+            }])
+        return timestamps, [[allocated] * len(timestamps),
+                            [allocated * value / 100 for value in utilization]]
+    
+    def _prepare(self, key: str, meta: Dict,
+                 points: Tuple[List[int], List[List[float]]]) -> Tuple[List[int], List[List[float]]]:
+        """Drop points the ledger has seen and prepend the carried last point"""
+        timestamps, columns = points
+        entry = self._series.get(key)
+        last = entry['last'] if entry else None
+        keep = [i for i, ts in enumerate(timestamps) if last is None or ts > last[0]]
+        timestamps = [timestamps[i] for i in keep]
+        columns = [[column[i] for i in keep] for column in columns]
+        
+        if timestamps:
+            self._series[key] = {
+                **meta,
+                'last': [timestamps[-1]] + [column[-1] for column in columns]
+            }
+        if last is not None:
+            timestamps = [last[0]] + timestamps
+            columns = [[last[1 + index]] + column for index, column in enumerate(columns)]
+        return timestamps, columns
+    
+    def account(self, collection: Dict) -> Dict[str, float]:
+        """
+        Integrate a collection into the ledger
+        
+        Cluster entries get 'gpu_hours' {'allocated'} in cluster_level_metrics
+        and project records get 'gpu_hours' {'allocated', 'used'}, holding the
+        GPU-hours this collection added.
+        
+        Args:
+            collection: collect_all_metrics document; a document with a subset
+                of the clusters, or of a cluster's records, works as well
+        
+        Returns:
+            Dictionary with the 'allocated' and 'used' GPU-hours added over
+            all projects, and 'cluster_allocated' over all clusters
+        """
+        cluster_targets, cluster_series = [], []
+        project_targets, project_series = [], []
+        
+        with self._lock:
+            for cluster in collection.get('clusters', []):
+                cluster_uuid = cluster.get('cluster_uuid')
+                points = self._cluster_points(cluster) if cluster_uuid else None
+                if points is not None:
+                    meta = {'cluster_uuid': cluster_uuid, 'project_id': None, 'project_name': None}
+                    cluster_targets.append((cluster['cluster_level_metrics'], self._key(cluster_uuid)))
+                    cluster_series.append(self._prepare(self._key(cluster_uuid), meta, points))
+                
+                for project in cluster.get('project_level_metrics', []):
+                    project_cluster = project.get('cluster_uuid', cluster_uuid)
+                    points = self._project_points(project)
+                    if points is None or project_cluster is None:
+                        continue
+                    key = self._key(project_cluster, project.get('project_id'))
+                    meta = {
+                        'cluster_uuid': project_cluster,
+                        'project_id': project.get('project_id'),
+                        'project_name': project.get('project_name')
+                    }
+                    project_targets.append((project, key))
+                    project_series.append(self._prepare(key, meta, points))
+            
+            added = {'allocated': 0.0, 'used': 0.0, 'cluster_allocated': 0.0}
+            for targets, series, names in (
+                (cluster_targets, cluster_series, ('allocated',)),
+                (project_targets, project_series, ('allocated', 'used'))
+            ):
+                for (target, key), periods in zip(targets, integrate_series(series, self.max_gap)):
+                    increment = [0.0] * len(names)
+                    for label, areas in periods.items():
+                        totals = self._totals.setdefault(label, {}).setdefault(key, [0.0, 0.0])
+                        for column, area in enumerate(areas):
+                            totals[column] += area
+                            increment[column] += area
+                    target['gpu_hours'] = dict(zip(names, increment))
+                    if len(names) == 1:
+                        added['cluster_allocated'] += increment[0]
+                    else:
+                        added['allocated'] += increment[0]
+                        added['used'] += increment[1]
+        
+        logger.debug(f"Accounted {added['allocated']:.3f} allocated and "
+                     f"{added['used']:.3f} used project GPU-hours")
+        return added
+    
+    def totals(self, period: Optional[str] = None) -> List[Dict]:
+        """
+        Get the accumulated GPU-hours
+        
+        Args:
+            period: 'YYYY-MM' month, or None for every month
+        
+        Returns:
+            One entry per month and series with 'period', 'cluster_uuid',
+            'project_id', 'project_name', 'allocated_gpu_hours' and, for
+            projects, 'used_gpu_hours'. Cluster entries have project_id None.
+        """
+        entries = []
+        with self._lock:
+            for label in sorted(self._totals):
+                if period is not None and label != period:
+                    continue
+                for key, (allocated, used) in self._totals[label].items():
+                    meta = self._series.get(key, {})
+                    entry = {
+                        'period': label,
+                        'cluster_uuid': meta.get('cluster_uuid', key.split('/')[0]),
+                        'project_id': meta.get('project_id'),
+                        'project_name': meta.get('project_name'),
+                        'allocated_gpu_hours': allocated
+                    }
+                    if entry['project_id'] is not None:
+                        entry['used_gpu_hours'] = used
+                    entries.append(entry)
+        return entries
+    
+    def save(self, path: str):
+        """
+        Save the ledger to a JSON file
+        
+        Args:
+            path: File to write
+        """
+        with self._lock:
+            state = {
+                'version': LEDGER_VERSION,
+                'series': self._series,
+                'totals': self._totals
+            }
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f, indent=2)
+        os.replace(tmp_path, path)
+    
+    def load(self, path: str):
+        """
+        Restore a ledger saved by save(); a missing file is ignored
+        
+        Args:
+            path: File to read
+        
+        Raises:
+            ValueError: If the file is not a ledger of this version. An
+                unreadable ledger is not ignored, since saving over it would
+                lose the totals.
+        """
+        try:
+            with open(path, 'r') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        if state.get('version') != LEDGER_VERSION:
+            raise ValueError(f"Unsupported GPU-hour ledger version in {path}: {state.get('version')}")
+        with self._lock:
+            self._series = state.get('series', {})
+            self._totals = state.get('totals', {})
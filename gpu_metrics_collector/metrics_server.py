@@ -0,0 +1,663 @@
+#!/usr/bin/env python3
+"""
+Daemon mode for the RunAI GPU Metrics Collector
+
+Runs the collector on a fixed interval and exposes the latest cluster-level
+and project-level values on a local HTTP endpoint in Prometheus text format.
+Clusters are spread over the interval with random jitter so the control plane
+sees a steady trickle of requests instead of a burst every cycle, and the same
+API client (and its warm connection pool) is reused for every cycle.
+
+The same endpoint serves a read-only JSON API (QueryService) over the latest
+snapshot and the local metrics history, so dashboards and scripts read the
+collector's results instead of calling the RunAI API themselves. Rendered
+responses are cached until the snapshot changes, and identical concurrent
+requests that miss the cache share one rendering and at most one upstream
+fetch (SingleFlight).
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, unquote
+
+from compact_series import json_default
+from metrics_stats import annotate_statistics
+from metrics_store import to_epoch
+
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+JSON_CONTENT_TYPE = 'application/json'
+
+API_PREFIX = '/api/v1'
+
+# (metric name, help text, source key) for each exported family
+CLUSTER_FAMILIES = [
+    ('runai_cluster_total_gpu', 'Total GPUs in the cluster', 'TOTAL_GPU'),
+    ('runai_cluster_allocated_gpu', 'GPUs allocated across all workloads', 'ALLOCATED_GPU'),
+    ('runai_cluster_gpu_utilization', 'Average GPU utilization of the cluster (percent)', 'GPU_UTILIZATION'),
+]
+PROJECT_FAMILIES = [
+    ('runai_project_gpu_limit', 'GPU quota (deserved GPUs) of the project', 'gpu_limit'),
+    ('runai_project_gpu_requested', 'GPUs allocated to the project', 'gpu_requested'),
+    ('runai_project_gpu_utilization', 'GPU utilization of the project (percent)', 'gpu_utilization'),
+]
+
+
+def _escape_label(value) -> str:
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict) -> str:
+    """Render a label set as {name="value",...}"""
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in labels.items()) + '}'
+
+
+def _to_float(value) -> Optional[float]:
+    """Convert an API value to float, or None if it is not numeric"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def render_prometheus(clusters: List[Dict], updated: Optional[Dict[str, float]] = None) -> str:
+    """
+    Render cluster entries as Prometheus text exposition
+    
+    Args:
+        clusters: Cluster entries as built by GPUMetricsCollector.collect_cluster
+        updated: Optional epoch seconds of the last update per cluster UUID
+    
+    Returns:
+        Prometheus text format document
+    """
+    lines = []
+    
+    for name, help_text, metric_type in CLUSTER_FAMILIES:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        for cluster in clusters:
+            metric = cluster.get('cluster_level_metrics', {}).get('metrics', {}).get(metric_type)
+            value = _to_float(metric.get('current_value')) if metric else None
+            if value is None:
+                continue
+            labels = {
+                'cluster_uuid': cluster.get('cluster_uuid'),
+                'cluster_name': cluster.get('cluster_name')
+            }
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+    
+    for name, help_text, key in PROJECT_FAMILIES:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        for cluster in clusters:
+            for project in cluster.get('project_level_metrics', []):
+                if 'project_name' not in project:
+                    continue
+                # Failed projects only carry quota values; utilization is unknown
+                if 'error' in project and key == 'gpu_utilization':
+                    continue
+                value = _to_float(project.get('gpu_metrics', {}).get(key))
+                if value is None:
+                    continue
+                labels = {
+                    'cluster_uuid': cluster.get('cluster_uuid'),
+                    'cluster_name': cluster.get('cluster_name'),
+                    'project_name': project.get('project_name'),
+                    'project_id': project.get('project_id')
+                }
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+    
+    name = 'runai_project_nodepool_gpu_utilization'
+    lines.append(f'# HELP {name} GPU utilization of the project within one nodepool (percent)')
+    lines.append(f'# TYPE {name} gauge')
+    for cluster in clusters:
+        for project in cluster.get('project_level_metrics', []):
+            for nodepool, entry in (project.get('nodepool_metrics') or {}).items():
+                value = _to_float(entry.get('gpu_utilization')) if 'error' not in entry else None
+                if value is None:
+                    continue
+                labels = {
+                    'cluster_uuid': cluster.get('cluster_uuid'),
+                    'cluster_name': cluster.get('cluster_name'),
+                    'project_name': project.get('project_name'),
+                    'project_id': project.get('project_id'),
+                    'nodepool': nodepool
+                }
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+    
+    if updated:
+        name = 'runai_collector_last_update_timestamp_seconds'
+        lines.append(f'# HELP {name} When the cluster was last collected')
+        lines.append(f'# TYPE {name} gauge')
+        for cluster_uuid, ts in sorted(updated.items()):
+            lines.append(f'{name}{_format_labels({"cluster_uuid": cluster_uuid})} {ts}')
+    
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsSnapshot:
+    """Thread-safe holder of the latest collected entry for each cluster"""
+    
+    def __init__(self):
+        self._clusters: Dict[str, Dict] = {}
+        self._updated: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        # Incremented on every update; responses rendered from the snapshot are tagged with it
+        self.generation = 0
+    
+    def update_cluster(self, cluster_entry: Dict):
+        """
+        Replace the stored entry of a cluster
+        
+        Args:
+            cluster_entry: Cluster entry as built by GPUMetricsCollector.collect_cluster
+        """
+        with self._lock:
+            self._clusters[cluster_entry['cluster_uuid']] = cluster_entry
+            self._updated[cluster_entry['cluster_uuid']] = time.time()
+            self.generation += 1
+    
+    def cluster(self, cluster_uuid: str) -> Tuple[Optional[Dict], Optional[float]]:
+        """Return the latest entry of a cluster and when it was updated, or (None, None)"""
+        with self._lock:
+            return self._clusters.get(cluster_uuid), self._updated.get(cluster_uuid)
+    
+    def updated(self) -> Dict[str, float]:
+        """Return the epoch seconds of the last update per cluster UUID"""
+        with self._lock:
+            return dict(self._updated)
+    
+    def clusters(self) -> List[Dict]:
+        """Return the latest entries, ordered by cluster UUID"""
+        with self._lock:
+            return [self._clusters[key] for key in sorted(self._clusters)]
+    
+    def render_prometheus(self) -> str:
+        """Render the latest values in Prometheus text format"""
+        with self._lock:
+            clusters = [self._clusters[key] for key in sorted(self._clusters)]
+            updated = dict(self._updated)
+        return render_prometheus(clusters, updated)
+
+
+class CollectorDaemon:
+    """Runs a GPUMetricsCollector periodically and keeps a MetricsSnapshot current"""
+    
+    def __init__(self, collector, interval: float = 300, hours_back: float = 1,
+                 cluster_uuid: Optional[str] = None, jitter: float = 0.1,
+                 snapshot: Optional[MetricsSnapshot] = None,
+                 ledger=None, ledger_path: Optional[str] = None, exporter=None, dcgm=None,
+                 statistics: Optional[Sequence[str]] = None, idle_threshold: float = 1.0):
+        """
+        Initialize the daemon
+        
+        Args:
+            collector: GPUMetricsCollector (sync) used for every cycle
+            interval: Seconds between the starts of two collection cycles
+            hours_back: Time window collected for each cluster
+            cluster_uuid: Specific cluster UUID, or None for all clusters
+            jitter: Random delay added to each cluster slot, as a fraction of the slot
+            snapshot: Snapshot to update, a new one if omitted
+            ledger: Optional GPUHourLedger every collected cluster is accounted in
+            ledger_path: File the ledger is saved to after every cycle
+            exporter: Optional PushExporter every collected cluster is submitted to
+            dcgm: Optional DCGMScraper whose metrics are joined onto the projects
+                of every collected cluster
+            statistics: Statistic names added to every collected cluster
+                (see metrics_stats), or None for no statistics
+            idle_threshold: Utilization at or below this value counts as idle
+        """
+        self.collector = collector
+        self.interval = interval
+        self.hours_back = hours_back
+        self.cluster_uuid = cluster_uuid
+        self.jitter = jitter
+        self.snapshot = snapshot or MetricsSnapshot()
+        self.ledger = ledger
+        self.ledger_path = ledger_path
+        self.exporter = exporter
+        self.dcgm = dcgm
+        self.statistics = statistics
+        self.idle_threshold = idle_threshold
+        # Clusters listed by the latest cycle, keyed by UUID
+        self.known_clusters: Dict[str, Dict] = {}
+        self._stop = threading.Event()
+    
+    def stop(self):
+        """Ask the daemon loop to stop after the current cluster"""
+        self._stop.set()
+    
+    def _list_clusters(self) -> List[Dict]:
+        """Get the clusters to collect this cycle"""
+        if self.cluster_uuid:
+            clusters = [{'uuid': self.cluster_uuid}]
+        else:
+            clusters = self.collector.client.get_clusters()
+        self.known_clusters = {
+            cluster.get('uuid') or cluster.get('id'): cluster for cluster in clusters
+        }
+        return clusters
+    
+    def _collect(self, cluster: Dict) -> Dict:
+        """Collect one cluster into the snapshot (and the ledger and exporter)"""
+        end_time = datetime.now()
+        start_time = end_time - timedelta(hours=self.hours_back)
+        # Scrape the DCGM exporters while the API is collected
+        dcgm_scrape = None
+        if self.dcgm is not None:
+            dcgm_scrape = self.dcgm.scrape_async(cluster.get('uuid') or cluster.get('id'))
+        cluster_entry = self.collector.collect_cluster(cluster, start_time, end_time)
+        if dcgm_scrape is not None:
+            self.dcgm.annotate({'clusters': [cluster_entry]}, dcgm_scrape.result())
+        if self.statistics:
+            annotate_statistics({'clusters': [cluster_entry]}, self.statistics, self.idle_threshold)
+        if self.ledger is not None:
+            self.ledger.account({'clusters': [cluster_entry]})
+        if self.exporter is not None:
+            self.exporter.submit(cluster_entry)
+        self.snapshot.update_cluster(cluster_entry)
+        return cluster_entry
+    
+    def fetch_cluster(self, cluster_uuid: str) -> Optional[Dict]:
+        """
+        Collect a cluster now, for a query that finds it missing from the snapshot
+        
+        Only clusters listed by the latest cycle are fetched, so queries for
+        unknown UUIDs never reach the API.
+        
+        Args:
+            cluster_uuid: Cluster UUID
+        
+        Returns:
+            The collected cluster entry, or None if the cluster is not known
+        """
+        cluster = self.known_clusters.get(cluster_uuid)
+        if cluster is None:
+            return None
+        logger.info(f"Collecting cluster {cluster_uuid} on demand")
+        return self._collect(cluster)
+    
+    def run_cycle(self):
+        """
+        Collect every cluster once, spreading them over the interval
+        
+        Cluster i starts at i * interval / N plus up to jitter * slot of random
+        delay. A cluster that fails keeps its previous values in the snapshot.
+        """
+        cycle_start = time.monotonic()
+        
+        try:
+            clusters = self._list_clusters()
+        except Exception as e:
+            logger.error(f"Failed to list clusters: {e}")
+            return
+        
+        slot = self.interval / max(1, len(clusters))
+        
+        for index, cluster in enumerate(clusters):
+            target = cycle_start + index * slot + random.uniform(0, slot * self.jitter)
+            if self._stop.wait(max(0, target - time.monotonic())):
+                return
+            
+            try:
+                self._collect(cluster)
+            except Exception as e:
+                logger.error(f"Failed to collect cluster {cluster.get('name', cluster)}: {e}")
+    
+    def run_forever(self):
+        """Run collection cycles until stop() is called"""
+        while not self._stop.is_set():
+            cycle_start = time.monotonic()
+            self.run_cycle()
+            if self.collector.store is not None:
+                try:
+                    self.collector.store.apply_retention()
+                except Exception as e:
+                    logger.warning(f"Failed to apply metrics store retention: {e}")
+            if self.ledger is not None and self.ledger_path:
+                try:
+                    self.ledger.save(self.ledger_path)
+                except OSError as e:
+                    logger.warning(f"Failed to save GPU-hour ledger: {e}")
+            elapsed = time.monotonic() - cycle_start
+            logger.info(f"Collection cycle finished in {elapsed:.1f}s")
+            self._stop.wait(max(0, self.interval - elapsed))
+
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers of the same key share its outcome"""
+    
+    def __init__(self):
+        self._calls: Dict[Any, list] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+    
+    def do(self, key: Any, func: Callable[[], Any]) -> Any:
+        """
+        Call func, or wait for the call already running for key
+        
+        Args:
+            key: Identity of the call
+            func: Function computing the result
+        
+        Returns:
+            The result of the call
+        
+        Raises:
+            Exception: Whatever the call raised, in every caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                # [done event, result, exception]
+                call = self._calls[key] = [threading.Event(), None, None]
+                self.calls += 1
+            else:
+                self.shared += 1
+        
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+        
+        try:
+            call[1] = func()
+            return call[1]
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call[0].set()
+
+
+def _parse_time(value: Optional[str]) -> Optional[int]:
+    """Query time parameter (epoch seconds or ISO 8601) as epoch seconds"""
+    if not value:
+        return None
+    return to_epoch(int(value) if value.isdigit() else value)
+
+
+class QueryError(Exception):
+    """A query that cannot be answered, with the HTTP status to return"""
+    
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class QueryService:
+    """
+    Read-only JSON API over a snapshot and an optional metrics store
+    
+    Endpoints (GET, relative to API_PREFIX):
+        /clusters                                  latest values of every cluster
+        /clusters/<uuid>                           latest cluster entry with its projects
+        /clusters/<uuid>/projects                  latest project records of a cluster
+        /clusters/<uuid>/projects/<project_id>     latest record of one project
+        /history?cluster_uuid=&metric=[&project_id=][&start=][&end=][&resolution=]
+                                                   stored series (see MetricsStore.query_series)
+    """
+    
+    def __init__(self, snapshot: MetricsSnapshot, store=None,
+                 fetch_cluster: Optional[Callable[[str], Optional[Dict]]] = None,
+                 max_entries: int = 1024, min_fetch_interval: float = 60.0):
+        """
+        Initialize the service
+        
+        Args:
+            snapshot: Snapshot the cluster endpoints read
+            store: Optional MetricsStore the history endpoint reads
+            fetch_cluster: Optional function collecting a cluster missing from
+                the snapshot (e.g. CollectorDaemon.fetch_cluster); returns None
+                for unknown clusters
+            max_entries: Rendered responses kept in memory
+            min_fetch_interval: Seconds before a cluster may be fetched on
+                demand again; requests in between get 503 instead of
+                sending more upstream requests for a cluster that failed
+        """
+        self.snapshot = snapshot
+        self.store = store
+        self.fetch_cluster = fetch_cluster
+        self.max_entries = max_entries
+        # (path, query) -> (snapshot generation, status, body)
+        self._cache: 'OrderedDict[Tuple, Tuple[int, int, bytes]]' = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.flights = SingleFlight()
+        self.min_fetch_interval = min_fetch_interval
+        # Cluster UUID -> time.monotonic() of its latest on-demand fetch
+        self._fetched: Dict[str, float] = {}
+        self._fetched_lock = threading.Lock()
+    
+    def get(self, path: str, query: str = '') -> Tuple[int, bytes]:
+        """
+        Answer a request
+        
+        Args:
+            path: Request path below API_PREFIX, e.g. '/clusters/c1'
+            query: Raw query string
+        
+        Returns:
+            (HTTP status, JSON body)
+        """
+        key = (path, tuple(sorted(parse_qsl(query))))
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == self.snapshot.generation:
+                self._cache.move_to_end(key)
+                return cached[1], cached[2]
+        
+        generation, status, body = self.flights.do(key, lambda: self._render(path, dict(key[1])))
+        if status == 200:
+            with self._cache_lock:
+                self._cache[key] = (generation, status, body)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return status, body
+    
+    def _render(self, path: str, params: Dict[str, str]) -> Tuple[int, int, bytes]:
+        """Compute the response of a request, tagged with the snapshot generation it reflects"""
+        generation = self.snapshot.generation
+        status, body = self._render_once(path, params)
+        if self.snapshot.generation != generation:
+            # The snapshot changed while rendering (e.g. by an on-demand fetch);
+            # render again so the cached body matches its generation
+            generation = self.snapshot.generation
+            status, body = self._render_once(path, params)
+        return generation, status, body
+    
+    def _render_once(self, path: str, params: Dict[str, str]) -> Tuple[int, bytes]:
+        """Compute the response of a request"""
+        try:
+            document = self._query(path, params)
+            status = 200
+        except QueryError as e:
+            document, status = {'error': str(e)}, e.status
+        except Exception as e:
+            logger.warning(f"Query {path} failed: {e}")
+            document, status = {'error': f"upstream request failed: {e}"}, 502
+        return status, json.dumps(document, separators=(',', ':'), default=json_default).encode('utf-8')
+    
+    def _query(self, path: str, params: Dict[str, str]) -> Any:
+        """Build the document answering a request"""
+        parts = [unquote(part) for part in path.strip('/').split('/') if part]
+        if parts == ['clusters']:
+            return {'clusters': self._cluster_summaries()}
+        if parts == ['history']:
+            return self._history(params)
+        if len(parts) in (2, 3, 4) and parts[0] == 'clusters' and parts[2:3] in ([], ['projects']):
+            cluster, updated = self._cluster(parts[1])
+            if len(parts) == 2:
+                return {**cluster, 'updated': updated}
+            projects = cluster.get('project_level_metrics', [])
+            if len(parts) == 3:
+                return {'cluster_uuid': parts[1], 'updated': updated, 'projects': projects}
+            for project in projects:
+                if str(project.get('project_id')) == parts[3]:
+                    return {**project, 'updated': updated}
+            raise QueryError(404, f"Unknown project {parts[3]} in cluster {parts[1]}")
+        raise QueryError(404, f"Unknown endpoint {API_PREFIX}{path}")
+    
+    def _cluster_summaries(self) -> List[Dict]:
+        """Latest current values of every cluster in the snapshot"""
+        updated = self.snapshot.updated()
+        return [
+            {
+                'cluster_uuid': cluster['cluster_uuid'],
+                'cluster_name': cluster.get('cluster_name'),
+                'updated': updated.get(cluster['cluster_uuid']),
+                'metrics': {
+                    metric_type: metric.get('current_value')
+                    for metric_type, metric in
+                    cluster.get('cluster_level_metrics', {}).get('metrics', {}).items()
+                },
+                'projects': len(cluster.get('project_level_metrics', []))
+            }
+            for cluster in self.snapshot.clusters()
+        ]
+    
+    def _cluster(self, cluster_uuid: str) -> Tuple[Dict, float]:
+        """Snapshot entry of a cluster, fetched upstream once if it is missing"""
+        cluster, updated = self.snapshot.cluster(cluster_uuid)
+        if cluster is None and self.fetch_cluster is not None:
+            # Requests for different endpoints of the same cluster share one fetch
+            if not self.flights.do(('fetch', cluster_uuid), lambda: self._fetch(cluster_uuid)):
+                raise QueryError(503, f"Cluster {cluster_uuid} was fetched less than "
+                                      f"{self.min_fetch_interval:g}s ago; retry later")
+            cluster, updated = self.snapshot.cluster(cluster_uuid)
+        if cluster is None:
+            raise QueryError(404, f"Unknown cluster {cluster_uuid}")
+        return cluster, updated
+    
+    def _fetch(self, cluster_uuid: str) -> bool:
+        """
+        Fetch a cluster on demand unless it was fetched within min_fetch_interval
+        
+        Args:
+            cluster_uuid: Cluster UUID
+        
+        Returns:
+            False if the fetch was refused by the rate limit, else True
+        """
+        now = time.monotonic()
+        with self._fetched_lock:
+            last = self._fetched.get(cluster_uuid)
+            if last is not None and now - last < self.min_fetch_interval:
+                return False
+            # Forget expired entries
+            for uuid, fetched in list(self._fetched.items()):
+                if now - fetched >= self.min_fetch_interval:
+                    del self._fetched[uuid]
+            self._fetched[cluster_uuid] = now
+        if self.fetch_cluster(cluster_uuid) is None:
+            # Unknown clusters cost no upstream request and stay 404
+            with self._fetched_lock:
+                self._fetched.pop(cluster_uuid, None)
+        return True
+    
+    def _history(self, params: Dict[str, str]) -> Dict:
+        """Stored series of one metric"""
+        if self.store is None:
+            raise QueryError(404, "No metrics history (run with --store)")
+        if not params.get('cluster_uuid') or not params.get('metric'):
+            raise QueryError(400, "cluster_uuid and metric are required")
+        try:
+            start = _parse_time(params.get('start'))
+            end = _parse_time(params.get('end'))
+            resolution = int(params.get('resolution', 0))
+        except ValueError as e:
+            raise QueryError(400, f"Invalid parameter: {e}")
+        
+        resolution, buckets = self.store.query_series(
+            params['cluster_uuid'], params['metric'], params.get('project_id'),
+            start, end, resolution
+        )
+        return {
+            'cluster_uuid': params['cluster_uuid'],
+            'project_id': params.get('project_id'),
+            'metric': params['metric'],
+            'resolution': resolution,
+            'points': [
+                {'timestamp': ts, 'min': minimum, 'max': maximum, 'mean': mean, 'count': count}
+                for ts, minimum, maximum, mean, count in buckets
+            ]
+        }
+
+
+def make_handler(snapshot: MetricsSnapshot, service: Optional[QueryService] = None):
+    """
+    Build an HTTP request handler class bound to a snapshot
+    
+    Args:
+        snapshot: Snapshot served by the handler
+        service: JSON API served under API_PREFIX, a QueryService over the
+            snapshot if omitted
+    
+    Returns:
+        BaseHTTPRequestHandler subclass serving /metrics, /healthz and the JSON API
+    """
+    service = service or QueryService(snapshot)
+    
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path, _, query = self.path.partition('?')
+            if path == '/metrics':
+                self._send(200, snapshot.render_prometheus(), PROMETHEUS_CONTENT_TYPE)
+            elif path == '/healthz':
+                self._send(200, 'ok\n', 'text/plain; charset=utf-8')
+            elif path == API_PREFIX or path.startswith(API_PREFIX + '/'):
+                status, body = service.get(path[len(API_PREFIX):], query)
+                self._send(status, body, JSON_CONTENT_TYPE)
+            else:
+                self._send(404, 'not found\n', 'text/plain; charset=utf-8')
+        
+        def _send(self, status: int, body, content_type: str):
+            payload = body if isinstance(body, bytes) else body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        
+        def log_message(self, format, *args):
+            logger.debug(f"{self.address_string()} - {format % args}")
+    
+    return MetricsHandler
+
+
+def start_http_server(snapshot: MetricsSnapshot, address: str = '127.0.0.1',
+                      port: int = 9101, service: Optional[QueryService] = None) -> ThreadingHTTPServer:
+    """
+    Serve a snapshot over HTTP from a background thread
+    
+    Args:
+        snapshot: Snapshot to serve
+        address: Address to listen on
+        port: Port to listen on (0 picks a free port)
+        service: JSON API to serve under API_PREFIX (see make_handler)
+    
+    Returns:
+        The running server; call shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((address, port), make_handler(snapshot, service))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info(f"Serving metrics on http://{address}:{server.server_address[1]}/metrics")
+    return server
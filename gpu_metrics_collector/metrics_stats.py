@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Statistics stage for the RunAI GPU Metrics Collector
+
+Packs every collected time series (cluster 'all_values' and the per-sample
+utilization of each project) into one padded array and computes summary
+statistics for all series in a single vectorized pass. NumPy is used when it
+is installed; otherwise a pure-Python fallback produces the same results.
+
+Supported statistics:
+- mean, min, max, std, count
+- pNN (percentile, e.g. p50, p95, p99) with linear interpolation
+- idle_fraction: share of samples at or below the idle threshold
+  (utilization series only)
+"""
+
+import logging
+import math
+import re
+from itertools import chain
+from typing import Dict, List, Optional, Sequence
+
+from compact_series import CompactSeries
+
+try:
+    import numpy as np
+except ImportError:  # Optional: pure-Python fallback is used instead
+    np = None
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATISTICS = ('mean', 'p50', 'p95', 'max', 'idle_fraction')
+
+# Cluster metric types whose samples are utilization percentages
+UTILIZATION_METRICS = ('GPU_UTILIZATION',)
+
+_PERCENTILE = re.compile(r'p(\d{1,2}(?:\.\d+)?|100)$')
+
+
+def validate_statistics(statistics: Sequence[str]) -> List[str]:
+    """
+    Check that every requested statistic is supported
+    
+    Args:
+        statistics: Statistic names
+    
+    Returns:
+        The statistic names as a list
+    
+    Raises:
+        ValueError: If a statistic is not supported
+    """
+    for name in statistics:
+        if name not in ('mean', 'min', 'max', 'std', 'count', 'idle_fraction') \
+                and not _PERCENTILE.match(name):
+            raise ValueError(f"Unsupported statistic: {name}")
+    return list(statistics)
+
+
+def _to_float(value) -> float:
+    """Convert a sample value to float; non-numeric values become NaN"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def compute_statistics(series: List[Sequence[float]], statistics: Sequence[str] = DEFAULT_STATISTICS,
+                       idle_threshold: float = 1.0) -> List[Dict[str, Optional[float]]]:
+    """
+    Compute statistics for many series at once
+    
+    NaN samples are ignored. Series without valid samples get None for every
+    statistic except count.
+    
+    Args:
+        series: One sequence of sample values per series
+        statistics: Statistic names (see module docstring)
+        idle_threshold: Samples at or below this value count as idle
+    
+    Returns:
+        One {statistic: value} dictionary per series, in input order
+    """
+    statistics = validate_statistics(statistics)
+    if not series:
+        return []
+    if np is not None:
+        return _compute_numpy(series, statistics, idle_threshold)
+    return [_compute_python(values, statistics, idle_threshold) for values in series]
+
+
+def _compute_numpy(series: List[Sequence[float]], statistics: List[str],
+                   idle_threshold: float) -> List[Dict[str, Optional[float]]]:
+    """Vectorized implementation over a NaN-padded 2D array"""
+    lengths = np.fromiter((len(values) for values in series), dtype=np.int64, count=len(series))
+    flat = np.fromiter(chain.from_iterable(series), dtype=float, count=int(lengths.sum()))
+    # Row-major boolean mask scatters the concatenated samples into their rows
+    data = np.full((len(series), max(1, int(lengths.max()))), np.nan)
+    data[np.arange(data.shape[1]) < lengths[:, None]] = flat
+    
+    valid = ~np.isnan(data)
+    counts = valid.sum(axis=1)
+    has_data = counts > 0
+    safe_counts = np.maximum(counts, 1)
+    zeros = np.where(valid, data, 0.0)
+    
+    columns = {}
+    sorted_data = None
+    for name in statistics:
+        if name == 'count':
+            columns[name] = counts.astype(float)
+        elif name == 'mean':
+            columns[name] = zeros.sum(axis=1) / safe_counts
+        elif name == 'std':
+            mean = zeros.sum(axis=1) / safe_counts
+            deviations = np.where(valid, data - mean[:, None], 0.0)
+            columns[name] = np.sqrt((deviations ** 2).sum(axis=1) / safe_counts)
+        elif name == 'min':
+            columns[name] = np.where(valid, data, np.inf).min(axis=1)
+        elif name == 'max':
+            columns[name] = np.where(valid, data, -np.inf).max(axis=1)
+        elif name == 'idle_fraction':
+            columns[name] = (valid & (data <= idle_threshold)).sum(axis=1) / safe_counts
+        else:
+            if sorted_data is None:
+                # NaN sorts last, so the first count entries of each row are valid
+                sorted_data = np.sort(data, axis=1)
+            q = float(name[1:]) / 100.0
+            position = (safe_counts - 1) * q
+            lower = np.floor(position).astype(int)
+            upper = np.ceil(position).astype(int)
+            rows = np.arange(len(series))
+            fraction = position - lower
+            columns[name] = (sorted_data[rows, lower] * (1 - fraction)
+                             + sorted_data[rows, upper] * fraction)
+    
+    results = []
+    for row in range(len(series)):
+        results.append({
+            name: (float(column[row]) if has_data[row] or name == 'count' else None)
+            for name, column in columns.items()
+        })
+    return results
+
+
+def _compute_python(values: Sequence[float], statistics: List[str],
+                    idle_threshold: float) -> Dict[str, Optional[float]]:
+    """Pure-Python implementation for a single series"""
+    samples = sorted(value for value in values if not math.isnan(value))
+    count = len(samples)
+    result = {}
+    for name in statistics:
+        if name == 'count':
+            result[name] = float(count)
+        elif count == 0:
+            result[name] = None
+        elif name == 'mean':
+            result[name] = sum(samples) / count
+        elif name == 'std':
+            mean = sum(samples) / count
+            result[name] = math.sqrt(sum((value - mean) ** 2 for value in samples) / count)
+        elif name == 'min':
+            result[name] = samples[0]
+        elif name == 'max':
+            result[name] = samples[-1]
+        elif name == 'idle_fraction':
+            result[name] = sum(1 for value in samples if value <= idle_threshold) / count
+        else:
+            position = (count - 1) * float(name[1:]) / 100.0
+            lower = math.floor(position)
+            upper = math.ceil(position)
+            fraction = position - lower
+            result[name] = samples[lower] * (1 - fraction) + samples[upper] * fraction
+    return result
+
+
+def _series_values(samples) -> Sequence[float]:
+    """Values of a collected series, read from the value array of a CompactSeries"""
+    if isinstance(samples, CompactSeries):
+        return samples.values
+    return [_to_float(sample.get('value')) for sample in samples]
+
+
+def annotate_statistics(collection: Dict, statistics: Sequence[str] = DEFAULT_STATISTICS,
+                        idle_threshold: float = 1.0) -> Dict:
+    """
+    Add statistics to every series of a collect_all_metrics document in place
+    
+    Cluster metrics get a 'statistics' entry next to 'current_value'. Projects
+    get 'gpu_statistics' next to 'gpu_metrics' with statistics of their
+    utilization series. Series need the 'series' or 'full' output profile;
+    records without them are left unchanged.
+    
+    Args:
+        collection: Document returned by collect_all_metrics
+        statistics: Statistic names (see module docstring)
+        idle_threshold: Utilization at or below this value counts as idle
+    
+    Returns:
+        The same document
+    """
+    statistics = validate_statistics(statistics)
+    other_statistics = [name for name in statistics if name != 'idle_fraction']
+    
+    # (target dict, key) for every series, split by whether idle_fraction applies
+    utilization_targets, utilization_series = [], []
+    other_targets, other_series = [], []
+    
+    for cluster in collection.get('clusters', []):
+        metrics = cluster.get('cluster_level_metrics', {}).get('metrics', {})
+        for metric_type, metric in metrics.items():
+            if 'all_values' not in metric:
+                continue
+            values = _series_values(metric['all_values'])
+            if metric_type in UTILIZATION_METRICS:
+                utilization_targets.append((metric, 'statistics'))
+                utilization_series.append(values)
+            else:
+                other_targets.append((metric, 'statistics'))
+                other_series.append(values)
+        
+        for project in cluster.get('project_level_metrics', []):
+            # The collector's resolver already extracted this series; reading
+            # it back keeps a single parser for the response layout
+            if 'gpu_utilization_series' not in project:
+                continue
+            utilization_targets.append((project, 'gpu_statistics'))
+            utilization_series.append(_series_values(project['gpu_utilization_series']))
+    
+    for targets, series, names in (
+        (utilization_targets, utilization_series, statistics),
+        (other_targets, other_series, other_statistics)
+    ):
+        if not targets or not names:
+            continue
+        results = compute_statistics(series, names, idle_threshold)
+        for (target, key), result in zip(targets, results):
+            if key == 'gpu_statistics':
+                target[key] = {'gpu_utilization': result}
+            else:
+                target[key] = result
+    
+    return collection
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Local time-series store for the RunAI GPU Metrics Collector
+
+Samples are kept in an embedded SQLite database keyed by cluster, project,
+metric and timestamp. Each series also records a high-water mark (the newest
+timestamp stored) so the collector can request only the part of the time
+window it has not seen yet.
+
+Samples are also rolled up into 5 minute, 1 hour and 1 day buckets holding
+min, max, sum and count. Rollups are updated incrementally from the samples
+each write adds, and every tier has its own retention, so the database stays
+bounded while long-range queries read a few hundred buckets instead of
+months of raw samples.
+
+Cluster-level series are stored with an empty project ID.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+
+logger = logging.getLogger(__name__)
+
+# Project ID used for cluster-level series
+CLUSTER_SCOPE = ''
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    cluster_uuid TEXT NOT NULL,
+    project_id   TEXT NOT NULL,
+    metric       TEXT NOT NULL,
+    ts           INTEGER NOT NULL,
+    value        REAL,
+    PRIMARY KEY (cluster_uuid, project_id, metric, ts)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS watermarks (
+    cluster_uuid TEXT NOT NULL,
+    project_id   TEXT NOT NULL,
+    metric       TEXT NOT NULL,
+    last_ts      INTEGER NOT NULL,
+    PRIMARY KEY (cluster_uuid, project_id, metric)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollups (
+    cluster_uuid TEXT NOT NULL,
+    project_id   TEXT NOT NULL,
+    metric       TEXT NOT NULL,
+    resolution   INTEGER NOT NULL,
+    bucket       INTEGER NOT NULL,
+    min          REAL,
+    max          REAL,
+    sum          REAL NOT NULL,
+    count        INTEGER NOT NULL,
+    PRIMARY KEY (cluster_uuid, project_id, metric, resolution, bucket)
+) WITHOUT ROWID;
+"""
+
+# Resolution of the raw samples tier
+RAW = 0
+
+# Rollup tiers, in seconds per bucket; buckets are aligned to the epoch (UTC)
+ROLLUP_RESOLUTIONS = (300, 3600, 86400)
+
+# Seconds each tier is kept for; None keeps it forever
+DEFAULT_RETENTION: Dict[int, Optional[int]] = {
+    RAW: 7 * 86400,
+    300: 30 * 86400,
+    3600: 400 * 86400,
+    86400: None
+}
+
+# Tier names accepted by parse_tier
+TIER_NAMES = {'raw': RAW, '5m': 300, '1h': 3600, '1d': 86400}
+
+
+def to_epoch(value: Union[str, int, float, datetime]) -> int:
+    """
+    Convert an API or collector timestamp to epoch seconds
+    
+    Args:
+        value: ISO 8601 string (with or without 'Z'), datetime, or epoch number.
+            Naive datetimes are interpreted as local time, like datetime.now().
+    
+    Returns:
+        Epoch seconds
+    
+    Raises:
+        ValueError: If the value cannot be parsed
+    """
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        if value.endswith('Z'):
+            value = value[:-1] + '+00:00'
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    raise ValueError(f"Unsupported timestamp: {value!r}")
+
+
+def parse_tier(name: str) -> int:
+    """
+    Get the resolution of a tier from its name ('raw', '5m', '1h' or '1d')
+    
+    Raises:
+        ValueError: If the name is not a tier
+    """
+    if name not in TIER_NAMES:
+        raise ValueError(f"Unknown tier {name!r} (expected one of {', '.join(TIER_NAMES)})")
+    return TIER_NAMES[name]
+
+
+def from_epoch(ts: int) -> datetime:
+    """
+    Convert epoch seconds to a naive local datetime, matching datetime.now()
+    
+    Args:
+        ts: Epoch seconds
+    
+    Returns:
+        Naive local datetime
+    """
+    return datetime.fromtimestamp(ts, tz=timezone.utc).astimezone().replace(tzinfo=None)
+
+
+class MetricsStore:
+    """SQLite-backed store of collected samples and per-series watermarks"""
+    
+    def __init__(self, path: str, retention: Optional[Dict[int, Optional[int]]] = None):
+        """
+        Open (and create if needed) the store
+        
+        Args:
+            path: SQLite database file, or ':memory:'
+            retention: Seconds to keep each tier for, keyed by resolution (RAW
+                or one of ROLLUP_RESOLUTIONS); None keeps a tier forever.
+                Tiers not given keep DEFAULT_RETENTION.
+        """
+        self.path = path
+        self.retention = {**DEFAULT_RETENTION, **(retention or {})}
+        # One connection shared by the collector's worker threads
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._backfill_rollups()
+    
+    def _backfill_rollups(self):
+        """Roll up the samples of a store created before rollups existed"""
+        with self._lock, self._conn:
+            if self._conn.execute('SELECT 1 FROM rollups LIMIT 1').fetchone():
+                return
+            if not self._conn.execute('SELECT 1 FROM samples LIMIT 1').fetchone():
+                return
+            for resolution in ROLLUP_RESOLUTIONS:
+                self._conn.execute(
+                    'INSERT INTO rollups '
+                    'SELECT cluster_uuid, project_id, metric, ?, ts - ts % ?, '
+                    'MIN(value), MAX(value), COALESCE(SUM(value), 0), COUNT(value) '
+                    'FROM samples GROUP BY cluster_uuid, project_id, metric, ts - ts % ?',
+                    (resolution, resolution, resolution)
+                )
+        logger.info("Rolled up existing samples of the metrics store")
+    
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def add_samples(self, cluster_uuid: str, project_id: Optional[str], metric: str,
+                    samples: Iterable[Tuple[int, float]]) -> int:
+        """
+        Store samples of one series and advance its watermark
+        
+        Samples already stored for the same timestamp are ignored, so
+        overlapping windows can be written without creating duplicates. The
+        new samples are added to the rollup buckets they fall in.
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            project_id: Project ID, or None for a cluster-level series
+            metric: Metric name (e.g. 'GPU_UTILIZATION', 'gpu_requested')
+            samples: (epoch seconds, value) pairs
+        
+        Returns:
+            Number of samples offered
+        """
+        project_id = CLUSTER_SCOPE if project_id is None else str(project_id)
+        rows = [(cluster_uuid, project_id, metric, int(ts), value) for ts, value in samples]
+        if not rows:
+            return 0
+        
+        last_ts = max(row[3] for row in rows)
+        with self._lock, self._conn:
+            stored = {ts for ts, in self._conn.execute(
+                'SELECT ts FROM samples WHERE cluster_uuid = ? AND project_id = ? '
+                'AND metric = ? AND ts BETWEEN ? AND ?',
+                (cluster_uuid, project_id, metric, min(row[3] for row in rows), last_ts)
+            )}
+            new_rows = {row[3]: row for row in rows if row[3] not in stored}
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO samples VALUES (?, ?, ?, ?, ?)', new_rows.values()
+            )
+            self._add_to_rollups(cluster_uuid, project_id, metric,
+                                 [(ts, row[4]) for ts, row in new_rows.items()])
+            self._conn.execute(
+                'INSERT INTO watermarks VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (cluster_uuid, project_id, metric) '
+                'DO UPDATE SET last_ts = MAX(last_ts, excluded.last_ts)',
+                (cluster_uuid, project_id, metric, last_ts)
+            )
+        return len(rows)
+    
+    def _add_to_rollups(self, cluster_uuid: str, project_id: str, metric: str,
+                        samples: List[Tuple[int, Optional[float]]]):
+        """Merge new samples into every rollup tier; the caller holds the lock"""
+        if not samples:
+            return
+        for resolution in ROLLUP_RESOLUTIONS:
+            # bucket -> [min, max, sum, count]
+            buckets: Dict[int, list] = defaultdict(lambda: [None, None, 0.0, 0])
+            for ts, value in samples:
+                aggregate = buckets[ts - ts % resolution]
+                if value is None:
+                    continue
+                aggregate[0] = value if aggregate[0] is None else min(aggregate[0], value)
+                aggregate[1] = value if aggregate[1] is None else max(aggregate[1], value)
+                aggregate[2] += value
+                aggregate[3] += 1
+            self._conn.executemany(
+                'INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (cluster_uuid, project_id, metric, resolution, bucket) DO UPDATE SET '
+                'min = COALESCE(MIN(min, excluded.min), min, excluded.min), '
+                'max = COALESCE(MAX(max, excluded.max), max, excluded.max), '
+                'sum = sum + excluded.sum, count = count + excluded.count',
+                [
+                    (cluster_uuid, project_id, metric, resolution, bucket) + tuple(aggregate)
+                    for bucket, aggregate in buckets.items()
+                ]
+            )
+    
+    def apply_retention(self, now: Optional[float] = None) -> Dict[int, int]:
+        """
+        Delete samples and rollup buckets older than their tier's retention
+        
+        Args:
+            now: Current epoch seconds, time.time() if omitted
+        
+        Returns:
+            Number of rows deleted per resolution
+        """
+        now = time.time() if now is None else now
+        deleted = {}
+        with self._lock, self._conn:
+            for resolution, seconds in self.retention.items():
+                if seconds is None:
+                    continue
+                cutoff = int(now - seconds)
+                if resolution == RAW:
+                    cursor = self._conn.execute('DELETE FROM samples WHERE ts < ?', (cutoff,))
+                else:
+                    # A bucket is kept while any part of it is within retention
+                    cursor = self._conn.execute(
+                        'DELETE FROM rollups WHERE resolution = ? AND bucket + ? <= ?',
+                        (resolution, resolution, cutoff)
+                    )
+                deleted[resolution] = cursor.rowcount
+        if any(deleted.values()):
+            logger.info(f"Metrics store retention removed {sum(deleted.values())} rows")
+        return deleted
+    
+    def watermark(self, cluster_uuid: str, project_id: Optional[str],
+                  metrics: Iterable[str]) -> Optional[int]:
+        """
+        Get the point up to which all of the given series are known
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            project_id: Project ID, or None for cluster-level series
+            metrics: Metric names that are fetched together
+        
+        Returns:
+            The oldest watermark among the series in epoch seconds, or None
+            if any of them has never been stored
+        """
+        project_id = CLUSTER_SCOPE if project_id is None else str(project_id)
+        metrics = list(metrics)
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT metric, last_ts FROM watermarks '
+                'WHERE cluster_uuid = ? AND project_id = ? AND metric IN (%s)'
+                % ','.join('?' * len(metrics)),
+                [cluster_uuid, project_id] + metrics
+            ).fetchall()
+        
+        if len(rows) < len(set(metrics)):
+            return None
+        return min(last_ts for _, last_ts in rows)
+    
+    def get_series(self, cluster_uuid: str, metric: str, project_id: Optional[str] = None,
+                   start: Optional[int] = None, end: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        Read the stored samples of one series in timestamp order
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            metric: Metric name
+            project_id: Project ID, or None for a cluster-level series
+            start: Inclusive lower bound in epoch seconds
+            end: Inclusive upper bound in epoch seconds
+        
+        Returns:
+            List of (epoch seconds, value) pairs
+        """
+        project_id = CLUSTER_SCOPE if project_id is None else str(project_id)
+        query = ('SELECT ts, value FROM samples '
+                 'WHERE cluster_uuid = ? AND project_id = ? AND metric = ?')
+        params = [cluster_uuid, project_id, metric]
+        if start is not None:
+            query += ' AND ts >= ?'
+            params.append(int(start))
+        if end is not None:
+            query += ' AND ts <= ?'
+            params.append(int(end))
+        query += ' ORDER BY ts'
+        
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+    
+    def select_resolution(self, start: Optional[int] = None, resolution: int = RAW,
+                          now: Optional[float] = None) -> int:
+        """
+        Pick the coarsest tier that serves a query
+        
+        Args:
+            start: Oldest epoch second the query needs, or None for all history
+            resolution: Coarsest bucket size, in seconds, the caller accepts
+            now: Current epoch seconds, time.time() if omitted
+        
+        Returns:
+            Resolution of the coarsest tier no coarser than resolution whose
+            retention reaches back to start. If no such tier reaches that far,
+            the one that keeps the most history.
+        """
+        now = time.time() if now is None else now
+        candidates = [tier for tier in (RAW,) + ROLLUP_RESOLUTIONS if tier <= resolution]
+        
+        def reach(tier: int) -> float:
+            seconds = self.retention.get(tier)
+            return float('-inf') if seconds is None else now - seconds
+        
+        for tier in reversed(candidates):
+            if reach(tier) == float('-inf') or (start is not None and start >= reach(tier)):
+                return tier
+        return min(candidates, key=reach)
+    
+    def query_series(self, cluster_uuid: str, metric: str, project_id: Optional[str] = None,
+                     start: Optional[int] = None, end: Optional[int] = None,
+                     resolution: int = RAW) -> Tuple[int, List[Tuple[int, float, float, float, int]]]:
+        """
+        Read one series at the coarsest sufficient resolution
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            metric: Metric name
+            project_id: Project ID, or None for a cluster-level series
+            start: Inclusive lower bound in epoch seconds
+            end: Inclusive upper bound in epoch seconds
+            resolution: Coarsest bucket size, in seconds, the caller accepts;
+                RAW (0) reads the raw samples
+        
+        Returns:
+            (resolution used, list of (bucket start, min, max, mean, count)).
+            Raw samples are returned as one-sample buckets; buckets without
+            values have None for min, max and mean.
+        """
+        tier = self.select_resolution(start, resolution)
+        if tier == RAW:
+            return RAW, [
+                (ts, value, value, value, 0 if value is None else 1)
+                for ts, value in self.get_series(cluster_uuid, metric, project_id, start, end)
+            ]
+        
+        project_id = CLUSTER_SCOPE if project_id is None else str(project_id)
+        query = ('SELECT bucket, min, max, CASE WHEN count > 0 THEN sum / count END, count '
+                 'FROM rollups WHERE cluster_uuid = ? AND project_id = ? AND metric = ? '
+                 'AND resolution = ?')
+        params = [cluster_uuid, project_id, metric, tier]
+        if start is not None:
+            # Include the bucket containing start
+            query += ' AND bucket > ?'
+            params.append(int(start) - tier)
+        if end is not None:
+            query += ' AND bucket <= ?'
+            params.append(int(end))
+        query += ' ORDER BY bucket'
+        
+        with self._lock:
+            return tier, self._conn.execute(query, params).fetchall()
+    
+    def list_series(self) -> List[Dict]:
+        """
+        List every stored series with its watermark
+        
+        Returns:
+            List of dictionaries with cluster_uuid, project_id, metric and last_ts
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT cluster_uuid, project_id, metric, last_ts FROM watermarks '
+                'ORDER BY cluster_uuid, project_id, metric'
+            ).fetchall()
+        return [
+            {
+                'cluster_uuid': cluster_uuid,
+                'project_id': project_id or None,
+                'metric': metric,
+                'last_ts': last_ts
+            }
+            for cluster_uuid, project_id, metric, last_ts in rows
+        ]
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Push export for the RunAI GPU Metrics Collector
+
+Sites that cannot scrape the --serve endpoint receive the collected series
+by push instead. PushExporter converts collected clusters into gauge points
+(the metric names of the Prometheus endpoint) and sends them in OTLP/HTTP
+JSON batches, gzip-compressed, to an OpenTelemetry collector or to
+Prometheus' OTLP receiver (/api/v1/otlp/v1/metrics).
+
+Collection never waits for the sink:
+
+- submit() only appends points to a bounded in-memory queue; a background
+  thread sends them once batch_size points are queued or flush_interval
+  seconds have passed.
+- When the queue is full (the sink is slow or down), submitted points are
+  written to a spill directory as ready-to-send batches instead.
+- Failed batches are retried with exponential backoff, then spilled.
+  Spilled batches are sent, oldest first, whenever the queue has drained.
+
+Each series remembers the newest timestamp pushed, so samples repeated by
+overlapping --hours-back windows or unchanged daemon cycles are sent once.
+"""
+
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from compact_series import CompactSeries
+from metrics_server import CLUSTER_FAMILIES, PROJECT_FAMILIES
+from metrics_store import to_epoch
+
+
+logger = logging.getLogger(__name__)
+
+# Point: (metric name, labels as (name, value) pairs, epoch seconds, value)
+Point = Tuple[str, Tuple[Tuple[str, str], ...], int, float]
+
+NODEPOOL_METRIC = 'runai_project_nodepool_gpu_utilization'
+SERVICE_NAME = 'runai-gpu-metrics-collector'
+
+# HTTP statuses worth retrying; other errors reject the batch for good
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def _to_float(value) -> Optional[float]:
+    """Convert an API value to float, or None if it is not numeric"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if value != value else value
+
+
+def _series_samples(series) -> Iterable[Tuple[int, float]]:
+    """(epoch seconds, value) pairs of a collected series, skipping missing values"""
+    if isinstance(series, CompactSeries):
+        for ts, value in zip(series.timestamps.tolist(), series.values.tolist()):
+            if value == value:
+                yield ts, value
+        return
+    for sample in series or []:
+        value = _to_float(sample.get('value'))
+        if value is None:
+            continue
+        try:
+            yield to_epoch(sample['timestamp']), value
+        except (KeyError, ValueError):
+            continue
+
+
+def _current_sample(value, timestamp) -> List[Tuple[int, float]]:
+    """The current value of a metric as a one-sample series"""
+    value = _to_float(value)
+    if value is None:
+        return []
+    try:
+        ts = to_epoch(timestamp) if timestamp is not None else int(time.time())
+    except ValueError:
+        ts = int(time.time())
+    return [(ts, value)]
+
+
+def cluster_points(cluster: Dict) -> List[Point]:
+    """
+    Convert a collected cluster entry to gauge points
+    
+    Series are used where the output profile kept them (all_values,
+    gpu_utilization_series), current values otherwise or when a series has
+    no usable samples.
+    
+    Args:
+        cluster: Cluster entry as built by GPUMetricsCollector.collect_cluster
+    
+    Returns:
+        List of points
+    """
+    points = []
+    cluster_labels = (
+        ('cluster_uuid', str(cluster.get('cluster_uuid'))),
+        ('cluster_name', str(cluster.get('cluster_name')))
+    )
+    
+    metrics = cluster.get('cluster_level_metrics', {}).get('metrics', {})
+    for name, _, metric_type in CLUSTER_FAMILIES:
+        metric = metrics.get(metric_type)
+        if not metric:
+            continue
+        samples = (list(_series_samples(metric.get('all_values')))
+                   or _current_sample(metric.get('current_value'), metric.get('timestamp')))
+        points.extend((name, cluster_labels, ts, value) for ts, value in samples)
+    
+    for project in cluster.get('project_level_metrics', []):
+        if 'project_name' not in project:
+            continue
+        labels = cluster_labels + (
+            ('project_name', str(project.get('project_name'))),
+            ('project_id', str(project.get('project_id')))
+        )
+        gpu_metrics = project.get('gpu_metrics', {})
+        for name, _, key in PROJECT_FAMILIES:
+            # Failed projects only carry quota values; utilization is unknown
+            if key == 'gpu_utilization' and 'error' in project:
+                continue
+            samples = list(_series_samples(project.get('gpu_utilization_series'))) \
+                if key == 'gpu_utilization' else []
+            samples = samples or _current_sample(gpu_metrics.get(key), project.get('timestamp'))
+            points.extend((name, labels, ts, value) for ts, value in samples)
+        
+        for nodepool, entry in (project.get('nodepool_metrics') or {}).items():
+            if 'error' in entry:
+                continue
+            nodepool_labels = labels + (('nodepool', str(nodepool)),)
+            samples = (list(_series_samples(entry.get('gpu_utilization_series')))
+                       or _current_sample(entry.get('gpu_utilization'), project.get('timestamp')))
+            points.extend((NODEPOOL_METRIC, nodepool_labels, ts, value) for ts, value in samples)
+    
+    return points
+
+
+def encode_otlp(points: List[Point]) -> bytes:
+    """
+    Encode points as an OTLP/HTTP JSON ExportMetricsServiceRequest
+    
+    Args:
+        points: Points to encode
+    
+    Returns:
+        UTF-8 JSON document
+    """
+    data_points: Dict[str, List[Dict]] = {}
+    for name, labels, ts, value in points:
+        data_points.setdefault(name, []).append({
+            'attributes': [{'key': key, 'value': {'stringValue': label}} for key, label in labels],
+            'timeUnixNano': str(ts * 1_000_000_000),
+            'asDouble': value
+        })
+    document = {'resourceMetrics': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+        'scopeMetrics': [{
+            'scope': {'name': SERVICE_NAME},
+            'metrics': [{'name': name, 'gauge': {'dataPoints': entries}}
+                        for name, entries in data_points.items()]
+        }]
+    }]}
+    return json.dumps(document, separators=(',', ':')).encode('utf-8')
+
+
+def _spilled_points(name: str) -> int:
+    """Number of points in a spilled batch, from its file name"""
+    return int(name.rsplit('-', 1)[1].split('.', 1)[0])
+
+
+class PushExporter:
+    """Sends collected series to a push endpoint from a background thread"""
+    
+    def __init__(self, url: str, headers: Optional[Dict[str, str]] = None,
+                 batch_size: int = 2000, flush_interval: float = 10.0,
+                 max_queue: int = 100000, spill_dir: Optional[str] = None,
+                 max_spill_bytes: int = 256 * 1024 * 1024, max_retries: int = 5,
+                 retry_backoff: float = 1.0, timeout: float = 30.0,
+                 session: Optional[requests.Session] = None):
+        """
+        Start the exporter
+        
+        Args:
+            url: OTLP/HTTP metrics endpoint, e.g. http://otel-collector:4318/v1/metrics
+            headers: Extra request headers (e.g. Authorization)
+            batch_size: Points per request
+            flush_interval: Longest time, in seconds, a point waits in the queue
+            max_queue: Points kept in memory; further points are spilled
+            spill_dir: Directory for batches that do not fit in memory or could
+                not be delivered; without one they are dropped
+            max_spill_bytes: Size of the spill directory above which the oldest
+                batches are deleted
+            max_retries: Attempts per batch before it is spilled
+            retry_backoff: Delay before the first retry in seconds, doubled per attempt
+            timeout: Request timeout in seconds
+            session: HTTP session to send with
+        """
+        self.url = url
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Content-Encoding': 'gzip',
+            **(headers or {})
+        }
+        self.stats = {'sent': 0, 'spilled': 0, 'replayed': 0, 'dropped': 0, 'rejected': 0, 'retries': 0}
+        self._stats_lock = threading.Lock()
+        
+        # Newest timestamp pushed per (metric, labels)
+        self._watermarks: Dict[Tuple, int] = {}
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._spill_seq = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='push-exporter', daemon=True)
+        self._thread.start()
+    
+    def submit(self, cluster: Dict) -> int:
+        """
+        Queue the new samples of a collected cluster; never waits for the sink
+        
+        Args:
+            cluster: Cluster entry as built by GPUMetricsCollector.collect_cluster
+        
+        Returns:
+            Number of points submitted
+        """
+        points = []
+        with self._cond:
+            for point in cluster_points(cluster):
+                key = (point[0], point[1])
+                if point[2] > self._watermarks.get(key, -1):
+                    self._watermarks[key] = point[2]
+                    points.append(point)
+            overflow = len(self._queue) + len(points) > self.max_queue
+            if not overflow:
+                self._queue.extend(points)
+                self._cond.notify()
+        if overflow and points:
+            # Keep collection moving; the batch is delivered from disk later
+            for start in range(0, len(points), self.batch_size):
+                self._spill(gzip.compress(encode_otlp(points[start:start + self.batch_size])),
+                            len(points[start:start + self.batch_size]))
+        return len(points)
+    
+    def submit_collection(self, collection: Dict) -> int:
+        """
+        Queue every cluster of a collection (see submit)
+        
+        Args:
+            collection: Document as returned by collect_all_metrics
+        
+        Returns:
+            Number of points submitted
+        """
+        return sum(self.submit(cluster) for cluster in collection.get('clusters', []))
+    
+    def close(self, timeout: float = 30.0):
+        """
+        Flush the queue and stop the sender thread
+        
+        Points that cannot be sent within timeout are spilled.
+        
+        Args:
+            timeout: Seconds to wait for the queue to drain
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        with self._cond:
+            remaining = list(self._queue)
+            self._queue.clear()
+        for start in range(0, len(remaining), self.batch_size):
+            batch = remaining[start:start + self.batch_size]
+            self._spill(gzip.compress(encode_otlp(batch)), len(batch))
+        logger.info(f"Push export: {self.stats['sent']} points sent, {self.stats['spilled']} spilled, "
+                    f"{self.stats['dropped']} dropped, {self.stats['rejected']} rejected")
+    
+    def _count(self, name: str, amount: int):
+        """Add to one of the export counters"""
+        with self._stats_lock:
+            self.stats[name] += amount
+    
+    def _run(self):
+        """Sender loop: flush full or expired batches, then replay spilled ones"""
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            with self._cond:
+                while (not self._closed and len(self._queue) < self.batch_size
+                       and time.monotonic() < deadline):
+                    self._cond.wait(max(deadline - time.monotonic(), 0))
+                closing = self._closed
+                count = min(len(self._queue), self.batch_size)
+                batch = [self._queue.popleft() for _ in range(count)]
+            deadline = time.monotonic() + self.flush_interval
+            
+            if batch:
+                body = gzip.compress(encode_otlp(batch))
+                if not self._deliver(body, len(batch)):
+                    self._spill(body, len(batch))
+                    if closing:
+                        # The sink is down; close() spills what is still queued
+                        return
+                    continue
+            if not closing:
+                self._replay()
+            elif not self._queue:
+                return
+    
+    def _deliver(self, body: bytes, points: int, attempts: Optional[int] = None) -> bool:
+        """
+        Send a compressed batch, retrying transient failures
+        
+        Returns:
+            True if the batch was accepted or rejected for good, False if it
+            should be kept for later
+        """
+        attempts = self.max_retries if attempts is None else attempts
+        for attempt in range(attempts):
+            if attempt:
+                self._count('retries', 1)
+                time.sleep(min(self.retry_backoff * 2 ** (attempt - 1), 60))
+            try:
+                response = self.session.post(self.url, data=body, headers=self.headers,
+                                             timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                logger.debug(f"Push to {self.url} failed: {e}")
+                continue
+            if response.status_code < 300:
+                self._count('sent', points)
+                return True
+            if response.status_code not in RETRYABLE_STATUSES:
+                logger.warning(f"Push endpoint rejected {points} points: "
+                               f"HTTP {response.status_code} {response.text[:200]}")
+                self._count('rejected', points)
+                return True
+            logger.debug(f"Push to {self.url} returned HTTP {response.status_code}")
+        logger.warning(f"Push to {self.url} failed after {attempts} attempts")
+        return False
+    
+    def _spill(self, body: bytes, points: int):
+        """Write a compressed batch to the spill directory, or drop it without one"""
+        if not self.spill_dir:
+            self._count('dropped', points)
+            return
+        with self._cond:
+            self._spill_seq += 1
+            name = f"batch-{time.time_ns():020d}-{self._spill_seq:06d}-{points}.json.gz"
+        path = os.path.join(self.spill_dir, name)
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(body)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            logger.warning(f"Failed to spill {points} points: {e}")
+            self._count('dropped', points)
+            return
+        self._count('spilled', points)
+        self._trim_spill()
+    
+    def _spilled(self) -> List[str]:
+        """Spilled batch files, oldest first"""
+        try:
+            names = os.listdir(self.spill_dir)
+        except OSError:
+            return []
+        return sorted(name for name in names if name.startswith('batch-') and name.endswith('.json.gz'))
+    
+    def _trim_spill(self):
+        """Delete the oldest spilled batches above max_spill_bytes"""
+        files = [os.path.join(self.spill_dir, name) for name in self._spilled()]
+        sizes = []
+        for path in files:
+            try:
+                sizes.append(os.path.getsize(path))
+            except OSError:
+                sizes.append(0)
+        total = sum(sizes)
+        for path, size in zip(files, sizes):
+            if total <= self.max_spill_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self._count('dropped', _spilled_points(path))
+    
+    def _replay(self):
+        """Send spilled batches, oldest first, until one fails or points are queued"""
+        if not self.spill_dir:
+            return
+        for name in self._spilled():
+            with self._cond:
+                queued = len(self._queue)
+            if queued >= self.batch_size:
+                return
+            path = os.path.join(self.spill_dir, name)
+            try:
+                with open(path, 'rb') as f:
+                    body = f.read()
+            except OSError:
+                continue
+            points = _spilled_points(name)
+            # One attempt: the batch is already on disk, the next flush tries again
+            if not self._deliver(body, points, attempts=1):
+                return
+            self._count('replayed', points)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
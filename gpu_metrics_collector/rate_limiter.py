@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Client-side rate limiting for the RunAI GPU Metrics Collector
+
+AdaptiveRateLimiter combines three controls for requests to one base URL:
+
+- a token bucket capping the request rate (requests per second)
+- an AIMD concurrency limit: it grows by about one request per round trip
+  while responses are fast, and is halved on HTTP 429 or when latency exceeds
+  the target
+- a pause honouring Retry-After (or an exponential backoff on 429 without
+  it) during which no request is started
+
+Clients talking to the same base URL share one limiter via shared_rate_limiter().
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Backoff used for 429 responses without a Retry-After header
+DEFAULT_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header
+    
+    Args:
+        value: Header value, either delay-seconds or an HTTP-date
+    
+    Returns:
+        Seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class AdaptiveRateLimiter:
+    """Token bucket plus AIMD concurrency limit for one API endpoint"""
+    
+    def __init__(self, rate: float, burst: Optional[float] = None,
+                 max_concurrency: int = 10, min_concurrency: int = 1,
+                 target_latency: float = 2.0, decrease_factor: float = 0.5):
+        """
+        Initialize the limiter
+        
+        Args:
+            rate: Maximum requests started per second
+            burst: Token bucket size (default: one second worth of requests)
+            max_concurrency: Upper bound of the adaptive concurrency limit
+            min_concurrency: Lower bound of the adaptive concurrency limit
+            target_latency: Responses slower than this (seconds) count as congestion
+            decrease_factor: Multiplier applied to the limit on congestion
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        
+        self.concurrency_limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.throttled = 0
+        
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._consecutive_throttles = 0
+        self._condition = threading.Condition()
+    
+    def _refill(self, now: float):
+        """Add the tokens earned since the last refill"""
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+    
+    def acquire(self):
+        """Block until a request may be started"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    self._condition.wait(self._paused_until - now)
+                    continue
+                if self.in_flight >= int(self.concurrency_limit):
+                    self._condition.wait()
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.in_flight += 1
+                    return
+                self._condition.wait((1 - self._tokens) / self.rate)
+    
+    def release(self, status_code: Optional[int], latency: float,
+                retry_after: Optional[str] = None):
+        """
+        Report the outcome of a request started with acquire()
+        
+        Args:
+            status_code: HTTP status, or None if the request failed without one
+            latency: Seconds the request took
+            retry_after: Retry-After header of the response, if any
+        """
+        with self._condition:
+            now = time.monotonic()
+            self.in_flight -= 1
+            
+            if status_code == 429:
+                self.throttled += 1
+                self._consecutive_throttles += 1
+                delay = parse_retry_after(retry_after)
+                if delay is None:
+                    delay = min(MAX_BACKOFF, DEFAULT_BACKOFF * 2 ** (self._consecutive_throttles - 1))
+                self._paused_until = max(self._paused_until, now + delay)
+                logger.debug(f"Throttled by the API, pausing requests for {delay:.1f}s")
+                self._decrease(now)
+            elif status_code is not None and latency > self.target_latency:
+                self._decrease(now)
+            elif status_code is not None and status_code < 500:
+                self._consecutive_throttles = 0
+                # Additive increase: about +1 per limit's worth of successful requests
+                self.concurrency_limit = min(
+                    self.max_concurrency,
+                    self.concurrency_limit + 1.0 / self.concurrency_limit
+                )
+            
+            self._condition.notify_all()
+    
+    def _decrease(self, now: float):
+        """Multiplicative decrease, at most once per target latency window"""
+        if now - self._last_decrease < self.target_latency:
+            return
+        self._last_decrease = now
+        self.concurrency_limit = max(
+            self.min_concurrency,
+            self.concurrency_limit * self.decrease_factor
+        )
+        logger.debug(f"Reduced API concurrency limit to {int(self.concurrency_limit)}")
+
+
+_shared_limiters: Dict[str, AdaptiveRateLimiter] = {}
+_shared_limiters_lock = threading.Lock()
+
+
+def shared_rate_limiter(base_url: str, **kwargs) -> AdaptiveRateLimiter:
+    """
+    Get the limiter shared by all clients of a base URL
+    
+    Args:
+        base_url: API base URL
+        **kwargs: AdaptiveRateLimiter arguments, used when the limiter is created
+    
+    Returns:
+        The limiter for base_url
+    """
+    key = base_url.rstrip('/')
+    with _shared_limiters_lock:
+        if key not in _shared_limiters:
+            _shared_limiters[key] = AdaptiveRateLimiter(**kwargs)
+        return _shared_limiters[key]
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+On-disk response cache for the RunAI GPU Metrics Collector
+
+Inventory endpoints (clusters, projects, quotas) change slowly, so their
+responses are kept in a small SQLite file between runs. Each entry remembers
+the ETag and Last-Modified validators sent by the server so that an expired
+entry can be revalidated with a conditional request instead of downloaded
+again. The cache holds at most max_entries responses and evicts the least
+recently used ones first.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key           TEXT PRIMARY KEY,
+    body          TEXT NOT NULL,
+    etag          TEXT,
+    last_modified TEXT,
+    stored_at     REAL NOT NULL,
+    last_access   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+"""
+
+
+class ResponseCache:
+    """Size-bounded, persistent cache of raw API response bodies"""
+    
+    def __init__(self, path: str, max_entries: int = 1000):
+        """
+        Open (and create if needed) the cache
+        
+        Args:
+            path: SQLite database file, or ':memory:'
+            max_entries: Maximum number of responses kept
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+    
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Look up a cached response and mark it as recently used
+        
+        Args:
+            key: Cache key
+        
+        Returns:
+            Dictionary with body, etag, last_modified and age (seconds), or None
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT body, etag, last_modified, stored_at FROM responses WHERE key = ?',
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                'UPDATE responses SET last_access = ? WHERE key = ?', (now, key)
+            )
+        
+        body, etag, last_modified, stored_at = row
+        return {
+            'body': body,
+            'etag': etag,
+            'last_modified': last_modified,
+            'age': now - stored_at
+        }
+    
+    def put(self, key: str, body: str, etag: Optional[str] = None,
+            last_modified: Optional[str] = None):
+        """
+        Store a response, evicting the least recently used entries if full
+        
+        Args:
+            key: Cache key
+            body: Raw response body
+            etag: ETag header of the response, if any
+            last_modified: Last-Modified header of the response, if any
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (key, body, etag, last_modified, now, now)
+            )
+            self._conn.execute(
+                'DELETE FROM responses WHERE key IN ('
+                '  SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?'
+                ')',
+                (self.max_entries,)
+            )
+    
+    def refresh(self, key: str):
+        """
+        Restart the TTL of an entry after the server confirmed it is unchanged
+        
+        Args:
+            key: Cache key
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE responses SET stored_at = ? WHERE key = ?', (time.time(), key)
+            )
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+JSON decoding of RunAI API responses
+
+loads() decodes with orjson when it is installed and with the standard json
+module otherwise.
+
+decode_fields() builds only selected fields of a response, given as dotted
+paths in which 'item' stands for every element of a list (the path syntax of
+ijson). With orjson installed the body is decoded in one call and pruned,
+which is the fastest path. Otherwise, with ijson installed, the response
+stream is parsed incrementally: the skipped parts of a multi-megabyte metrics
+body are never turned into Python objects. That keeps peak memory at a
+fraction of a full decode, at the cost of speed. Without either, the body
+is decoded with json and pruned. All paths return the same structure.
+"""
+
+import json
+from typing import Any, Callable, Dict, Iterable, Sequence, Union
+
+try:
+    import orjson
+except ImportError:  # Optional: faster decoding of every response
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # Optional: incremental parsing of metrics responses
+    ijson = None
+
+
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+# Whether decode_fields parses the response stream incrementally
+INCREMENTAL = orjson is None and ijson is not None
+
+# Fields of the metrics responses read when building cluster and project records
+CLUSTER_METRICS_FIELDS = ('measurements.item.type', 'measurements.item.values')
+PROJECT_METRICS_FIELDS = ('current.resources', 'timeRange.data')
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    Decode a JSON document with the fastest available backend
+    
+    Args:
+        data: JSON text, as bytes or str
+    
+    Returns:
+        The decoded value
+    
+    Raises:
+        ValueError: If data is not valid JSON
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _field_tree(fields: Sequence[str]) -> Dict:
+    """Turn dotted paths into a nested dict; True marks a field kept whole"""
+    tree: Dict = {}
+    for field in fields:
+        node = tree
+        parts = field.split('.')
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+            if node is True:
+                break
+        else:
+            node[parts[-1]] = True
+    return tree
+
+
+def _prune(value: Any, tree: Union[Dict, bool]) -> Any:
+    """Keep the parts of a decoded value selected by a field tree"""
+    if tree is True:
+        return value
+    if isinstance(value, dict):
+        return {key: _prune(item, tree[key]) for key, item in value.items() if key in tree}
+    if isinstance(value, list):
+        if 'item' not in tree:
+            return []
+        return [_prune(item, tree['item']) for item in value]
+    return value
+
+
+def prune(data: Any, fields: Sequence[str]) -> Any:
+    """
+    Keep only selected fields of a decoded document
+    
+    Args:
+        data: Decoded JSON document
+        fields: Dotted paths of the fields to keep
+    
+    Returns:
+        Copy of data with the containers leading to the fields and the fields
+        themselves
+    """
+    return _prune(data, _field_tree(fields))
+
+
+def _path_filter(fields: Sequence[str]) -> Callable[[str], bool]:
+    """
+    Build a predicate telling whether an ijson prefix is part of the output
+    
+    A prefix is kept if it leads to one of the fields or lies inside one.
+    """
+    kept = tuple(fields)
+    ancestors = {''}
+    for field in kept:
+        parts = field.split('.')
+        ancestors.update('.'.join(parts[:index]) for index in range(1, len(parts)))
+    memo: Dict[str, bool] = {}
+    
+    def relevant(path: str) -> bool:
+        result = memo.get(path)
+        if result is None:
+            result = path in ancestors or any(
+                path == field or path.startswith(field + '.') for field in kept
+            )
+            memo[path] = result
+        return result
+    
+    return relevant
+
+
+def _build(events: Iterable, relevant: Callable[[str], bool]) -> Any:
+    """Feed the relevant ijson events to an object builder"""
+    builder = ijson.ObjectBuilder()
+    for prefix, event, value in events:
+        if event == 'map_key':
+            path = f"{prefix}.{value}" if prefix else value
+        else:
+            path = prefix
+        if relevant(path):
+            builder.event(event, value)
+    return builder.value
+
+
+def decode_fields(stream: Any, fields: Sequence[str]) -> Any:
+    """
+    Decode selected fields of a JSON document read from a binary stream
+    
+    Args:
+        stream: File-like object whose read() returns bytes
+        fields: Dotted paths of the fields to keep
+    
+    Returns:
+        The pruned document (see prune)
+    """
+    if not INCREMENTAL:
+        return prune(loads(stream.read()), fields)
+    return _build(ijson.parse(stream, use_float=True), _path_filter(fields))
+
+
+async def decode_fields_async(stream: Any, fields: Sequence[str]) -> Any:
+    """
+    Decode selected fields of a JSON document read from an async stream
+    
+    Args:
+        stream: Object with a coroutine read(), such as aiohttp's response.content
+        fields: Dotted paths of the fields to keep
+    
+    Returns:
+        The pruned document (see prune)
+    """
+    if not INCREMENTAL:
+        return prune(loads(await stream.read()), fields)
+    
+    relevant = _path_filter(fields)
+    builder = ijson.ObjectBuilder()
+    async for prefix, event, value in ijson.parse_async(stream, use_float=True):
+        path = (f"{prefix}.{value}" if prefix else value) if event == 'map_key' else prefix
+        if relevant(path):
+            builder.event(event, value)
+    return builder.value
@@ -12,16 +12,48 @@ Author: Assistant
 """
 
 import argparse
+import asyncio
+import hashlib
 import json
 import logging
+import math
 import os
+import queue
+import re
+import sqlite3
 import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from itertools import islice
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Any, Sequence, TextIO, Tuple
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from compact_series import CompactSeries, json_default
+from dcgm_ingest import DEFAULT_FIELDS as DEFAULT_DCGM_FIELDS, DEFAULT_NAMESPACE_PREFIX, DCGMScraper
+from gpu_accounting import DEFAULT_MAX_GAP, GPUHourLedger
+from metrics_server import CollectorDaemon, QueryService, start_http_server
+from metrics_stats import DEFAULT_STATISTICS, annotate_statistics, validate_statistics
+from metrics_store import MetricsStore, from_epoch, parse_tier, to_epoch
+from push_exporter import PushExporter
+from rate_limiter import AdaptiveRateLimiter, shared_rate_limiter
+from response_cache import ResponseCache
+from response_decoder import (
+    CLUSTER_METRICS_FIELDS, PROJECT_METRICS_FIELDS, decode_fields, decode_fields_async, loads
+)
+from sharding import cluster_shard_key, merge_shard_documents, project_shard_key, shard_of
+from utilization_resolver import UtilizationResolver
+
+try:
+    import aiohttp
+except ImportError:  # Optional: only needed for the async collector (--async)
+    aiohttp = None
+
 
 # Configure logging
 logging.basicConfig(
@@ -31,10 +63,34 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+class DeadlineExceeded(Exception):
+    """Raised instead of sending a request once the collection deadline has passed"""
+
+
 class RunAIAPIClient:
     """Client for interacting with RunAI API"""
     
-    def __init__(self, base_url: str, token: str, verify_ssl: bool = True):
+    # Seconds a cached inventory response is used without asking the server.
+    # Expired entries are revalidated with If-None-Match / If-Modified-Since.
+    DEFAULT_CACHE_TTLS = {
+        'clusters': 3600,
+        'projects': 600,
+        'nodepools': 600,
+        'quotas': 60
+    }
+    
+    # Retries of connection errors, read timeouts and retryable statuses
+    MAX_RETRIES = 3
+    
+    # How often a request throttled with HTTP 429 is retried when a rate limiter is used
+    MAX_THROTTLE_RETRIES = 5
+    
+    def __init__(self, base_url: str, token: str, verify_ssl: bool = True,
+                 pool_maxsize: int = 10, cache: Optional[ResponseCache] = None,
+                 cache_ttls: Optional[Dict[str, float]] = None,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                 connect_timeout: float = 10, read_timeout: float = 60,
+                 prune_metrics: bool = False):
         """
         Initialize the RunAI API client
         
@@ -42,19 +98,47 @@ class RunAIAPIClient:
             base_url: RunAI base URL (e.g., 'https://app.run.ai')
             token: Bearer token for authentication
             verify_ssl: Whether to verify SSL certificates
+            pool_maxsize: Number of keep-alive connections kept per host.
+                Should be at least the number of concurrent workers.
+            cache: Optional on-disk cache for cluster, project and quota listings
+            cache_ttls: Per-endpoint TTL overrides ('clusters', 'projects',
+                'nodepools', 'quotas')
+            rate_limiter: Optional limiter that paces requests and handles HTTP 429
+            connect_timeout: Seconds to wait for a connection to be established
+            read_timeout: Seconds to wait for the server between bytes of a response
+            prune_metrics: Decode only the fields of metrics responses that
+                the collector reads, parsing the response stream incrementally
+                when ijson is installed (see response_decoder)
         """
         self.base_url = base_url.rstrip('/')
         self.token = token
         self.verify_ssl = verify_ssl
+        self.prune_metrics = prune_metrics
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        # time.monotonic() value after which no request is sent; set per run
+        # by the collector and also caps the timeouts of in-flight requests
+        self.deadline: Optional[float] = None
+        self.cache_ttls = dict(self.DEFAULT_CACHE_TTLS, **(cache_ttls or {}))
+        # Keeps entries of different users apart in a shared cache file
+        self._cache_namespace = hashlib.sha256(token.encode()).hexdigest()[:16]
         
         # Setup session with retry strategy
         self.session = requests.Session()
+        # With a rate limiter, 429 responses are retried by _send so the
+        # limiter sees them and slows down every worker, not just one
+        status_forcelist = [500, 502, 503, 504] if rate_limiter else [429, 500, 502, 503, 504]
         retry_strategy = Retry(
-            total=3,
-            status_forcelist=[429, 500, 502, 503, 504],
+            total=self.MAX_RETRIES,
+            status_forcelist=status_forcelist,
             allowed_methods=["HEAD", "GET", "OPTIONS"]
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = HTTPAdapter(
+            max_retries=retry_strategy,
+            pool_maxsize=pool_maxsize
+        )
         self.session.mount("http://", adapter)
         self.session.mount("https://", adapter)
         
@@ -65,7 +149,9 @@ class RunAIAPIClient:
             'Accept': 'application/json'
         })
     
-    def _make_request(self, method: str, endpoint: str, params: Dict = None) -> Dict:
+    def _make_request(self, method: str, endpoint: str, params: Dict = None,
+                      cache_name: Optional[str] = None,
+                      fields: Optional[Sequence[str]] = None) -> Dict:
         """
         Make HTTP request to RunAI API
         
@@ -73,6 +159,9 @@ class RunAIAPIClient:
             method: HTTP method (GET, POST, etc.)
             endpoint: API endpoint
             params: Query parameters
+            cache_name: Key into cache_ttls if the response may be cached
+            fields: Dotted paths of the only fields to decode, if
+                prune_metrics is enabled; not combined with caching
             
         Returns:
             Response JSON data
@@ -82,16 +171,44 @@ class RunAIAPIClient:
         """
         url = f"{self.base_url}{endpoint}"
         
+        cache_key = None
+        cached = None
+        headers = {}
+        if self.cache is not None and cache_name is not None:
+            cache_key = self._cache_key(method, url, params)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                if cached['age'] < self.cache_ttls.get(cache_name, 0):
+                    logger.debug(f"Cache hit for: {url}")
+                    return loads(cached['body'])
+                if cached['etag']:
+                    headers['If-None-Match'] = cached['etag']
+                if cached['last_modified']:
+                    headers['If-Modified-Since'] = cached['last_modified']
+        
+        stream = self.prune_metrics and fields is not None and cache_key is None
         try:
             logger.debug(f"Making {method} request to: {url}")
-            response = self.session.request(
-                method=method,
-                url=url,
-                params=params,
-                verify=self.verify_ssl
-            )
+            response = self._send(method, url, params, headers, stream=stream)
+            if response.status_code == 304 and cached is not None:
+                logger.debug(f"Cached response still valid for: {url}")
+                self.cache.refresh(cache_key)
+                return loads(cached['body'])
             response.raise_for_status()
-            return response.json()
+            if stream:
+                # Decode the body as it arrives, keeping only the fields used
+                response.raw.decode_content = True
+                with response:
+                    return decode_fields(response.raw, fields)
+            data = loads(response.content)
+            if cache_key is not None:
+                self.cache.put(
+                    cache_key,
+                    response.text,
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified')
+                )
+            return data
         except requests.RequestException as e:
             logger.error(f"API request failed: {e}")
             if hasattr(e, 'response') and e.response is not None:
@@ -99,6 +216,98 @@ class RunAIAPIClient:
                 logger.error(f"Response body: {e.response.text}")
             raise
     
+    def _send(self, method: str, url: str, params: Optional[Dict],
+              headers: Dict, stream: bool = False) -> requests.Response:
+        """
+        Send a request, paced by the rate limiter if one is configured
+        
+        Throttled requests (HTTP 429) are retried after the limiter's pause,
+        which honours the Retry-After header of the response.
+        
+        Args:
+            method: HTTP method
+            url: Full request URL
+            params: Query parameters
+            headers: Extra request headers
+            stream: Leave the body unread for the caller to consume
+            
+        Returns:
+            The last response received
+            
+        Raises:
+            DeadlineExceeded: If the collection deadline has passed
+        """
+        if self.rate_limiter is None:
+            return self.session.request(
+                method=method,
+                url=url,
+                params=params,
+                headers=headers,
+                verify=self.verify_ssl,
+                timeout=self._request_timeout(),
+                stream=stream
+            )
+        
+        for attempt in range(self.MAX_THROTTLE_RETRIES + 1):
+            self.rate_limiter.acquire()
+            started = time.monotonic()
+            response = None
+            try:
+                response = self.session.request(
+                    method=method,
+                    url=url,
+                    params=params,
+                    headers=headers,
+                    verify=self.verify_ssl,
+                    timeout=self._request_timeout(),
+                    stream=stream
+                )
+            finally:
+                self.rate_limiter.release(
+                    response.status_code if response is not None else None,
+                    time.monotonic() - started,
+                    response.headers.get('Retry-After') if response is not None else None
+                )
+            if response.status_code != 429:
+                break
+            response.close()
+            logger.warning(f"Request throttled (attempt {attempt + 1}): {url}")
+        return response
+    
+    def _request_timeout(self) -> Tuple[float, float]:
+        """
+        Get the (connect, read) timeout of the next request
+        
+        Returns:
+            The configured timeouts, shortened so that the request and all of
+            its retries end before the deadline
+            
+        Raises:
+            DeadlineExceeded: If the collection deadline has passed
+        """
+        if self.deadline is None:
+            return (self.connect_timeout, self.read_timeout)
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("Collection deadline exceeded")
+        per_attempt = remaining / (self.MAX_RETRIES + 1)
+        return (min(self.connect_timeout, per_attempt), min(self.read_timeout, per_attempt))
+    
+    def _cache_key(self, method: str, url: str, params: Optional[Dict]) -> str:
+        """
+        Build the cache key of a request
+        
+        Args:
+            method: HTTP method
+            url: Full request URL
+            params: Query parameters
+            
+        Returns:
+            Key unique to the token, method, URL and parameters
+        """
+        query = json.dumps(sorted((params or {}).items()), default=str)
+        return f"{self._cache_namespace} {method} {url} {query}"
+    
     def get_clusters(self) -> List[Dict]:
         """
         Get list of available clusters
@@ -106,7 +315,7 @@ class RunAIAPIClient:
         Returns:
             List of cluster information
         """
-        return self._make_request('GET', '/api/v1/clusters')
+        return self._make_request('GET', '/api/v1/clusters', cache_name='clusters')
     
     def get_cluster_metrics(self, cluster_uuid: str, metric_types: List[str], 
                           start_time: datetime, end_time: datetime, 
@@ -134,7 +343,8 @@ class RunAIAPIClient:
         return self._make_request(
             'GET', 
             f'/api/v1/clusters/{cluster_uuid}/metrics',
-            params=params
+            params=params,
+            fields=CLUSTER_METRICS_FIELDS
         )
     
     def get_projects(self, cluster_uuid: str) -> List[Dict]:
@@ -147,7 +357,11 @@ class RunAIAPIClient:
         Returns:
             List of project information
         """
-        return self._make_request('GET', f'/v1/k8s/clusters/{cluster_uuid}/projects')
+        return self._make_request(
+            'GET',
+            f'/v1/k8s/clusters/{cluster_uuid}/projects',
+            cache_name='projects'
+        )
     
     def get_projects_quotas(self, cluster_uuid: str) -> List[Dict]:
         """
@@ -159,7 +373,27 @@ class RunAIAPIClient:
         Returns:
             List of project quota information
         """
-        return self._make_request('GET', f'/v1/k8s/clusters/{cluster_uuid}/projects/quotas')
+        return self._make_request(
+            'GET',
+            f'/v1/k8s/clusters/{cluster_uuid}/projects/quotas',
+            cache_name='quotas'
+        )
+    
+    def get_nodepools(self, cluster_uuid: str) -> List[Dict]:
+        """
+        Get the nodepools of a cluster
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            
+        Returns:
+            List of nodepool information
+        """
+        return self._make_request(
+            'GET',
+            f'/v1/k8s/clusters/{cluster_uuid}/nodepools',
+            cache_name='nodepools'
+        )
     
     def get_project_metrics(self, cluster_uuid: str, project_id: str,
                            start_time: datetime, end_time: datetime,
@@ -191,298 +425,2542 @@ class RunAIAPIClient:
         return self._make_request(
             'GET',
             f'/v1/k8s/clusters/{cluster_uuid}/projects/{project_id}/metrics',
-            params=params
+            params=params,
+            fields=PROJECT_METRICS_FIELDS
         )
 
 
-class GPUMetricsCollector:
-    """Main class for collecting GPU metrics from RunAI"""
+class AsyncRunAIAPIClient:
+    """asyncio client for the RunAI API with the same methods as RunAIAPIClient"""
     
-    def __init__(self, client: RunAIAPIClient):
-        self.client = client
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
     
-    def collect_cluster_gpu_metrics(self, cluster_uuid: str, 
-                                  start_time: datetime, end_time: datetime) -> Dict:
+    def __init__(self, base_url: str, token: str, verify_ssl: bool = True,
+                 pool_maxsize: int = 100, max_retries: int = 3,
+                 backoff_factor: float = 0.5, keepalive_timeout: float = 30.0,
+                 connect_timeout: float = 10, read_timeout: float = 60,
+                 prune_metrics: bool = False, cache: Optional[ResponseCache] = None,
+                 cache_ttls: Optional[Dict[str, float]] = None):
         """
-        Collect cluster-level GPU metrics
+        Initialize the async RunAI API client
         
         Args:
-            cluster_uuid: Cluster UUID
-            start_time: Start time for metrics collection
-            end_time: End time for metrics collection
+            base_url: RunAI base URL (e.g., 'https://app.run.ai')
+            token: Bearer token for authentication
+            verify_ssl: Whether to verify SSL certificates
+            pool_maxsize: Maximum number of pooled keep-alive connections
+            max_retries: Retries for connection errors and retryable statuses
+            backoff_factor: Base delay in seconds for exponential backoff
+            keepalive_timeout: Seconds an idle pooled connection is kept open
+            connect_timeout: Seconds to wait for a connection to be established
+            read_timeout: Seconds to wait for the server between bytes of a response
+            prune_metrics: Decode only the fields of metrics responses that
+                the collector reads (see RunAIAPIClient)
+            cache: Optional on-disk cache for cluster, project and quota
+                listings, shared with RunAIAPIClient
+            cache_ttls: Per-endpoint TTL overrides (see RunAIAPIClient)
             
-        Returns:
-            Dictionary containing cluster GPU metrics
+        Raises:
+            ImportError: If aiohttp is not installed
         """
-        logger.info(f"Collecting cluster GPU metrics for {cluster_uuid}")
-        
-        # Define the metric types we need for cluster level
-        cluster_metric_types = [
-            'TOTAL_GPU',           # Total GPU limit
-            'ALLOCATED_GPU',       # Total GPU requested
-            'GPU_UTILIZATION'      # Total GPU utilisation
-        ]
+        if aiohttp is None:
+            raise ImportError("The async client requires aiohttp (pip install aiohttp)")
         
-        try:
-            metrics_data = self.client.get_cluster_metrics(
-                cluster_uuid=cluster_uuid,
-                metric_types=cluster_metric_types,
-                start_time=start_time,
-                end_time=end_time
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.verify_ssl = verify_ssl
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.prune_metrics = prune_metrics
+        self.cache = cache
+        self.cache_ttls = dict(RunAIAPIClient.DEFAULT_CACHE_TTLS, **(cache_ttls or {}))
+        # Same namespace as RunAIAPIClient, so sync and async runs share entries
+        self._cache_namespace = hashlib.sha256(token.encode()).hexdigest()[:16]
+        # time.monotonic() value after which no request is sent (see RunAIAPIClient)
+        self.deadline: Optional[float] = None
+        self.headers = {
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json',
+            'Accept': 'application/json'
+        }
+        # Created lazily so that it is bound to the running event loop
+        self._session = None
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    def _get_session(self):
+        """Return the shared ClientSession, creating it on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_maxsize,
+                keepalive_timeout=self.keepalive_timeout,
+                ssl=None if self.verify_ssl else False
             )
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=connector
+            )
+        return self._session
+    
+    async def close(self):
+        """Close the session and its pooled connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+    
+    def _request_timeout(self):
+        """
+        Get the timeout of the next request
+        
+        Returns:
+            aiohttp.ClientTimeout limited to the time left before the deadline
             
-            # Process the metrics data
-            processed_metrics = {
-                'cluster_uuid': cluster_uuid,
-                'timestamp': datetime.now().isoformat(),
-                'time_range': {
-                    'start': start_time.isoformat(),
-                    'end': end_time.isoformat()
-                },
-                'metrics': {}
-            }
-            
-            for measurement in metrics_data.get('measurements', []):
-                metric_type = measurement.get('type')
-                values = measurement.get('values', [])
-                
-                if values:
-                    # Get the latest value
-                    latest_value = values[-1] if values else {}
-                    processed_metrics['metrics'][metric_type] = {
-                        'current_value': latest_value.get('value', 0),
-                        'timestamp': latest_value.get('timestamp'),
-                        'all_values': values
-                    }
-            
-            return processed_metrics
-            
-        except Exception as e:
-            logger.error(f"Failed to collect cluster metrics: {e}")
-            raise
+        Raises:
+            DeadlineExceeded: If the collection deadline has passed
+        """
+        total = None
+        if self.deadline is not None:
+            total = self.deadline - time.monotonic()
+            if total <= 0:
+                raise DeadlineExceeded("Collection deadline exceeded")
+        return aiohttp.ClientTimeout(
+            total=total,
+            sock_connect=self.connect_timeout,
+            sock_read=self.read_timeout
+        )
     
-    def collect_project_gpu_metrics(self, cluster_uuid: str,
-                                   start_time: datetime, end_time: datetime) -> List[Dict]:
+    def _cache_key(self, method: str, url: str, params: Optional[List[tuple]]) -> str:
         """
-        Collect project-level GPU metrics
+        Build the cache key of a request
         
         Args:
-            cluster_uuid: Cluster UUID
-            start_time: Start time for metrics collection
-            end_time: End time for metrics collection
+            method: HTTP method
+            url: Full request URL
+            params: Query parameters as (name, value) pairs
             
         Returns:
-            List of dictionaries containing project GPU metrics
+            Key unique to the token, method, URL and parameters, equal to the
+            key RunAIAPIClient uses for the same request
         """
-        logger.info(f"Collecting project GPU metrics for cluster {cluster_uuid}")
+        query = json.dumps(sorted(params or []), default=str)
+        return f"{self._cache_namespace} {method} {url} {query}"
+    
+    async def _make_request(self, method: str, endpoint: str,
+                            params: Optional[List[tuple]] = None,
+                            cache_name: Optional[str] = None,
+                            fields: Optional[Sequence[str]] = None) -> Any:
+        """
+        Make HTTP request to RunAI API
         
-        try:
-            # Get list of projects
-            projects = self.client.get_projects(cluster_uuid)
-            logger.info(f"Found {len(projects)} projects")
-            
-            # Get project quotas (contains GPU limits and allocations)
-            quotas = self.client.get_projects_quotas(cluster_uuid)
+        Args:
+            method: HTTP method (GET, POST, etc.)
+            endpoint: API endpoint
+            params: Query parameters as (name, value) pairs
+            cache_name: Key into cache_ttls if the response may be cached
+            fields: Dotted paths of the only fields to decode, if prune_metrics is enabled
             
-            # Create quota lookup by project name
-            quota_lookup = {quota['name']: quota for quota in quotas}
+        Returns:
+            Response JSON data
             
-            project_metrics = []
+        Raises:
+            aiohttp.ClientError: If API request fails
+            DeadlineExceeded: If the collection deadline has passed
+        """
+        url = f"{self.base_url}{endpoint}"
+        
+        cache_key = None
+        cached = None
+        headers = {}
+        if self.cache is not None and cache_name is not None:
+            cache_key = self._cache_key(method, url, params)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                if cached['age'] < self.cache_ttls.get(cache_name, 0):
+                    logger.debug(f"Cache hit for: {url}")
+                    return loads(cached['body'])
+                if cached['etag']:
+                    headers['If-None-Match'] = cached['etag']
+                if cached['last_modified']:
+                    headers['If-Modified-Since'] = cached['last_modified']
+        
+        session = self._get_session()
+        
+        for attempt in range(self.max_retries + 1):
+            try:
+                logger.debug(f"Making {method} request to: {url}")
+                async with session.request(method, url, params=params, headers=headers,
+                                           timeout=self._request_timeout()) as response:
+                    if response.status == 304 and cached is not None:
+                        logger.debug(f"Cached response still valid for: {url}")
+                        self.cache.refresh(cache_key)
+                        return loads(cached['body'])
+                    if response.status not in self.RETRY_STATUSES or attempt == self.max_retries:
+                        if response.status >= 400:
+                            logger.error(f"Response status: {response.status}")
+                            logger.error(f"Response body: {await response.text()}")
+                        response.raise_for_status()
+                        if self.prune_metrics and fields is not None:
+                            return await decode_fields_async(response.content, fields)
+                        body = await response.read()
+                        data = loads(body)
+                        if cache_key is not None:
+                            self.cache.put(
+                                cache_key,
+                                body.decode('utf-8'),
+                                etag=response.headers.get('ETag'),
+                                last_modified=response.headers.get('Last-Modified')
+                            )
+                        return data
+                    logger.debug(f"Retrying {url} after status {response.status}")
+            except aiohttp.ClientResponseError as e:
+                logger.error(f"API request failed: {e}")
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries:
+                    logger.error(f"API request failed: {e}")
+                    raise
+                logger.debug(f"Retrying {url} after error: {e}")
             
-            for project in projects:
-                project_name = project.get('name')
-                project_id = project.get('id') or project.get('uuid') or project_name
-                
-                logger.info(f"Processing project: {project_name} (ID: {project_id})")
-                
-                try:
-                    # Get project metrics (includes utilization)
-                    metrics_data = self.client.get_project_metrics(
-                        cluster_uuid=cluster_uuid,
-                        project_id=str(project_id),
-                        start_time=start_time,
-                        end_time=end_time
-                    )
-                    
-                    # Get quota information
-                    quota_info = quota_lookup.get(project_name, {})
-                    
-                    project_metric = {
-                        'project_name': project_name,
-                        'project_id': project_id,
-                        'cluster_uuid': cluster_uuid,
-                        'timestamp': datetime.now().isoformat(),
-                        'time_range': {
-                            'start': start_time.isoformat(),
-                            'end': end_time.isoformat()
-                        },
-                        'gpu_metrics': {
-                            'gpu_limit': quota_info.get('deservedGpus', 0),  # GPU limit (quota)
-                            'gpu_requested': quota_info.get('allocatedGpus', 0),  # GPU requested
-                            'gpu_utilization': self._extract_gpu_utilization(metrics_data)
-                        },
-                        'raw_metrics': metrics_data,
-                        'raw_quota': quota_info
-                    }
-                    
-                    project_metrics.append(project_metric)
-                    
-                except Exception as e:
-                    logger.warning(f"Failed to get metrics for project {project_name}: {e}")
-                    # Add project with empty metrics
-                    project_metrics.append({
-                        'project_name': project_name,
-                        'project_id': project_id,
-                        'cluster_uuid': cluster_uuid,
-                        'timestamp': datetime.now().isoformat(),
-                        'error': str(e),
-                        'gpu_metrics': {
-                            'gpu_limit': quota_lookup.get(project_name, {}).get('deservedGpus', 0),
-                            'gpu_requested': quota_lookup.get(project_name, {}).get('allocatedGpus', 0),
-                            'gpu_utilization': 0
-                        }
-                    })
-            
-            return project_metrics
+            delay = self.backoff_factor * (2 ** attempt)
+            if self.deadline is not None:
+                # Wake up at the deadline at the latest; the next attempt then fails fast
+                delay = min(delay, max(0.0, self.deadline - time.monotonic()))
+            await asyncio.sleep(delay)
+    
+    async def get_clusters(self) -> List[Dict]:
+        """
+        Get list of available clusters
+        
+        Returns:
+            List of cluster information
+        """
+        return await self._make_request('GET', '/api/v1/clusters', cache_name='clusters')
+    
+    async def get_cluster_metrics(self, cluster_uuid: str, metric_types: List[str],
+                                  start_time: datetime, end_time: datetime,
+                                  number_of_samples: int = 20) -> Dict:
+        """
+        Get cluster-level metrics
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            metric_types: List of metric types to retrieve
+            start_time: Start time for metrics
+            end_time: End time for metrics
+            number_of_samples: Number of samples to retrieve
             
-        except Exception as e:
-            logger.error(f"Failed to collect project metrics: {e}")
-            raise
+        Returns:
+            Cluster metrics data
+        """
+        params = [
+            ('start', start_time.isoformat()),
+            ('end', end_time.isoformat()),
+            ('numberOfSamples', str(number_of_samples))
+        ]
+        params.extend(('metricType', metric_type) for metric_type in metric_types)
+        
+        return await self._make_request(
+            'GET',
+            f'/api/v1/clusters/{cluster_uuid}/metrics',
+            params=params,
+            fields=CLUSTER_METRICS_FIELDS
+        )
     
-    def _extract_gpu_utilization(self, metrics_data: Dict) -> float:
+    async def get_projects(self, cluster_uuid: str) -> List[Dict]:
         """
-        Extract GPU utilization from project metrics data
+        Get list of projects for a cluster
         
         Args:
-            metrics_data: Raw metrics data from API
+            cluster_uuid: Cluster UUID
             
         Returns:
-            GPU utilization percentage (0-100)
+            List of project information
         """
-        try:
-            # Look for GPU utilization in current metrics
-            current = metrics_data.get('current', {})
-            resources = current.get('resources', [])
-            
-            for resource in resources:
-                if resource.get('type') == 'gpu':
-                    utilization = resource.get('utilization', {})
-                    if 'percentage' in utilization:
-                        return float(utilization['percentage'])
-                    elif 'value' in utilization:
-                        return float(utilization['value'])
-            
-            # Alternative: look in timeRange data if available
-            time_range = metrics_data.get('timeRange', {})
-            data_points = time_range.get('data', [])
-            
-            if data_points:
-                for data_point in data_points:
-                    resources = data_point.get('resources', [])
-                    for resource in resources:
-                        if resource.get('type') == 'gpu':
-                            utilization = resource.get('utilization', {})
-                            if 'percentage' in utilization:
-                                return float(utilization['percentage'])
-                            elif 'value' in utilization:
-                                return float(utilization['value'])
-                
-                # If we have data points, return the latest utilization value
-                latest_data = data_points[-1]
-                return latest_data.get('gpu_utilization', 0)
+        return await self._make_request('GET', f'/v1/k8s/clusters/{cluster_uuid}/projects',
+                                        cache_name='projects')
+    
+    async def get_projects_quotas(self, cluster_uuid: str) -> List[Dict]:
+        """
+        Get project quotas for a cluster
+        
+        Args:
+            cluster_uuid: Cluster UUID
             
-            return 0.0
+        Returns:
+            List of project quota information
+        """
+        return await self._make_request('GET', f'/v1/k8s/clusters/{cluster_uuid}/projects/quotas',
+                                        cache_name='quotas')
+    
+    async def get_nodepools(self, cluster_uuid: str) -> List[Dict]:
+        """
+        Get the nodepools of a cluster
+        
+        Args:
+            cluster_uuid: Cluster UUID
             
-        except Exception as e:
-            logger.warning(f"Failed to extract GPU utilization: {e}")
-            return 0.0
+        Returns:
+            List of nodepool information
+        """
+        return await self._make_request('GET', f'/v1/k8s/clusters/{cluster_uuid}/nodepools',
+                                        cache_name='nodepools')
     
-    def collect_all_metrics(self, cluster_uuid: Optional[str] = None,
-                          hours_back: int = 1) -> Dict:
+    async def get_project_metrics(self, cluster_uuid: str, project_id: str,
+                                  start_time: datetime, end_time: datetime,
+                                  number_of_samples: int = 20,
+                                  nodepool_name: Optional[str] = None) -> Dict:
         """
-        Collect all GPU metrics (cluster and project level)
+        Get project-level metrics
         
         Args:
-            cluster_uuid: Specific cluster UUID, or None to collect from all clusters
-            hours_back: How many hours back to collect metrics
+            cluster_uuid: Cluster UUID
+            project_id: Project ID
+            start_time: Start time for metrics
+            end_time: End time for metrics
+            number_of_samples: Number of samples to retrieve
+            nodepool_name: Optional nodepool filter
             
         Returns:
-            Dictionary containing all collected metrics
+            Project metrics data
         """
-        end_time = datetime.now()
-        start_time = end_time - timedelta(hours=hours_back)
+        params = [
+            ('start', start_time.isoformat()),
+            ('end', end_time.isoformat()),
+            ('numberOfSamples', str(number_of_samples))
+        ]
         
-        logger.info(f"Collecting metrics from {start_time} to {end_time}")
+        if nodepool_name:
+            params.append(('nodepoolName', nodepool_name))
         
-        all_metrics = {
-            'collection_timestamp': datetime.now().isoformat(),
-            'time_range': {
-                'start': start_time.isoformat(),
-                'end': end_time.isoformat()
-            },
-            'clusters': []
-        }
+        return await self._make_request(
+            'GET',
+            f'/v1/k8s/clusters/{cluster_uuid}/projects/{project_id}/metrics',
+            params=params,
+            fields=PROJECT_METRICS_FIELDS
+        )
+
+
+def parse_duration(value: str) -> timedelta:
+    """
+    Parse a duration such as '30s', '5m', '1h' or '1d'
+    
+    Args:
+        value: Number followed by a unit (s, m, h or d)
         
-        try:
-            # Get clusters to process
-            if cluster_uuid:
-                clusters_to_process = [{'uuid': cluster_uuid}]
-            else:
-                clusters_to_process = self.client.get_clusters()
-            
-            for cluster in clusters_to_process:
-                cluster_id = cluster.get('uuid') or cluster.get('id')
-                cluster_name = cluster.get('name', cluster_id)
-                
-                logger.info(f"Processing cluster: {cluster_name} ({cluster_id})")
-                
-                cluster_metrics = {
-                    'cluster_uuid': cluster_id,
-                    'cluster_name': cluster_name,
-                    'cluster_level_metrics': {},
-                    'project_level_metrics': []
-                }
-                
-                try:
-                    # Collect cluster-level metrics
-                    cluster_gpu_metrics = self.collect_cluster_gpu_metrics(
-                        cluster_uuid=cluster_id,
-                        start_time=start_time,
-                        end_time=end_time
-                    )
-                    cluster_metrics['cluster_level_metrics'] = cluster_gpu_metrics
-                    
-                except Exception as e:
-                    logger.error(f"Failed to collect cluster metrics for {cluster_name}: {e}")
-                    cluster_metrics['cluster_level_metrics'] = {'error': str(e)}
-                
-                try:
-                    # Collect project-level metrics
-                    project_gpu_metrics = self.collect_project_gpu_metrics(
-                        cluster_uuid=cluster_id,
-                        start_time=start_time,
-                        end_time=end_time
-                    )
-                    cluster_metrics['project_level_metrics'] = project_gpu_metrics
-                    
-                except Exception as e:
-                    logger.error(f"Failed to collect project metrics for {cluster_name}: {e}")
-                    cluster_metrics['project_level_metrics'] = [{'error': str(e)}]
-                
-                all_metrics['clusters'].append(cluster_metrics)
-            
-            return all_metrics
-            
-        except Exception as e:
-            logger.error(f"Failed to collect metrics: {e}")
-            raise
+    Returns:
+        The duration as a timedelta
+        
+    Raises:
+        ValueError: If the value is not a positive duration
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smhd])\s*', value or '')
+    if not match or float(match.group(1)) <= 0:
+        raise ValueError(f"Invalid duration: {value!r} (expected e.g. 30s, 5m, 1h, 1d)")
+    unit = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days'}[match.group(2)]
+    return timedelta(**{unit: float(match.group(1))})
 
 
-def main():
-    """Main function to run the metrics collector"""
-    parser = argparse.ArgumentParser(description='Collect GPU metrics from RunAI API')
-    parser.add_argument('--base-url', 
-                       default=os.environ.get('RUNAI_BASE_URL'),
+def plan_time_windows(start_time: datetime, end_time: datetime, step: timedelta,
+                      max_samples_per_request: int) -> List[Tuple[datetime, datetime, int]]:
+    """
+    Split a time range into request windows of a fixed resolution
+    
+    Every window holds at most max_samples_per_request samples spaced step
+    apart, so response sizes stay predictable however long the range is.
+    
+    Args:
+        start_time: Start of the range
+        end_time: End of the range
+        step: Requested spacing between samples
+        max_samples_per_request: Upper bound on numberOfSamples per request
+        
+    Returns:
+        List of (window start, window end, number of samples) in time order
+    """
+    total_samples = max(1, math.ceil((end_time - start_time) / step))
+    window_samples = max(1, min(max_samples_per_request, total_samples))
+    windows = []
+    window_start = start_time
+    while window_start < end_time:
+        window_end = min(window_start + step * window_samples, end_time)
+        samples = max(1, math.ceil((window_end - window_start) / step))
+        windows.append((window_start, window_end, samples))
+        window_start = window_end
+    return windows or [(start_time, end_time, 1)]
+
+
+def plan_project_requests(projects: List[Dict],
+                          quota_lookup: Dict[str, Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Decide which projects need a metrics request, using the quota snapshot
+    
+    A project with allocatedGpus == 0 cannot use any GPU, so its utilization
+    is known to be zero without asking. The others are ordered by allocated
+    GPUs, largest first, so the busiest projects are collected first when a
+    run is cut short. Projects without a quota entry are fetched last.
+    
+    Args:
+        projects: Projects as returned by get_projects
+        quota_lookup: Project quotas keyed by project name
+        
+    Returns:
+        (projects to fetch in request order, idle projects)
+    """
+    busy, unknown, idle = [], [], []
+    for project in projects:
+        quota = quota_lookup.get(project.get('name'))
+        if quota is None:
+            unknown.append(project)
+            continue
+        try:
+            allocated = float(quota.get('allocatedGpus') or 0)
+        except (TypeError, ValueError):
+            unknown.append(project)
+            continue
+        if allocated > 0:
+            busy.append((allocated, project))
+        else:
+            idle.append(project)
+    
+    # sort() is stable, so equally busy projects keep their listed order
+    busy.sort(key=lambda item: item[0], reverse=True)
+    return [project for _, project in busy] + unknown, idle
+
+
+def bounded_map(func: Callable[[Any], Any], items: Iterable[Any], workers: int,
+                ahead: Optional[int] = None) -> Iterator[Any]:
+    """
+    Map func over items in a thread pool, yielding results in item order
+    
+    Unlike ThreadPoolExecutor.map, which submits every item at once, only
+    `ahead` items are submitted or waiting to be consumed at any time; the
+    next item is submitted as each result is taken. A slow consumer therefore
+    pauses the work instead of results accumulating in memory. Closing the
+    iterator cancels the items not yet started.
+    
+    Args:
+        func: Function applied to each item
+        items: Items to process
+        workers: Number of worker threads
+        ahead: Maximum items submitted beyond those consumed (default: 2 * workers)
+        
+    Yields:
+        func(item) for each item, in order
+    """
+    items = iter(items)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for item in islice(items, ahead or 2 * workers):
+                pending.append(executor.submit(func, item))
+            while pending:
+                result = pending.popleft().result()
+                for item in islice(items, 1):
+                    pending.append(executor.submit(func, item))
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _to_float(value) -> Optional[float]:
+    """Convert an API value to float, or None if it is not numeric"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _timestamp_sort_key(timestamp: Any) -> tuple:
+    """Sort key that orders parseable timestamps chronologically"""
+    try:
+        return (0, to_epoch(timestamp), '')
+    except (TypeError, ValueError):
+        return (1, 0, str(timestamp))
+
+
+def merge_cluster_metrics(responses: List[Dict]) -> Dict:
+    """
+    Merge cluster metrics responses of consecutive windows
+    
+    Samples of each measurement type are de-duplicated by timestamp (a later
+    window wins) and returned in chronological order.
+    
+    Args:
+        responses: get_cluster_metrics responses in window order
+        
+    Returns:
+        A single response with one ordered series per measurement type
+    """
+    measurements: Dict[str, Dict] = {}
+    samples: Dict[str, Dict] = {}
+    
+    for response in responses:
+        for measurement in response.get('measurements', []):
+            metric_type = measurement.get('type')
+            if metric_type not in measurements:
+                measurements[metric_type] = {
+                    key: value for key, value in measurement.items() if key != 'values'
+                }
+                samples[metric_type] = {}
+            for value in measurement.get('values', []):
+                samples[metric_type][value.get('timestamp')] = value
+    
+    return {
+        'measurements': [
+            dict(measurement, values=sorted(
+                samples[metric_type].values(),
+                key=lambda value: _timestamp_sort_key(value.get('timestamp'))
+            ))
+            for metric_type, measurement in measurements.items()
+        ]
+    }
+
+
+def merge_project_metrics(responses: List[Dict]) -> Dict:
+    """
+    Merge project metrics responses of consecutive windows
+    
+    The newest window provides 'current'; 'timeRange.data' points of all
+    windows are de-duplicated by timestamp and ordered chronologically.
+    
+    Args:
+        responses: get_project_metrics responses in window order
+        
+    Returns:
+        A single project metrics response
+    """
+    merged = dict(responses[-1]) if responses else {}
+    points: Dict[Any, Dict] = {}
+    untimed = []
+    
+    for response in responses:
+        for point in response.get('timeRange', {}).get('data', []):
+            if point.get('timestamp') is None:
+                untimed.append(point)
+            else:
+                points[point['timestamp']] = point
+    
+    if points or untimed:
+        merged['timeRange'] = dict(
+            merged.get('timeRange', {}),
+            data=untimed + sorted(
+                points.values(),
+                key=lambda point: _timestamp_sort_key(point['timestamp'])
+            )
+        )
+    return merged
+
+
+class NDJSONWriter:
+    """Thread-safe writer emitting one compact JSON document per line"""
+    
+    def __init__(self, stream: TextIO):
+        """
+        Initialize the writer
+        
+        Args:
+            stream: Text stream to write to (file or sys.stdout)
+        """
+        self.stream = stream
+        self.records_written = 0
+        self._lock = threading.Lock()
+    
+    def write(self, record: Dict):
+        """
+        Serialize a record and flush it so consumers can read it immediately
+        
+        Args:
+            record: JSON-serializable record
+        """
+        line = json.dumps(record, separators=(',', ':'), default=json_default)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+            self.records_written += 1
+
+
+class GPUMetricsCollector:
+    """Main class for collecting GPU metrics from RunAI"""
+    
+    # Define the metric types we need for cluster level
+    CLUSTER_METRIC_TYPES = [
+        'TOTAL_GPU',           # Total GPU limit
+        'ALLOCATED_GPU',       # Total GPU requested
+        'GPU_UTILIZATION'      # Total GPU utilisation
+    ]
+    
+    # What each output profile retains beyond the current values:
+    #   summary - current values only
+    #   series  - plus sampled series (all_values, gpu_utilization_series), kept
+    #             as CompactSeries with compact_series
+    #   full    - plus the raw payloads (raw_metrics, raw_quota)
+    OUTPUT_PROFILES = ('summary', 'series', 'full')
+    
+    # Project-level series written to the local store
+    PROJECT_METRIC_NAMES = ('gpu_limit', 'gpu_requested', 'gpu_utilization')
+    
+    def __init__(self, client: RunAIAPIClient, max_concurrency: int = 1,
+                 parallel_clusters: bool = False, output_profile: str = 'full',
+                 store: Optional[MetricsStore] = None,
+                 step: Optional[timedelta] = None,
+                 max_samples_per_request: int = 500,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 skip_idle_projects: bool = False,
+                 nodepool_breakdown: bool = False,
+                 shard_index: int = 0, shard_count: int = 1,
+                 compact_series: bool = False):
+        """
+        Initialize the metrics collector
+        
+        Args:
+            client: RunAI API client
+            max_concurrency: Maximum number of API requests in flight at once.
+                1 keeps the original sequential behaviour.
+            parallel_clusters: Collect clusters, and the cluster-level and
+                project-level metrics within each cluster, in parallel. All
+                requests share the max_concurrency budget.
+            output_profile: One of OUTPUT_PROFILES. Payloads the profile does
+                not include are dropped as soon as a record is built.
+            store: Optional local time-series store. When set, samples are
+                saved and each series is only fetched from its watermark on.
+            step: Optional sample resolution. When set, metric ranges are split
+                into windows of at most max_samples_per_request samples that
+                are fetched in parallel and merged.
+            max_samples_per_request: Upper bound on numberOfSamples per window
+            circuit_breaker: Optional breaker that stops calling a cluster
+                endpoint once too many of its calls fail
+            skip_idle_projects: Plan project requests from the quota snapshot:
+                projects without allocated GPUs get zero utilization without
+                a request, and the others are fetched busiest first
+            nodepool_breakdown: Also fetch each project's metrics per nodepool
+                of its cluster, within the same request budget
+            shard_index: Shard collected by this instance, in [0, shard_count)
+            shard_count: Number of collector instances splitting the clusters
+                and projects between them (see sharding.py)
+            compact_series: Keep sampled series as CompactSeries arrays. The
+                records then need compact_series.json_default to be encoded
+                with json; without it they hold plain sample lists.
+            
+        Raises:
+            ValueError: If output_profile is unknown or the shard is out of range
+        """
+        if output_profile not in self.OUTPUT_PROFILES:
+            raise ValueError(f"Unknown output profile: {output_profile}")
+        if shard_count < 1 or not 0 <= shard_index < shard_count:
+            raise ValueError(f"Invalid shard {shard_index} of {shard_count}")
+        
+        self.client = client
+        self.output_profile = output_profile
+        self.store = store
+        self.step = step
+        self.max_samples_per_request = max(1, max_samples_per_request)
+        self.max_concurrency = max(1, max_concurrency)
+        self.parallel_clusters = parallel_clusters
+        self.circuit_breaker = circuit_breaker
+        self.skip_idle_projects = skip_idle_projects
+        self.nodepool_breakdown = nodepool_breakdown
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.compact_series = compact_series
+        # Compiled for the utilization layout of the first project responses
+        self.utilization_resolver = UtilizationResolver()
+        # Global request budget shared by every worker thread
+        self._request_slots = threading.BoundedSemaphore(self.max_concurrency)
+        # Fetches the windows of split ranges for every caller; created on first use
+        self._window_executor: Optional[ThreadPoolExecutor] = None
+        self._window_executor_lock = threading.Lock()
+    
+    def close(self):
+        """Shut down the worker threads the collector keeps between runs"""
+        with self._window_executor_lock:
+            executor, self._window_executor = self._window_executor, None
+        if executor is not None:
+            executor.shutdown()
+    
+    def _series(self, samples: List[Dict]):
+        """Sampled series as stored in a record: CompactSeries with compact_series, else the list"""
+        return CompactSeries.from_samples(samples) if self.compact_series else samples
+    
+    def _api_call(self, func, *args, **kwargs):
+        """
+        Call a client method while holding one slot of the request budget
+        
+        Args:
+            func: Bound RunAIAPIClient method
+            *args: Positional arguments for func
+            **kwargs: Keyword arguments for func
+            
+        Returns:
+            Whatever func returns
+        """
+        with self._request_slots:
+            return func(*args, **kwargs)
+    
+    def _guarded_call(self, circuit: Tuple[str, str], func, *args, **kwargs):
+        """
+        Call a cluster endpoint through the circuit breaker, if one is configured
+        
+        Args:
+            circuit: (cluster UUID, endpoint name) where the endpoint is one of
+                'cluster_metrics', 'projects', 'quotas' or 'project_metrics'
+            func: Bound RunAIAPIClient method
+            *args: Positional arguments for func
+            **kwargs: Keyword arguments for func
+            
+        Calls cut off by the collection deadline are released without an
+        outcome: they neither count as an outage nor close a half-open circuit.
+        
+        Returns:
+            Whatever func returns
+            
+        Raises:
+            CircuitOpenError: If the endpoint's circuit is open
+        """
+        if self.circuit_breaker is None:
+            return self._api_call(func, *args, **kwargs)
+        
+        name = CircuitBreaker.circuit_name(*circuit)
+        self.circuit_breaker.before_call(name)
+        try:
+            result = self._api_call(func, *args, **kwargs)
+        except Exception as e:
+            self._record_failure(name, e)
+            raise
+        except BaseException:
+            # Cancelled or interrupted: nothing is known about the endpoint
+            self.circuit_breaker.release(name)
+            raise
+        self.circuit_breaker.record(name, True)
+        return result
+    
+    def _record_failure(self, name: str, error: Exception):
+        """
+        Record a failed call on its circuit
+        
+        Args:
+            name: Circuit name
+            error: The exception raised by the call
+        """
+        if self._missed_deadline(error):
+            self.circuit_breaker.release(name)
+        else:
+            self.circuit_breaker.record(name, not self._is_outage(error))
+    
+    @staticmethod
+    def _is_outage(error: Exception) -> bool:
+        """
+        Tell whether a failed call indicates that the endpoint is unhealthy
+        
+        Server errors, throttling, timeouts and connection failures count;
+        client errors such as 404 for a single project do not.
+        
+        Args:
+            error: Exception raised by the call
+            
+        Returns:
+            True if the failure should count against the circuit
+        """
+        response = getattr(error, 'response', None)
+        status = getattr(response, 'status_code', None)
+        if status is None:
+            # aiohttp.ClientResponseError carries the status directly
+            status = getattr(error, 'status', None)
+        if isinstance(status, int):
+            return status >= 500 or status == 429
+        if aiohttp is not None and isinstance(error, aiohttp.ClientError):
+            return True
+        return isinstance(error, (requests.RequestException, OSError, asyncio.TimeoutError))
+    
+    def _plan_windows(self, start_time: datetime,
+                      end_time: datetime) -> Optional[List[Tuple[datetime, datetime, int]]]:
+        """
+        Plan the request windows for a metrics range
+        
+        Args:
+            start_time: Start of the range
+            end_time: End of the range
+            
+        Returns:
+            Windows from plan_time_windows, or None to send one plain request
+        """
+        if self.step is None:
+            return None
+        return plan_time_windows(start_time, end_time, self.step, self.max_samples_per_request)
+    
+    def _map_windows(self, fetch: Callable[[Tuple[datetime, datetime, int]], Dict],
+                     windows: List[Tuple[datetime, datetime, int]]) -> List[Dict]:
+        """
+        Fetch every window, in parallel when the request budget allows it
+        
+        Windows of all clusters and projects run on one executor of
+        max_concurrency threads, kept for the life of the collector. Its
+        tasks only send requests and never wait on the executor themselves.
+        
+        Args:
+            fetch: Callable fetching one window
+            windows: Windows to fetch
+            
+        Returns:
+            Responses in window order
+        """
+        if self.max_concurrency > 1 and len(windows) > 1:
+            with self._window_executor_lock:
+                if self._window_executor is None:
+                    self._window_executor = ThreadPoolExecutor(
+                        max_workers=self.max_concurrency, thread_name_prefix='metrics-window'
+                    )
+                executor = self._window_executor
+            return list(executor.map(fetch, windows))
+        return [fetch(window) for window in windows]
+    
+    def _fetch_cluster_metrics(self, cluster_uuid: str, start_time: datetime,
+                               end_time: datetime) -> Dict:
+        """
+        Fetch cluster metrics, splitting long ranges into windows if a step is set
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Returns:
+            Cluster metrics data
+        """
+        windows = self._plan_windows(start_time, end_time)
+        if windows is None:
+            return self._guarded_call(
+                (cluster_uuid, 'cluster_metrics'),
+                self.client.get_cluster_metrics,
+                cluster_uuid=cluster_uuid,
+                metric_types=self.CLUSTER_METRIC_TYPES,
+                start_time=start_time,
+                end_time=end_time
+            )
+        
+        return merge_cluster_metrics(self._map_windows(
+            lambda window: self._guarded_call(
+                (cluster_uuid, 'cluster_metrics'),
+                self.client.get_cluster_metrics,
+                cluster_uuid=cluster_uuid,
+                metric_types=self.CLUSTER_METRIC_TYPES,
+                start_time=window[0],
+                end_time=window[1],
+                number_of_samples=window[2]
+            ),
+            windows
+        ))
+    
+    def _fetch_project_metrics(self, cluster_uuid: str, project_id: str,
+                               start_time: datetime, end_time: datetime,
+                               nodepool_name: Optional[str] = None) -> Dict:
+        """
+        Fetch project metrics, splitting long ranges into windows if a step is set
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            project_id: Project ID
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            nodepool_name: Optional nodepool filter
+            
+        Returns:
+            Project metrics data
+        """
+        nodepool = {'nodepool_name': nodepool_name} if nodepool_name else {}
+        windows = self._plan_windows(start_time, end_time)
+        if windows is None:
+            return self._guarded_call(
+                (cluster_uuid, 'project_metrics'),
+                self.client.get_project_metrics,
+                cluster_uuid=cluster_uuid,
+                project_id=project_id,
+                start_time=start_time,
+                end_time=end_time,
+                **nodepool
+            )
+        
+        return merge_project_metrics(self._map_windows(
+            lambda window: self._guarded_call(
+                (cluster_uuid, 'project_metrics'),
+                self.client.get_project_metrics,
+                cluster_uuid=cluster_uuid,
+                project_id=project_id,
+                start_time=window[0],
+                end_time=window[1],
+                number_of_samples=window[2],
+                **nodepool
+            ),
+            windows
+        ))
+    
+    def _discover_nodepools(self, cluster_uuid: str) -> List[str]:
+        """
+        List the nodepool names of a cluster for the per-nodepool breakdown
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            
+        Returns:
+            Nodepool names, or an empty list if the breakdown is disabled or
+            the nodepools cannot be listed
+        """
+        if not self.nodepool_breakdown:
+            return []
+        try:
+            nodepools = self._guarded_call(
+                (cluster_uuid, 'nodepools'), self.client.get_nodepools, cluster_uuid
+            )
+        except Exception as e:
+            logger.warning(f"Failed to list nodepools of cluster {cluster_uuid}: {e}")
+            return []
+        names = self._nodepool_names(nodepools)
+        logger.info(f"Found {len(names)} nodepools")
+        return names
+    
+    @staticmethod
+    def _nodepool_names(nodepools: List[Any]) -> List[str]:
+        """Extract nodepool names from a get_nodepools response"""
+        return [
+            nodepool.get('name') if isinstance(nodepool, dict) else str(nodepool)
+            for nodepool in nodepools or []
+            if not isinstance(nodepool, dict) or nodepool.get('name')
+        ]
+    
+    def _collect_nodepool_metrics(self, cluster_uuid: str, project_id: str,
+                                  nodepools: List[str], start_time: datetime,
+                                  end_time: datetime) -> Dict[str, Dict]:
+        """
+        Fetch the metrics of one project in every nodepool
+        
+        The nodepools are fetched one after another in the calling project
+        worker; projects already run in parallel, so a pool per project would
+        only multiply the threads.
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            project_id: Project ID
+            nodepools: Nodepool names
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Returns:
+            Per-nodepool entries keyed by nodepool name, in nodepool order
+        """
+        def fetch(nodepool: str) -> Dict:
+            try:
+                return self._build_nodepool_metrics(self._fetch_project_metrics(
+                    cluster_uuid, project_id, start_time, end_time, nodepool_name=nodepool
+                ))
+            except Exception as e:
+                logger.warning(f"Failed to get metrics for project {project_id} "
+                               f"in nodepool {nodepool}: {e}")
+                return self._error_entry(e)
+        
+        return {nodepool: fetch(nodepool) for nodepool in nodepools}
+    
+    def collect_cluster_gpu_metrics(self, cluster_uuid: str, 
+                                  start_time: datetime, end_time: datetime) -> Dict:
+        """
+        Collect cluster-level GPU metrics
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Returns:
+            Dictionary containing cluster GPU metrics
+        """
+        logger.info(f"Collecting cluster GPU metrics for {cluster_uuid}")
+        
+        owner = self._cluster_owner(cluster_uuid)
+        if owner != self.shard_index:
+            logger.info(f"Cluster-level metrics of {cluster_uuid} are collected by shard {owner}")
+            return {'shard': owner}
+        
+        requested_start = start_time
+        start_time = self._incremental_start(
+            cluster_uuid, None, self.CLUSTER_METRIC_TYPES, start_time, end_time
+        )
+        
+        try:
+            metrics_data = self._fetch_cluster_metrics(cluster_uuid, start_time, end_time)
+            self._store_cluster_samples(cluster_uuid, metrics_data)
+            
+            return self._note_requested_start(self._build_cluster_metrics(
+                cluster_uuid, metrics_data, start_time, end_time
+            ), requested_start)
+            
+        except Exception as e:
+            logger.error(f"Failed to collect cluster metrics: {e}")
+            raise
+    
+    def collect_project_gpu_metrics(self, cluster_uuid: str,
+                                   start_time: datetime, end_time: datetime) -> List[Dict]:
+        """
+        Collect project-level GPU metrics
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Returns:
+            List of dictionaries containing project GPU metrics
+        """
+        logger.info(f"Collecting project GPU metrics for cluster {cluster_uuid}")
+        
+        try:
+            return list(self.iter_project_gpu_metrics(cluster_uuid, start_time, end_time))
+            
+        except Exception as e:
+            logger.error(f"Failed to collect project metrics: {e}")
+            raise
+    
+    def iter_project_gpu_metrics(self, cluster_uuid: str, start_time: datetime,
+                                 end_time: datetime) -> Iterator[Dict]:
+        """
+        Yield project-level GPU metrics one project at a time
+        
+        Records are yielded in project order as soon as they are available,
+        so callers can write them out without holding the whole list. With
+        skip_idle_projects the order is the plan order instead: fetched
+        projects busiest first, then the idle ones. At most twice
+        max_concurrency projects are fetched ahead of the consumer, so a slow
+        consumer throttles the requests instead of results piling up.
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Yields:
+            Dictionary containing the GPU metrics of one project
+        """
+        # Get list of projects
+        projects = self._guarded_call(
+            (cluster_uuid, 'projects'), self.client.get_projects, cluster_uuid
+        )
+        logger.info(f"Found {len(projects)} projects")
+        
+        # Get project quotas (contains GPU limits and allocations)
+        quotas = self._guarded_call(
+            (cluster_uuid, 'quotas'), self.client.get_projects_quotas, cluster_uuid
+        )
+        
+        # Create quota lookup by project name
+        quota_lookup = {quota['name']: quota for quota in quotas}
+        
+        projects, idle_projects = self._plan_projects(cluster_uuid, projects, quota_lookup)
+        nodepools = self._discover_nodepools(cluster_uuid)
+        
+        if self.max_concurrency > 1 and len(projects) > 1:
+            yield from bounded_map(
+                lambda project: self._collect_single_project_metrics(
+                    cluster_uuid, project, quota_lookup, start_time, end_time,
+                    nodepools=nodepools
+                ),
+                projects,
+                workers=min(self.max_concurrency, len(projects))
+            )
+        else:
+            for project in projects:
+                yield self._collect_single_project_metrics(
+                    cluster_uuid, project, quota_lookup, start_time, end_time,
+                    nodepools=nodepools
+                )
+        
+        for project in idle_projects:
+            yield self._build_idle_project_metrics(
+                cluster_uuid, project, quota_lookup, start_time, end_time
+            )
+    
+    def _plan_projects(self, cluster_uuid: str, projects: List[Dict],
+                       quota_lookup: Dict[str, Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Split this shard's projects into those to fetch and those known to be idle
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            projects: Projects as returned by get_projects
+            quota_lookup: Project quotas keyed by project name
+            
+        Returns:
+            (projects to fetch in request order, idle projects)
+        """
+        if self.shard_count > 1:
+            total = len(projects)
+            keys = [project_shard_key(cluster_uuid, self._project_identity(project)[1])
+                    for project in projects]
+            projects = [
+                project for project, key in zip(projects, keys)
+                if shard_of(key, self.shard_count) == self.shard_index
+            ]
+            logger.info(f"Shard {self.shard_index}/{self.shard_count} collects "
+                        f"{len(projects)} of {total} projects")
+        
+        if not self.skip_idle_projects:
+            return projects, []
+        
+        fetch, idle = plan_project_requests(projects, quota_lookup)
+        logger.info(f"Fetching metrics for {len(fetch)} projects; "
+                    f"{len(idle)} without allocated GPUs need no request")
+        return fetch, idle
+    
+    def _cluster_owner(self, cluster_uuid: str) -> int:
+        """Index of the shard collecting the cluster-level metrics of a cluster"""
+        if self.shard_count == 1:
+            return 0
+        return shard_of(cluster_shard_key(cluster_uuid), self.shard_count)
+    
+    def _build_idle_project_metrics(self, cluster_uuid: str, project: Dict,
+                                    quota_lookup: Dict[str, Dict],
+                                    start_time: datetime, end_time: datetime) -> Dict:
+        """
+        Build the record of a project without allocated GPUs, without a request
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            project: Project information as returned by get_projects
+            quota_lookup: Project quotas keyed by project name
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Returns:
+            Project record with zero utilization, marked 'skipped_idle'
+        """
+        project_name, project_id = self._project_identity(project)
+        project_metric, utilization_series = self._build_project_metrics(
+            cluster_uuid, project_name, project_id, {},
+            quota_lookup.get(project_name, {}), start_time, end_time
+        )
+        project_metric['skipped_idle'] = True
+        self._store_project_samples(project_metric, utilization_series)
+        return project_metric
+    
+    def _collect_single_project_metrics(self, cluster_uuid: str, project: Dict,
+                                        quota_lookup: Dict[str, Dict],
+                                        start_time: datetime, end_time: datetime,
+                                        nodepools: Optional[List[str]] = None) -> Dict:
+        """
+        Collect GPU metrics for a single project
+        
+        Failures are recorded in the returned entry rather than raised so that
+        one bad project does not abort the whole cluster.
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            project: Project information as returned by get_projects
+            quota_lookup: Project quotas keyed by project name
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            nodepools: Nodepools to break the project's metrics down by, if any
+            
+        Returns:
+            Dictionary containing the project GPU metrics, or an error entry
+        """
+        project_name, project_id = self._project_identity(project)
+        
+        logger.info(f"Processing project: {project_name} (ID: {project_id})")
+        
+        project_start = self._incremental_start(
+            cluster_uuid, str(project_id), self.PROJECT_METRIC_NAMES, start_time, end_time
+        )
+        
+        try:
+            # Get project metrics (includes utilization)
+            metrics_data = self._fetch_project_metrics(
+                cluster_uuid, str(project_id), project_start, end_time
+            )
+            
+            project_metric, utilization_series = self._build_project_metrics(
+                cluster_uuid, project_name, project_id, metrics_data,
+                quota_lookup.get(project_name, {}), project_start, end_time
+            )
+            self._note_requested_start(project_metric, start_time)
+            if nodepools:
+                project_metric['nodepool_metrics'] = self._collect_nodepool_metrics(
+                    cluster_uuid, str(project_id), nodepools, project_start, end_time
+                )
+            self._store_project_samples(project_metric, utilization_series)
+            return project_metric
+            
+        except Exception as e:
+            # Projects skipped by an open circuit are summarized by the breaker
+            log = logger.debug if isinstance(e, CircuitOpenError) else logger.warning
+            log(f"Failed to get metrics for project {project_name}: {e}")
+            return self._build_project_error(
+                cluster_uuid, project_name, project_id,
+                quota_lookup.get(project_name, {}), e
+            )
+    
+    def _incremental_start(self, cluster_uuid: str, project_id: Optional[str],
+                           metrics: Iterable[str], start_time: datetime,
+                           end_time: datetime) -> datetime:
+        """
+        Narrow the start of a request window to what the store has not seen
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            project_id: Project ID, or None for cluster-level metrics
+            metrics: Metric names fetched by the request
+            start_time: Start of the requested window
+            end_time: End of the requested window
+            
+        Returns:
+            The series watermark if it falls inside the window, else start_time
+        """
+        if self.store is None:
+            return start_time
+        
+        watermark = self.store.watermark(cluster_uuid, project_id, metrics)
+        if watermark is None:
+            return start_time
+        return min(max(start_time, from_epoch(watermark)), end_time)
+    
+    @staticmethod
+    def _note_requested_start(record: Dict, requested_start: datetime) -> Dict:
+        """
+        Keep the requested start in a record whose window the store narrowed
+        
+        Series of such a record only hold samples newer than the store's
+        watermark; 'time_range.requested_start' tells consumers that the
+        earlier part of the window is in the store rather than in the record.
+        
+        Args:
+            record: Cluster or project record with a 'time_range'
+            requested_start: Start of the window before _incremental_start
+            
+        Returns:
+            The record
+        """
+        if record['time_range']['start'] != requested_start.isoformat():
+            record['time_range']['requested_start'] = requested_start.isoformat()
+        return record
+    
+    def _store_cluster_samples(self, cluster_uuid: str, metrics_data: Dict):
+        """
+        Save the sampled values of a cluster metrics response to the store
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            metrics_data: Raw response of get_cluster_metrics
+        """
+        if self.store is None:
+            return
+        
+        for measurement in metrics_data.get('measurements', []):
+            samples = [
+                (to_epoch(value['timestamp']), float(value.get('value', 0)))
+                for value in measurement.get('values', [])
+                if value.get('timestamp')
+            ]
+            self.store.add_samples(cluster_uuid, None, measurement.get('type'), samples)
+    
+    def _store_project_samples(self, project_metric: Dict, utilization_series: List[Dict]):
+        """
+        Save the values of a project record to the store
+        
+        Utilization samples of the response are stored with their own
+        timestamps, like cluster samples; the quota values, and the current
+        utilization of a response without samples, are stamped with the
+        collection time. Values that are not numeric, such as a null quota,
+        are not stored.
+        
+        Args:
+            project_metric: Record built by _build_project_metrics
+            utilization_series: Utilization samples resolved from the response
+        """
+        if self.store is None:
+            return
+        
+        ts = to_epoch(project_metric['timestamp'])
+        for metric in self.PROJECT_METRIC_NAMES:
+            value = _to_float(project_metric['gpu_metrics'][metric])
+            samples = [(ts, value)] if value is not None else []
+            if metric == 'gpu_utilization':
+                samples = [
+                    (to_epoch(sample['timestamp']), _to_float(sample['value']))
+                    for sample in utilization_series
+                    if sample.get('timestamp') and _to_float(sample.get('value')) is not None
+                ] or samples
+            self.store.add_samples(
+                project_metric['cluster_uuid'],
+                project_metric['project_id'],
+                metric,
+                samples
+            )
+    
+    @staticmethod
+    def _project_identity(project: Dict) -> tuple:
+        """
+        Resolve the display name and API identifier of a project
+        
+        Args:
+            project: Project information as returned by get_projects
+            
+        Returns:
+            Tuple of (project_name, project_id)
+        """
+        project_name = project.get('name')
+        project_id = project.get('id') or project.get('uuid') or project_name
+        return project_name, project_id
+    
+    def _build_cluster_metrics(self, cluster_uuid: str, metrics_data: Dict,
+                               start_time: datetime, end_time: datetime) -> Dict:
+        """
+        Build the cluster-level record from a cluster metrics response
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            metrics_data: Raw response of get_cluster_metrics
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Returns:
+            Dictionary containing cluster GPU metrics
+        """
+        processed_metrics = {
+            'cluster_uuid': cluster_uuid,
+            'timestamp': datetime.now().isoformat(),
+            'time_range': {
+                'start': start_time.isoformat(),
+                'end': end_time.isoformat()
+            },
+            'metrics': {}
+        }
+        
+        for measurement in metrics_data.get('measurements', []):
+            metric_type = measurement.get('type')
+            values = measurement.get('values', [])
+            
+            if values:
+                # Get the latest value
+                latest_value = values[-1] if values else {}
+                metric = {
+                    'current_value': latest_value.get('value', 0),
+                    'timestamp': latest_value.get('timestamp')
+                }
+                if self.output_profile != 'summary':
+                    metric['all_values'] = self._series(values)
+                processed_metrics['metrics'][metric_type] = metric
+        
+        return processed_metrics
+    
+    def _build_project_metrics(self, cluster_uuid: str, project_name: str,
+                               project_id: Any, metrics_data: Dict, quota_info: Dict,
+                               start_time: datetime, end_time: datetime) -> Tuple[Dict, List[Dict]]:
+        """
+        Build the project-level record from a project metrics response
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            project_name: Project name
+            project_id: Project ID
+            metrics_data: Raw response of get_project_metrics
+            quota_info: Quota entry of the project
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Returns:
+            Tuple of the project record and the resolved utilization samples
+        """
+        utilization, utilization_series = self.utilization_resolver.resolve(metrics_data)
+        project_metric = {
+            'project_name': project_name,
+            'project_id': project_id,
+            'cluster_uuid': cluster_uuid,
+            'timestamp': datetime.now().isoformat(),
+            'time_range': {
+                'start': start_time.isoformat(),
+                'end': end_time.isoformat()
+            },
+            'gpu_metrics': {
+                'gpu_limit': quota_info.get('deservedGpus', 0),  # GPU limit (quota)
+                'gpu_requested': quota_info.get('allocatedGpus', 0),  # GPU requested
+                'gpu_utilization': utilization
+            }
+        }
+        
+        if self.output_profile != 'summary':
+            project_metric['gpu_utilization_series'] = self._series(utilization_series)
+        if self.output_profile == 'full':
+            project_metric['raw_metrics'] = metrics_data
+            project_metric['raw_quota'] = quota_info
+        
+        return project_metric, utilization_series
+    
+    def _build_nodepool_metrics(self, metrics_data: Dict) -> Dict:
+        """
+        Build the per-nodepool entry of a project record
+        
+        Args:
+            metrics_data: Raw response of get_project_metrics for one nodepool
+            
+        Returns:
+            Dictionary with the nodepool's GPU utilization
+        """
+        utilization, utilization_series = self.utilization_resolver.resolve(metrics_data)
+        entry = {'gpu_utilization': utilization}
+        if self.output_profile != 'summary':
+            entry['gpu_utilization_series'] = self._series(utilization_series)
+        if self.output_profile == 'full':
+            entry['raw_metrics'] = metrics_data
+        return entry
+    
+    def _build_project_error(self, cluster_uuid: str, project_name: str,
+                             project_id: Any, quota_info: Dict,
+                             error: Exception) -> Dict:
+        """
+        Build the entry recorded for a project whose metrics could not be fetched
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            project_name: Project name
+            project_id: Project ID
+            quota_info: Quota entry of the project
+            error: The exception raised while fetching metrics
+            
+        Returns:
+            Dictionary containing the project quota and the error message.
+            Projects skipped because of an open circuit also carry
+            'circuit_open': True, projects cut off by the collection deadline
+            'deadline_exceeded': True.
+        """
+        # Add project with empty metrics
+        entry = {
+            'project_name': project_name,
+            'project_id': project_id,
+            'cluster_uuid': cluster_uuid,
+            'timestamp': datetime.now().isoformat(),
+            'error': str(error),
+            'gpu_metrics': {
+                'gpu_limit': quota_info.get('deservedGpus', 0),
+                'gpu_requested': quota_info.get('allocatedGpus', 0),
+                'gpu_utilization': 0
+            }
+        }
+        if isinstance(error, CircuitOpenError):
+            entry['circuit_open'] = True
+        if self._missed_deadline(error):
+            entry['deadline_exceeded'] = True
+        return entry
+    
+    def _error_entry(self, error: Exception) -> Dict:
+        """
+        Build the placeholder recorded for cluster-level or project-level metrics that failed
+        
+        Args:
+            error: The exception raised while collecting
+            
+        Returns:
+            Dictionary with the error message, flagged if the deadline cut it off
+        """
+        entry = {'error': str(error)}
+        if self._missed_deadline(error):
+            entry['deadline_exceeded'] = True
+        return entry
+    
+    def _missed_deadline(self, error: Exception) -> bool:
+        """
+        Tell whether a failure was caused by the collection deadline
+        
+        Requests still in flight when the deadline passes fail with an
+        ordinary timeout, so any failure after the deadline counts.
+        
+        Args:
+            error: The exception raised while collecting
+            
+        Returns:
+            True if the deadline was exceeded
+        """
+        deadline = self.client.deadline
+        return isinstance(error, DeadlineExceeded) or (
+            deadline is not None and time.monotonic() >= deadline
+        )
+    
+    def _start_deadline(self, deadline: Optional[float]):
+        """
+        Arm the client's deadline for one collection run
+        
+        Args:
+            deadline: Seconds the run may take, or None for no limit
+        """
+        if deadline is None:
+            self.client.deadline = None
+        else:
+            logger.info(f"Collection deadline in {deadline:.0f}s")
+            self.client.deadline = time.monotonic() + deadline
+    
+    @staticmethod
+    def _mark_partial(collection: Dict) -> Dict:
+        """
+        Flag a collection document that misses entries because of the deadline
+        
+        Args:
+            collection: Document built by collect_all_metrics
+            
+        Returns:
+            The same document, with 'deadline_exceeded': True if entries are missing
+        """
+        missing = 0
+        for cluster in collection['clusters']:
+            if cluster.get('cluster_level_metrics', {}).get('deadline_exceeded'):
+                missing += 1
+            missing += sum(
+                1 for project in cluster.get('project_level_metrics', [])
+                if project.get('deadline_exceeded')
+            )
+        if missing:
+            logger.warning(f"Collection deadline exceeded; {missing} entries are incomplete")
+            collection['deadline_exceeded'] = True
+        return collection
+    
+    def _extract_gpu_utilization(self, metrics_data: Dict) -> float:
+        """
+        Extract GPU utilization from project metrics data
+        
+        Args:
+            metrics_data: Raw metrics data from API
+            
+        Returns:
+            GPU utilization percentage (0-100); see UtilizationResolver.resolve
+        """
+        return self.utilization_resolver.resolve(metrics_data)[0]
+    
+    def _new_collection(self, start_time: datetime, end_time: datetime) -> Dict:
+        """
+        Create the top-level document returned by collect_all_metrics
+        
+        Args:
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Returns:
+            Collection document with an empty cluster list, and the shard it
+            covers when sharded
+        """
+        collection = {
+            'collection_timestamp': datetime.now().isoformat(),
+            'time_range': {
+                'start': start_time.isoformat(),
+                'end': end_time.isoformat()
+            },
+            'clusters': []
+        }
+        if self.shard_count > 1:
+            collection['shard'] = {'index': self.shard_index, 'count': self.shard_count}
+        return collection
+    
+    @staticmethod
+    def _new_cluster_entry(cluster: Dict) -> Dict:
+        """
+        Create the per-cluster entry of the collection document
+        
+        Args:
+            cluster: Cluster information as returned by get_clusters
+            
+        Returns:
+            Cluster entry with empty cluster and project metrics
+        """
+        cluster_id = cluster.get('uuid') or cluster.get('id')
+        return {
+            'cluster_uuid': cluster_id,
+            'cluster_name': cluster.get('name', cluster_id),
+            'cluster_level_metrics': {},
+            'project_level_metrics': []
+        }
+    
+    @staticmethod
+    def _assemble_clusters(records: Iterable[Dict]) -> List[Dict]:
+        """
+        Build cluster entries of the collection document from cluster and project records
+        
+        Args:
+            records: Records of one or more clusters, each cluster record
+                followed by the cluster's project records
+            
+        Returns:
+            Cluster entries in record order
+        """
+        clusters = []
+        for record in records:
+            record_type = record.pop('record_type')
+            if record_type == 'cluster':
+                record['project_level_metrics'] = []
+                clusters.append(record)
+            else:
+                del record['cluster_name']
+                clusters[-1]['project_level_metrics'].append(record)
+        return clusters
+    
+    @staticmethod
+    def _is_incomplete(record: Dict) -> bool:
+        """Whether a record is flagged with 'deadline_exceeded'"""
+        return bool(record.get('deadline_exceeded') or
+                    record.get('cluster_level_metrics', {}).get('deadline_exceeded'))
+    
+    def collect_cluster(self, cluster: Dict, start_time: datetime,
+                        end_time: datetime) -> Dict:
+        """
+        Collect cluster-level and project-level metrics for one cluster
+        
+        In parallel mode the cluster-level request runs alongside the
+        project-level collection instead of before it.
+        
+        Args:
+            cluster: Cluster information as returned by get_clusters
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Returns:
+            Dictionary containing the cluster's metrics
+        """
+        return self._assemble_clusters(
+            self._iter_cluster_records(cluster, start_time, end_time)
+        )[0]
+    
+    def _iter_cluster_records(self, cluster: Dict, start_time: datetime,
+                              end_time: datetime) -> Iterator[Dict]:
+        """
+        Yield the cluster record of one cluster, then its project records
+        
+        Failures are reported as records with an 'error' instead of raised.
+        In parallel mode the cluster-level request runs alongside the first
+        project requests instead of before them.
+        
+        Args:
+            cluster: Cluster information as returned by get_clusters
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Yields:
+            One 'cluster' record, then one 'project' record per project
+        """
+        entry = self._new_cluster_entry(cluster)
+        cluster_id = entry['cluster_uuid']
+        cluster_name = entry['cluster_name']
+        
+        logger.info(f"Processing cluster: {cluster_name} ({cluster_id})")
+        
+        def collect_cluster_level() -> Dict:
+            try:
+                # Collect cluster-level metrics
+                return self.collect_cluster_gpu_metrics(
+                    cluster_uuid=cluster_id,
+                    start_time=start_time,
+                    end_time=end_time
+                )
+            except Exception as e:
+                logger.error(f"Failed to collect cluster metrics for {cluster_name}: {e}")
+                return self._error_entry(e)
+        
+        def project_records() -> Iterator[Dict]:
+            try:
+                # Collect project-level metrics
+                for project_metric in self.iter_project_gpu_metrics(cluster_id, start_time, end_time):
+                    yield {'record_type': 'project', 'cluster_name': cluster_name, **project_metric}
+            except Exception as e:
+                logger.error(f"Failed to collect project metrics for {cluster_name}: {e}")
+                yield {
+                    'record_type': 'project',
+                    'cluster_uuid': cluster_id,
+                    'cluster_name': cluster_name,
+                    **self._error_entry(e)
+                }
+        
+        records = project_records()
+        try:
+            if self.parallel_clusters:
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    cluster_level_future = executor.submit(collect_cluster_level)
+                    # Pulling the first project starts the project requests
+                    first = list(islice(records, 1))
+                    cluster_level = cluster_level_future.result()
+            else:
+                first = []
+                cluster_level = collect_cluster_level()
+            
+            yield {
+                'record_type': 'cluster',
+                'cluster_uuid': cluster_id,
+                'cluster_name': cluster_name,
+                'cluster_level_metrics': cluster_level
+            }
+            yield from first
+            yield from records
+        finally:
+            records.close()
+    
+    def _iter_clusters_parallel(self, clusters: List[Dict], start_time: datetime,
+                                end_time: datetime) -> Iterator[Dict]:
+        """
+        Yield the records of several clusters collected in parallel
+        
+        Each cluster is collected by a worker thread into its own bounded
+        queue, and the queues are drained in cluster order. A worker waits
+        while its queue is full, so no cluster runs more than max_concurrency
+        records ahead of the consumer.
+        
+        Args:
+            clusters: Clusters as returned by get_clusters
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Yields:
+            The records of each cluster, cluster by cluster
+        """
+        done = object()
+        stop = threading.Event()
+        queues = [queue.Queue(maxsize=self.max_concurrency) for _ in clusters]
+        
+        def put(records_queue: queue.Queue, item: Any) -> bool:
+            # Give up once the consumer is gone instead of blocking forever
+            while not stop.is_set():
+                try:
+                    records_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        
+        def produce(cluster: Dict, records_queue: queue.Queue):
+            records = self._iter_cluster_records(cluster, start_time, end_time)
+            try:
+                for record in records:
+                    if not put(records_queue, record):
+                        return
+            except Exception as e:
+                put(records_queue, e)
+                return
+            finally:
+                records.close()
+            put(records_queue, done)
+        
+        executor = ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(clusters)))
+        futures = [
+            executor.submit(produce, cluster, records_queue)
+            for cluster, records_queue in zip(clusters, queues)
+        ]
+        try:
+            for records_queue in queues:
+                while True:
+                    record = records_queue.get()
+                    if record is done:
+                        break
+                    if isinstance(record, Exception):
+                        raise record
+                    yield record
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+    
+    def iter_all_metrics(self, cluster_uuid: Optional[str] = None,
+                         hours_back: int = 1, deadline: Optional[float] = None) -> Iterator[Dict]:
+        """
+        Collect all GPU metrics, yielding each record as it completes
+        
+        The first record is the collection header, followed by each
+        cluster's 'cluster' record and its 'project' records, cluster by
+        cluster in get_clusters order. Every record carries a 'record_type'
+        of 'collection', 'cluster' or 'project'. Collection only runs a
+        bounded number of records ahead of the consumer, so a slow consumer
+        such as a database writer throttles the API requests, and nothing is
+        retained after a record has been consumed. Closing the iterator
+        early stops the collection.
+        
+        Args:
+            cluster_uuid: Specific cluster UUID, or None to collect from all clusters
+            hours_back: How many hours back to collect metrics
+            deadline: Optional seconds the run may take (see collect_all_metrics)
+            
+        Yields:
+            Collection, cluster and project records
+        """
+        end_time = datetime.now()
+        start_time = end_time - timedelta(hours=hours_back)
+        
+        logger.info(f"Collecting metrics from {start_time} to {end_time}")
+        
+        header = self._new_collection(start_time, end_time)
+        del header['clusters']
+        
+        self._start_deadline(deadline)
+        try:
+            yield {'record_type': 'collection', **header}
+            
+            # Get clusters to process
+            if cluster_uuid:
+                clusters_to_process = [{'uuid': cluster_uuid}]
+            else:
+                clusters_to_process = self._api_call(self.client.get_clusters)
+            
+            if self.parallel_clusters and len(clusters_to_process) > 1:
+                yield from self._iter_clusters_parallel(clusters_to_process, start_time, end_time)
+            else:
+                for cluster in clusters_to_process:
+                    yield from self._iter_cluster_records(cluster, start_time, end_time)
+        finally:
+            self.client.deadline = None
+            self.utilization_resolver.report()
+    
+    def collect_all_metrics(self, cluster_uuid: Optional[str] = None,
+                          hours_back: int = 1, deadline: Optional[float] = None) -> Dict:
+        """
+        Collect all GPU metrics (cluster and project level)
+        
+        Args:
+            cluster_uuid: Specific cluster UUID, or None to collect from all clusters
+            hours_back: How many hours back to collect metrics
+            deadline: Optional seconds the run may take. Once they are up no
+                new request is sent, in-flight requests time out, and the
+                entries collected so far are returned; the missing ones are
+                flagged with 'deadline_exceeded'.
+            
+        Returns:
+            Dictionary containing all collected metrics
+        """
+        records = self.iter_all_metrics(cluster_uuid, hours_back, deadline)
+        try:
+            all_metrics = next(records)
+            del all_metrics['record_type']
+            all_metrics['clusters'] = self._assemble_clusters(records)
+            return self._mark_partial(all_metrics)
+            
+        except Exception as e:
+            logger.error(f"Failed to collect metrics: {e}")
+            raise
+        
+        finally:
+            records.close()
+    
+    def stream_all_metrics(self, write_record: Callable[[Dict], None],
+                           cluster_uuid: Optional[str] = None,
+                           hours_back: int = 1, deadline: Optional[float] = None) -> Dict:
+        """
+        Collect all GPU metrics, handing each record to write_record as it completes
+        
+        Records are those of iter_all_metrics; write_record is called from
+        the calling thread, and a slow write_record throttles the collection.
+        
+        Args:
+            write_record: Callable receiving each record
+            cluster_uuid: Specific cluster UUID, or None to collect from all clusters
+            hours_back: How many hours back to collect metrics
+            deadline: Optional seconds the run may take (see collect_all_metrics)
+            
+        Returns:
+            Summary with the number of clusters and projects written and the
+            number of records flagged with 'deadline_exceeded' ('incomplete')
+        """
+        summary = {'clusters': 0, 'projects': 0, 'incomplete': 0}
+        for record in self.iter_all_metrics(cluster_uuid, hours_back, deadline):
+            if record['record_type'] == 'cluster':
+                summary['clusters'] += 1
+            elif record['record_type'] == 'project' and 'project_name' in record:
+                summary['projects'] += 1
+            if self._is_incomplete(record):
+                summary['incomplete'] += 1
+            write_record(record)
+        return summary
+
+
+class AsyncGPUMetricsCollector(GPUMetricsCollector):
+    """asyncio counterpart of GPUMetricsCollector
+    
+    Drives all clusters and projects from a single thread. The collect_*
+    methods are coroutines; the record format is identical to the sync
+    collector.
+    """
+    
+    def __init__(self, client: AsyncRunAIAPIClient, max_concurrency: int = 100,
+                 output_profile: str = 'full', store: Optional[MetricsStore] = None,
+                 step: Optional[timedelta] = None, max_samples_per_request: int = 500,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 skip_idle_projects: bool = False, nodepool_breakdown: bool = False,
+                 shard_index: int = 0, shard_count: int = 1, compact_series: bool = False,
+                 parallel_clusters: bool = True):
+        """
+        Initialize the async metrics collector
+        
+        Args:
+            client: Async RunAI API client
+            max_concurrency: Maximum number of API requests in flight at once
+            output_profile: One of GPUMetricsCollector.OUTPUT_PROFILES
+            store: Optional local time-series store
+            step: Optional sample resolution for windowed queries
+            max_samples_per_request: Upper bound on numberOfSamples per window
+            circuit_breaker: Optional breaker for failing cluster endpoints
+            skip_idle_projects: Skip requests for projects without allocated GPUs
+            nodepool_breakdown: Also fetch each project's metrics per nodepool
+            shard_index: Shard collected by this instance
+            shard_count: Number of collector instances sharing the work
+            compact_series: Keep sampled series as CompactSeries arrays
+            parallel_clusters: Collect all clusters concurrently; otherwise a
+                cluster starts once the records of the previous one are drained
+        """
+        super().__init__(
+            client,
+            max_concurrency=max_concurrency,
+            parallel_clusters=parallel_clusters,
+            output_profile=output_profile,
+            store=store,
+            step=step,
+            max_samples_per_request=max_samples_per_request,
+            circuit_breaker=circuit_breaker,
+            skip_idle_projects=skip_idle_projects,
+            nodepool_breakdown=nodepool_breakdown,
+            shard_index=shard_index,
+            shard_count=shard_count,
+            compact_series=compact_series
+        )
+        self._request_slots = asyncio.Semaphore(self.max_concurrency)
+    
+    async def _api_call(self, func, *args, **kwargs):
+        """Await a client coroutine while holding one slot of the request budget"""
+        async with self._request_slots:
+            return await func(*args, **kwargs)
+    
+    async def _guarded_call(self, circuit: Tuple[str, str], func, *args, **kwargs):
+        """Await a cluster endpoint through the circuit breaker, if one is configured"""
+        if self.circuit_breaker is None:
+            return await self._api_call(func, *args, **kwargs)
+        
+        name = CircuitBreaker.circuit_name(*circuit)
+        self.circuit_breaker.before_call(name)
+        try:
+            result = await self._api_call(func, *args, **kwargs)
+        except Exception as e:
+            self._record_failure(name, e)
+            raise
+        except BaseException:
+            # Cancelled or interrupted: nothing is known about the endpoint
+            self.circuit_breaker.release(name)
+            raise
+        self.circuit_breaker.record(name, True)
+        return result
+    
+    async def _fetch_cluster_metrics(self, cluster_uuid: str, start_time: datetime,
+                                     end_time: datetime) -> Dict:
+        """
+        Fetch cluster metrics, splitting long ranges into concurrent windows if a step is set
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Returns:
+            Cluster metrics data
+        """
+        windows = self._plan_windows(start_time, end_time) or [(start_time, end_time, None)]
+        responses = await asyncio.gather(*(
+            self._guarded_call(
+                (cluster_uuid, 'cluster_metrics'),
+                self.client.get_cluster_metrics,
+                cluster_uuid=cluster_uuid,
+                metric_types=self.CLUSTER_METRIC_TYPES,
+                start_time=window_start,
+                end_time=window_end,
+                **({'number_of_samples': samples} if samples else {})
+            )
+            for window_start, window_end, samples in windows
+        ))
+        return responses[0] if self.step is None else merge_cluster_metrics(list(responses))
+    
+    async def _fetch_project_metrics(self, cluster_uuid: str, project_id: str,
+                                     start_time: datetime, end_time: datetime,
+                                     nodepool_name: Optional[str] = None) -> Dict:
+        """
+        Fetch project metrics, splitting long ranges into concurrent windows if a step is set
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            project_id: Project ID
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            nodepool_name: Optional nodepool filter
+            
+        Returns:
+            Project metrics data
+        """
+        nodepool = {'nodepool_name': nodepool_name} if nodepool_name else {}
+        windows = self._plan_windows(start_time, end_time) or [(start_time, end_time, None)]
+        responses = await asyncio.gather(*(
+            self._guarded_call(
+                (cluster_uuid, 'project_metrics'),
+                self.client.get_project_metrics,
+                cluster_uuid=cluster_uuid,
+                project_id=project_id,
+                start_time=window_start,
+                end_time=window_end,
+                **({'number_of_samples': samples} if samples else {}),
+                **nodepool
+            )
+            for window_start, window_end, samples in windows
+        ))
+        return responses[0] if self.step is None else merge_project_metrics(list(responses))
+    
+    async def _discover_nodepools(self, cluster_uuid: str) -> List[str]:
+        """List the nodepool names of a cluster (see GPUMetricsCollector)"""
+        if not self.nodepool_breakdown:
+            return []
+        try:
+            nodepools = await self._guarded_call(
+                (cluster_uuid, 'nodepools'), self.client.get_nodepools, cluster_uuid
+            )
+        except Exception as e:
+            logger.warning(f"Failed to list nodepools of cluster {cluster_uuid}: {e}")
+            return []
+        names = self._nodepool_names(nodepools)
+        logger.info(f"Found {len(names)} nodepools")
+        return names
+    
+    async def _collect_nodepool_metrics(self, cluster_uuid: str, project_id: str,
+                                        nodepools: List[str], start_time: datetime,
+                                        end_time: datetime) -> Dict[str, Dict]:
+        """Fetch the metrics of one project in every nodepool concurrently"""
+        async def fetch(nodepool: str) -> Dict:
+            try:
+                return self._build_nodepool_metrics(await self._fetch_project_metrics(
+                    cluster_uuid, project_id, start_time, end_time, nodepool_name=nodepool
+                ))
+            except Exception as e:
+                logger.warning(f"Failed to get metrics for project {project_id} "
+                               f"in nodepool {nodepool}: {e}")
+                return self._error_entry(e)
+        
+        results = await asyncio.gather(*(fetch(nodepool) for nodepool in nodepools))
+        return dict(zip(nodepools, results))
+    
+    async def collect_cluster_gpu_metrics(self, cluster_uuid: str,
+                                          start_time: datetime, end_time: datetime) -> Dict:
+        """
+        Collect cluster-level GPU metrics
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Returns:
+            Dictionary containing cluster GPU metrics
+        """
+        logger.info(f"Collecting cluster GPU metrics for {cluster_uuid}")
+        
+        owner = self._cluster_owner(cluster_uuid)
+        if owner != self.shard_index:
+            logger.info(f"Cluster-level metrics of {cluster_uuid} are collected by shard {owner}")
+            return {'shard': owner}
+        
+        requested_start = start_time
+        start_time = self._incremental_start(
+            cluster_uuid, None, self.CLUSTER_METRIC_TYPES, start_time, end_time
+        )
+        
+        try:
+            metrics_data = await self._fetch_cluster_metrics(cluster_uuid, start_time, end_time)
+            self._store_cluster_samples(cluster_uuid, metrics_data)
+            
+            return self._note_requested_start(self._build_cluster_metrics(
+                cluster_uuid, metrics_data, start_time, end_time
+            ), requested_start)
+            
+        except Exception as e:
+            logger.error(f"Failed to collect cluster metrics: {e}")
+            raise
+    
+    async def collect_project_gpu_metrics(self, cluster_uuid: str,
+                                          start_time: datetime, end_time: datetime) -> List[Dict]:
+        """
+        Collect project-level GPU metrics, fetching projects concurrently
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Returns:
+            List of dictionaries containing project GPU metrics
+        """
+        logger.info(f"Collecting project GPU metrics for cluster {cluster_uuid}")
+        
+        try:
+            return [
+                project_metric
+                async for project_metric in self.iter_project_gpu_metrics(
+                    cluster_uuid, start_time, end_time
+                )
+            ]
+            
+        except Exception as e:
+            logger.error(f"Failed to collect project metrics: {e}")
+            raise
+    
+    async def iter_project_gpu_metrics(self, cluster_uuid: str, start_time: datetime,
+                                       end_time: datetime) -> AsyncIterator[Dict]:
+        """
+        Yield project-level GPU metrics in plan order as they are fetched
+        
+        At most twice max_concurrency project tasks run ahead of the
+        consumer; the next one is started as each record is taken.
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Yields:
+            Dictionary containing the GPU metrics of one project
+        """
+        projects, quotas = await asyncio.gather(
+            self._guarded_call(
+                (cluster_uuid, 'projects'), self.client.get_projects, cluster_uuid
+            ),
+            self._guarded_call(
+                (cluster_uuid, 'quotas'), self.client.get_projects_quotas, cluster_uuid
+            )
+        )
+        logger.info(f"Found {len(projects)} projects")
+        
+        quota_lookup = {quota['name']: quota for quota in quotas}
+        projects, idle_projects = self._plan_projects(cluster_uuid, projects, quota_lookup)
+        nodepools = await self._discover_nodepools(cluster_uuid)
+        
+        remaining = iter(projects)
+        pending = deque()
+        
+        def schedule(count: int):
+            for project in islice(remaining, count):
+                pending.append(asyncio.ensure_future(self._collect_single_project_metrics(
+                    cluster_uuid, project, quota_lookup, start_time, end_time,
+                    nodepools=nodepools
+                )))
+        
+        schedule(2 * self.max_concurrency)
+        try:
+            while pending:
+                project_metric = await pending.popleft()
+                schedule(1)
+                yield project_metric
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        for project in idle_projects:
+            yield self._build_idle_project_metrics(
+                cluster_uuid, project, quota_lookup, start_time, end_time
+            )
+    
+    async def _collect_single_project_metrics(self, cluster_uuid: str, project: Dict,
+                                              quota_lookup: Dict[str, Dict],
+                                              start_time: datetime, end_time: datetime,
+                                              nodepools: Optional[List[str]] = None) -> Dict:
+        """
+        Collect GPU metrics for a single project
+        
+        Args:
+            cluster_uuid: Cluster UUID
+            project: Project information as returned by get_projects
+            quota_lookup: Project quotas keyed by project name
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            nodepools: Nodepools to break the project's metrics down by, if any
+            
+        Returns:
+            Dictionary containing the project GPU metrics, or an error entry
+        """
+        project_name, project_id = self._project_identity(project)
+        
+        logger.debug(f"Processing project: {project_name} (ID: {project_id})")
+        
+        project_start = self._incremental_start(
+            cluster_uuid, str(project_id), self.PROJECT_METRIC_NAMES, start_time, end_time
+        )
+        
+        try:
+            metrics_data = await self._fetch_project_metrics(
+                cluster_uuid, str(project_id), project_start, end_time
+            )
+            
+            project_metric, utilization_series = self._build_project_metrics(
+                cluster_uuid, project_name, project_id, metrics_data,
+                quota_lookup.get(project_name, {}), project_start, end_time
+            )
+            self._note_requested_start(project_metric, start_time)
+            if nodepools:
+                project_metric['nodepool_metrics'] = await self._collect_nodepool_metrics(
+                    cluster_uuid, str(project_id), nodepools, project_start, end_time
+                )
+            self._store_project_samples(project_metric, utilization_series)
+            return project_metric
+            
+        except Exception as e:
+            # Projects skipped by an open circuit are summarized by the breaker
+            log = logger.debug if isinstance(e, CircuitOpenError) else logger.warning
+            log(f"Failed to get metrics for project {project_name}: {e}")
+            return self._build_project_error(
+                cluster_uuid, project_name, project_id,
+                quota_lookup.get(project_name, {}), e
+            )
+    
+    async def collect_cluster(self, cluster: Dict, start_time: datetime,
+                              end_time: datetime) -> Dict:
+        """
+        Collect cluster-level and project-level metrics for one cluster
+        
+        Args:
+            cluster: Cluster information as returned by get_clusters
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Returns:
+            Dictionary containing the cluster's metrics
+        """
+        return self._assemble_clusters([
+            record async for record in self._iter_cluster_records(cluster, start_time, end_time)
+        ])[0]
+    
+    async def _iter_cluster_records(self, cluster: Dict, start_time: datetime,
+                                    end_time: datetime) -> AsyncIterator[Dict]:
+        """
+        Yield the cluster record of one cluster, then its project records
+        
+        The cluster-level request runs alongside the first project requests.
+        
+        Args:
+            cluster: Cluster information as returned by get_clusters
+            start_time: Start time for metrics collection
+            end_time: End time for metrics collection
+            
+        Yields:
+            One 'cluster' record, then one 'project' record per project
+        """
+        entry = self._new_cluster_entry(cluster)
+        cluster_id = entry['cluster_uuid']
+        cluster_name = entry['cluster_name']
+        
+        logger.info(f"Processing cluster: {cluster_name} ({cluster_id})")
+        
+        async def collect_cluster_level() -> Dict:
+            try:
+                return await self.collect_cluster_gpu_metrics(cluster_id, start_time, end_time)
+            except Exception as e:
+                logger.error(f"Failed to collect cluster metrics for {cluster_name}: {e}")
+                return self._error_entry(e)
+        
+        async def project_records() -> AsyncIterator[Dict]:
+            try:
+                async for project_metric in self.iter_project_gpu_metrics(
+                    cluster_id, start_time, end_time
+                ):
+                    yield {'record_type': 'project', 'cluster_name': cluster_name, **project_metric}
+            except Exception as e:
+                logger.error(f"Failed to collect project metrics for {cluster_name}: {e}")
+                yield {
+                    'record_type': 'project',
+                    'cluster_uuid': cluster_id,
+                    'cluster_name': cluster_name,
+                    **self._error_entry(e)
+                }
+        
+        cluster_level_task = asyncio.ensure_future(collect_cluster_level())
+        records = project_records()
+        try:
+            # Pulling the first project starts the project requests
+            first = []
+            try:
+                first.append(await records.__anext__())
+            except StopAsyncIteration:
+                pass
+            
+            yield {
+                'record_type': 'cluster',
+                'cluster_uuid': cluster_id,
+                'cluster_name': cluster_name,
+                'cluster_level_metrics': await cluster_level_task
+            }
+            for record in first:
+                yield record
+            async for record in records:
+                yield record
+        finally:
+            cluster_level_task.cancel()
+            await records.aclose()
+    
+    async def iter_all_metrics(self, cluster_uuid: Optional[str] = None,
+                               hours_back: int = 1,
+                               deadline: Optional[float] = None) -> AsyncIterator[Dict]:
+        """
+        Collect all GPU metrics, yielding each record as it completes
+        
+        Same records and order as GPUMetricsCollector.iter_all_metrics. With
+        parallel_clusters all clusters are collected concurrently, each into a
+        queue of at most max_concurrency records that is drained in cluster
+        order; otherwise each cluster is started when its queue is drained.
+        
+        Args:
+            cluster_uuid: Specific cluster UUID, or None to collect from all clusters
+            hours_back: How many hours back to collect metrics
+            deadline: Optional seconds the run may take (see GPUMetricsCollector)
+            
+        Yields:
+            Collection, cluster and project records
+        """
+        end_time = datetime.now()
+        start_time = end_time - timedelta(hours=hours_back)
+        
+        logger.info(f"Collecting metrics from {start_time} to {end_time}")
+        
+        header = self._new_collection(start_time, end_time)
+        del header['clusters']
+        
+        self._start_deadline(deadline)
+        try:
+            yield {'record_type': 'collection', **header}
+            
+            if cluster_uuid:
+                clusters_to_process = [{'uuid': cluster_uuid}]
+            else:
+                clusters_to_process = await self._api_call(self.client.get_clusters)
+            
+            done = object()
+            queues = [asyncio.Queue(maxsize=self.max_concurrency) for _ in clusters_to_process]
+            
+            async def produce(cluster: Dict, records_queue: asyncio.Queue):
+                try:
+                    async for record in self._iter_cluster_records(cluster, start_time, end_time):
+                        await records_queue.put(record)
+                except Exception as e:
+                    await records_queue.put(e)
+                    return
+                await records_queue.put(done)
+            
+            producers = []
+            if self.parallel_clusters:
+                producers = [
+                    asyncio.ensure_future(produce(cluster, records_queue))
+                    for cluster, records_queue in zip(clusters_to_process, queues)
+                ]
+            try:
+                for cluster, records_queue in zip(clusters_to_process, queues):
+                    if not self.parallel_clusters:
+                        producers.append(asyncio.ensure_future(produce(cluster, records_queue)))
+                    while True:
+                        record = await records_queue.get()
+                        if record is done:
+                            break
+                        if isinstance(record, Exception):
+                            raise record
+                        yield record
+            finally:
+                for producer in producers:
+                    producer.cancel()
+                await asyncio.gather(*producers, return_exceptions=True)
+        finally:
+            self.client.deadline = None
+            self.utilization_resolver.report()
+    
+    async def collect_all_metrics(self, cluster_uuid: Optional[str] = None,
+                                  hours_back: int = 1, deadline: Optional[float] = None) -> Dict:
+        """
+        Collect all GPU metrics (cluster and project level)
+        
+        Args:
+            cluster_uuid: Specific cluster UUID, or None to collect from all clusters
+            hours_back: How many hours back to collect metrics
+            deadline: Optional seconds the run may take (see GPUMetricsCollector)
+            
+        Returns:
+            Dictionary containing all collected metrics
+        """
+        records = self.iter_all_metrics(cluster_uuid, hours_back, deadline)
+        try:
+            all_metrics = await records.__anext__()
+            del all_metrics['record_type']
+            all_metrics['clusters'] = self._assemble_clusters([record async for record in records])
+            return self._mark_partial(all_metrics)
+            
+        except Exception as e:
+            logger.error(f"Failed to collect metrics: {e}")
+            raise
+        
+        finally:
+            await records.aclose()
+    
+    async def stream_all_metrics(self, write_record: Callable[[Dict], None],
+                                 cluster_uuid: Optional[str] = None,
+                                 hours_back: int = 1, deadline: Optional[float] = None) -> Dict:
+        """
+        Collect all GPU metrics, handing each record to write_record as it completes
+        
+        Same summary as GPUMetricsCollector.stream_all_metrics. write_record is
+        a plain callable run on the event loop, so a slow write_record
+        throttles the collection.
+        
+        Args:
+            write_record: Callable receiving each record
+            cluster_uuid: Specific cluster UUID, or None to collect from all clusters
+            hours_back: How many hours back to collect metrics
+            deadline: Optional seconds the run may take (see GPUMetricsCollector)
+            
+        Returns:
+            Summary with the number of clusters and projects written and the
+            number of records flagged with 'deadline_exceeded' ('incomplete')
+        """
+        summary = {'clusters': 0, 'projects': 0, 'incomplete': 0}
+        records = self.iter_all_metrics(cluster_uuid, hours_back, deadline)
+        try:
+            async for record in records:
+                if record['record_type'] == 'cluster':
+                    summary['clusters'] += 1
+                elif record['record_type'] == 'project' and 'project_name' in record:
+                    summary['projects'] += 1
+                if self._is_incomplete(record):
+                    summary['incomplete'] += 1
+                write_record(record)
+        finally:
+            await records.aclose()
+        return summary
+    
+    def _iter_clusters_parallel(self, clusters: List[Dict], start_time: datetime,
+                                end_time: datetime) -> Iterator[Dict]:
+        """Thread-based cluster fan-out of the sync collector; iter_all_metrics replaces it here"""
+        raise NotImplementedError(
+            "AsyncGPUMetricsCollector collects clusters concurrently in iter_all_metrics"
+        )
+
+
+def run_async_collection(base_url: str, token: str, verify_ssl: bool = True,
+                         max_concurrency: int = 100,
+                         cluster_uuid: Optional[str] = None,
+                         hours_back: int = 1,
+                         output_profile: str = 'full',
+                         store: Optional[MetricsStore] = None,
+                         step: Optional[timedelta] = None,
+                         max_samples_per_request: int = 500,
+                         circuit_breaker: Optional[CircuitBreaker] = None,
+                         connect_timeout: float = 10, read_timeout: float = 60,
+                         deadline: Optional[float] = None,
+                         skip_idle_projects: bool = False,
+                         nodepool_breakdown: bool = False,
+                         shard_index: int = 0, shard_count: int = 1,
+                         prune_metrics: bool = False, compact_series: bool = False,
+                         cache: Optional[ResponseCache] = None,
+                         cache_ttls: Optional[Dict[str, float]] = None,
+                         parallel_clusters: bool = True) -> Dict:
+    """
+    Run the async collector to completion from synchronous code
+    
+    Args:
+        base_url: RunAI base URL
+        token: Bearer token for authentication
+        verify_ssl: Whether to verify SSL certificates
+        max_concurrency: Maximum number of API requests in flight at once
+        cluster_uuid: Specific cluster UUID, or None to collect from all clusters
+        hours_back: How many hours back to collect metrics
+        output_profile: One of GPUMetricsCollector.OUTPUT_PROFILES
+        store: Optional local time-series store
+        step: Optional sample resolution for windowed queries
+        max_samples_per_request: Upper bound on numberOfSamples per window
+        circuit_breaker: Optional breaker for failing cluster endpoints
+        connect_timeout: Seconds to wait for a connection to be established
+        read_timeout: Seconds to wait for the server between bytes of a response
+        deadline: Optional seconds the run may take
+        skip_idle_projects: Skip requests for projects without allocated GPUs
+        nodepool_breakdown: Also fetch each project's metrics per nodepool
+        shard_index: Shard collected by this instance
+        shard_count: Number of collector instances sharing the work
+        prune_metrics: Decode only the fields of metrics responses that are used
+        compact_series: Keep sampled series as CompactSeries arrays
+        cache: Optional on-disk cache for inventory listings
+        cache_ttls: Per-endpoint TTL overrides of the cache
+        parallel_clusters: Collect all clusters concurrently
+        
+    Returns:
+        Dictionary containing all collected metrics
+    """
+    async def run() -> Dict:
+        async with AsyncRunAIAPIClient(
+            base_url=base_url,
+            token=token,
+            verify_ssl=verify_ssl,
+            pool_maxsize=max_concurrency,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            prune_metrics=prune_metrics,
+            cache=cache,
+            cache_ttls=cache_ttls
+        ) as client:
+            collector = AsyncGPUMetricsCollector(
+                client,
+                max_concurrency=max_concurrency,
+                output_profile=output_profile,
+                store=store,
+                step=step,
+                max_samples_per_request=max_samples_per_request,
+                circuit_breaker=circuit_breaker,
+                skip_idle_projects=skip_idle_projects,
+                nodepool_breakdown=nodepool_breakdown,
+                shard_index=shard_index,
+                shard_count=shard_count,
+                compact_series=compact_series,
+                parallel_clusters=parallel_clusters
+            )
+            return await collector.collect_all_metrics(
+                cluster_uuid=cluster_uuid,
+                hours_back=hours_back,
+                deadline=deadline
+            )
+    
+    return asyncio.run(run())
+
+
+def merge_shard_files(paths: List[str], output_file: Optional[str] = None) -> int:
+    """
+    Merge the JSON outputs of --shard-index runs into one collection document
+    
+    Args:
+        paths: Output files of all shards
+        output_file: File to write the merged document to, or None for stdout
+        
+    Returns:
+        Process exit code
+    """
+    documents = []
+    try:
+        for path in paths:
+            with open(path, 'r') as f:
+                documents.append(json.load(f))
+        merged = merge_shard_documents(documents)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Failed to merge shard outputs: {e}")
+        return 1
+    
+    if output_file:
+        with open(output_file, 'w') as f:
+            json.dump(merged, f, indent=2)
+        logger.info(f"Merged metrics saved to {output_file}")
+    else:
+        print(json.dumps(merged, indent=2))
+    return 0
+
+
+def main():
+    """Main function to run the metrics collector"""
+    parser = argparse.ArgumentParser(description='Collect GPU metrics from RunAI API')
+    parser.add_argument('--base-url', 
+                       default=os.environ.get('RUNAI_BASE_URL'),
                        help='RunAI base URL (e.g., https://app.run.ai). Can also use RUNAI_BASE_URL env var.')
     parser.add_argument('--token', 
                        default=os.environ.get('RUNAI_TOKEN'),
@@ -491,21 +2969,251 @@ def main():
                        help='Specific cluster UUID to collect metrics from')
     parser.add_argument('--hours-back', type=int, default=1,
                        help='How many hours back to collect metrics (default: 1)')
+    parser.add_argument('--step', type=parse_duration,
+                       help='Sample resolution such as 30s, 5m or 1h. Long ranges are split '
+                            'into windows fetched in parallel and merged')
+    parser.add_argument('--max-samples-per-request', type=int, default=500,
+                       help='Maximum samples requested per window with --step (default: 500)')
     parser.add_argument('--output-file',
                        help='Output file to save metrics (JSON format)')
+    parser.add_argument('--output-format', choices=['json', 'ndjson'], default='json',
+                       help='json: one document written at the end (default); '
+                            'ndjson: one compact record per cluster/project, streamed as collected')
+    parser.add_argument('--output-profile', choices=GPUMetricsCollector.OUTPUT_PROFILES,
+                       default='full',
+                       help='summary: current values only; series: plus sampled series; '
+                            'full: plus raw quota payloads (default: full)')
     parser.add_argument('--no-ssl-verify', action='store_true',
                        help='Disable SSL certificate verification')
+    parser.add_argument('--statistics', nargs='?', const=','.join(DEFAULT_STATISTICS),
+                       help='Add per-series statistics, e.g. mean,p50,p95,max,idle_fraction '
+                            '(default set if no list is given); needs the series or full profile')
+    parser.add_argument('--idle-threshold', type=float, default=1.0,
+                       help='Utilization percentage at or below which a sample counts as idle '
+                            'for idle_fraction (default: 1.0)')
+    parser.add_argument('--accounting', metavar='LEDGER_FILE',
+                       help='JSON ledger accumulating allocated and used GPU-hours per '
+                            'cluster, project and month across runs')
+    parser.add_argument('--accounting-max-gap', type=float, default=DEFAULT_MAX_GAP,
+                       metavar='SECONDS',
+                       help='Longest interval between two samples that is counted as '
+                            f'GPU-hours (default: {DEFAULT_MAX_GAP})')
+    parser.add_argument('--dcgm-target', action='append', default=[], metavar='[CLUSTER_UUID=]URL',
+                       help='dcgm-exporter endpoint whose profiling metrics are joined onto the '
+                            'projects, e.g. http://node-1:9400/metrics (repeatable)')
+    parser.add_argument('--dcgm-targets-file', metavar='FILE',
+                       help='File with one --dcgm-target per line')
+    parser.add_argument('--dcgm-fields', default=','.join(DEFAULT_DCGM_FIELDS),
+                       help='Comma-separated DCGM fields to join (default: '
+                            f'{",".join(DEFAULT_DCGM_FIELDS)})')
+    parser.add_argument('--dcgm-namespace-prefix', default=DEFAULT_NAMESPACE_PREFIX,
+                       help='Prefix of project namespaces, followed by the project name '
+                            f'(default: {DEFAULT_NAMESPACE_PREFIX})')
+    parser.add_argument('--dcgm-max-workers', type=int, default=32,
+                       help='DCGM exporters scraped at the same time (default: 32)')
+    parser.add_argument('--push-url',
+                       help='OTLP/HTTP metrics endpoint the collected series are pushed to, '
+                            'e.g. http://otel-collector:4318/v1/metrics')
+    parser.add_argument('--push-header', action='append', default=[], metavar='NAME=VALUE',
+                       help='Extra header of push requests, e.g. Authorization=Bearer... '
+                            '(repeatable)')
+    parser.add_argument('--push-batch-size', type=int, default=2000,
+                       help='Points per push request (default: 2000)')
+    parser.add_argument('--push-flush-interval', type=float, default=10.0,
+                       help='Longest time in seconds a point waits before it is pushed '
+                            '(default: 10)')
+    parser.add_argument('--push-queue-size', type=int, default=100000,
+                       help='Points buffered in memory for the push endpoint (default: 100000)')
+    parser.add_argument('--push-spill-dir',
+                       help='Directory for push batches that do not fit in memory or could not '
+                            'be delivered; they are sent later (default: drop them)')
+    parser.add_argument('--store',
+                       help='SQLite file for local metrics history; later runs only '
+                            'fetch samples newer than those already stored')
+    parser.add_argument('--retention', action='append', default=[], metavar='TIER=DURATION',
+                       help='How long the store keeps a tier; TIER is raw, 5m, 1h or 1d and '
+                            'DURATION e.g. 30d or forever (default: raw=7d, 5m=30d, 1h=400d, '
+                            '1d=forever)')
+    parser.add_argument('--cache-file',
+                       help='SQLite file caching cluster, project and quota listings across runs')
+    parser.add_argument('--cache-max-entries', type=int, default=1000,
+                       help='Maximum number of cached responses (default: 1000)')
+    parser.add_argument('--cache-ttl', action='append', default=[], metavar='ENDPOINT=SECONDS',
+                       help='Override a cache TTL; ENDPOINT is clusters, projects, nodepools '
+                            'or quotas (default: clusters=3600, projects=600, nodepools=600, '
+                            'quotas=60)')
+    parser.add_argument('--max-concurrency', type=int, default=1,
+                       help='Maximum number of concurrent API requests (default: 1, sequential)')
+    parser.add_argument('--skip-idle-projects', action='store_true',
+                       help='Report projects without allocated GPUs as 0%% utilization '
+                            'without a metrics request, and fetch the busiest projects first')
+    parser.add_argument('--nodepool-breakdown', action='store_true',
+                       help='Also collect project metrics per nodepool of each cluster')
+    parser.add_argument('--connect-timeout', type=float, default=10,
+                       help='Seconds to wait for an API connection (default: 10)')
+    parser.add_argument('--read-timeout', type=float, default=60,
+                       help='Seconds to wait for an API response to progress (default: 60)')
+    parser.add_argument('--deadline', type=float, metavar='SECONDS',
+                       help='Stop the run after SECONDS and output the partial results; '
+                            'missing entries are flagged with deadline_exceeded')
+    parser.add_argument('--rate-limit', type=float, metavar='RPS',
+                       help='Maximum API requests per second; also adapts concurrency to '
+                            'throttling (HTTP 429) and latency and honours Retry-After')
+    parser.add_argument('--target-latency', type=float, default=2.0,
+                       help='API latency in seconds above which --rate-limit lowers '
+                            'concurrency (default: 2.0)')
+    parser.add_argument('--breaker-error-rate', type=float, default=0.5,
+                       help='Share of failed calls that opens the circuit of a cluster '
+                            'endpoint (default: 0.5)')
+    parser.add_argument('--breaker-min-calls', type=int, default=5,
+                       help='Calls needed before the circuit breaker evaluates the '
+                            'error rate (default: 5)')
+    parser.add_argument('--breaker-cooldown', type=float, default=60,
+                       help='Seconds before an open circuit is probed again (default: 60)')
+    parser.add_argument('--breaker-state',
+                       help='JSON file keeping open circuits between runs')
+    parser.add_argument('--no-circuit-breaker', action='store_true',
+                       help='Always call every endpoint, even during an outage')
+    parser.add_argument('--shard-index', type=int, default=0,
+                       help='Shard collected by this instance, from 0 to --shard-count - 1 '
+                            '(default: 0)')
+    parser.add_argument('--shard-count', type=int, default=1,
+                       help='Number of collector instances splitting clusters and projects '
+                            'between them by a stable hash (default: 1)')
+    parser.add_argument('--merge', nargs='+', metavar='SHARD_FILE',
+                       help='Merge the JSON outputs of all shards into one document '
+                            'instead of collecting')
+    parser.add_argument('--parallel-clusters', action='store_true',
+                       help='Collect clusters in parallel within the --max-concurrency budget')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                       help='Use the asyncio collector (requires aiohttp)')
+    parser.add_argument('--serve', action='store_true',
+                       help='Run as a daemon that collects every --interval seconds and '
+                            'serves the latest values in Prometheus format and as a JSON API')
+    parser.add_argument('--interval', type=float, default=300,
+                       help='Seconds between collection cycles in --serve mode (default: 300)')
+    parser.add_argument('--listen-address', default='127.0.0.1',
+                       help='Address of the metrics endpoint in --serve mode (default: 127.0.0.1)')
+    parser.add_argument('--listen-port', type=int, default=9101,
+                       help='Port of the metrics endpoint in --serve mode (default: 9101)')
     parser.add_argument('--debug', action='store_true',
                        help='Enable debug logging')
     
     args = parser.parse_args()
     
+    if args.merge:
+        return merge_shard_files(args.merge, args.output_file)
+    
     # Validate required arguments
     if not args.base_url:
         parser.error("--base-url is required (or set RUNAI_BASE_URL environment variable)")
     if not args.token:
         parser.error("--token is required (or set RUNAI_TOKEN environment variable)")
     
+    if args.max_samples_per_request < 1:
+        parser.error("--max-samples-per-request must be at least 1")
+    if args.max_concurrency < 1:
+        parser.error("--max-concurrency must be at least 1")
+    
+    if args.connect_timeout <= 0 or args.read_timeout <= 0:
+        parser.error("--connect-timeout and --read-timeout must be positive")
+    if args.deadline is not None and args.deadline <= 0:
+        parser.error("--deadline must be positive")
+    if args.deadline is not None and args.serve:
+        parser.error("--deadline is not supported with --serve")
+    
+    if args.shard_count < 1:
+        parser.error("--shard-count must be at least 1")
+    if not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard-index must be between 0 and --shard-count - 1")
+    
+    if args.rate_limit is not None and args.rate_limit <= 0:
+        parser.error("--rate-limit must be positive")
+    if args.rate_limit is not None and args.use_async:
+        parser.error("--rate-limit is not supported with --async")
+    
+    if not 0 < args.breaker_error_rate <= 1:
+        parser.error("--breaker-error-rate must be in (0, 1]")
+    if args.breaker_min_calls < 1:
+        parser.error("--breaker-min-calls must be at least 1")
+    
+    if args.serve and args.use_async:
+        parser.error("--serve is not supported with --async")
+    if args.serve and args.interval <= 0:
+        parser.error("--interval must be positive")
+    if args.use_async and args.output_format == 'ndjson':
+        parser.error("--output-format ndjson is not supported with --async")
+    if args.use_async and aiohttp is None:
+        parser.error("--async requires aiohttp (pip install aiohttp)")
+    
+    statistics = None
+    if args.statistics:
+        try:
+            statistics = validate_statistics(
+                [name.strip() for name in args.statistics.split(',') if name.strip()]
+            )
+        except ValueError as e:
+            parser.error(f"--statistics: {e}")
+        if args.output_profile == 'summary':
+            parser.error("--statistics needs --output-profile series or full")
+    
+    ledger = None
+    if args.accounting:
+        if args.accounting_max_gap <= 0:
+            parser.error("--accounting-max-gap must be positive")
+        ledger = GPUHourLedger(max_gap=args.accounting_max_gap)
+        try:
+            ledger.load(args.accounting)
+        except (OSError, ValueError) as e:
+            parser.error(f"--accounting: cannot read {args.accounting}: {e}")
+    
+    dcgm_targets = list(args.dcgm_target)
+    if args.dcgm_targets_file:
+        try:
+            with open(args.dcgm_targets_file) as f:
+                dcgm_targets.extend(line.strip() for line in f
+                                    if line.strip() and not line.lstrip().startswith('#'))
+        except OSError as e:
+            parser.error(f"--dcgm-targets-file: {e}")
+    dcgm_fields = [field.strip() for field in args.dcgm_fields.split(',') if field.strip()]
+    if dcgm_targets and not dcgm_fields:
+        parser.error("--dcgm-fields must name at least one field")
+    if args.dcgm_max_workers <= 0:
+        parser.error("--dcgm-max-workers must be positive")
+    
+    push_headers = {}
+    for header in args.push_header:
+        name, separator, value = header.partition('=')
+        if not separator or not name:
+            parser.error("--push-header must be NAME=VALUE")
+        push_headers[name] = value
+    if not args.push_url and (push_headers or args.push_spill_dir):
+        parser.error("--push-header and --push-spill-dir need --push-url")
+    if args.push_batch_size <= 0 or args.push_queue_size <= 0 or args.push_flush_interval <= 0:
+        parser.error("--push-batch-size, --push-queue-size and --push-flush-interval must be positive")
+    
+    cache_ttls = {}
+    for override in args.cache_ttl:
+        name, _, seconds = override.partition('=')
+        if name not in RunAIAPIClient.DEFAULT_CACHE_TTLS:
+            parser.error(f"--cache-ttl endpoint must be one of "
+                         f"{', '.join(RunAIAPIClient.DEFAULT_CACHE_TTLS)}")
+        try:
+            cache_ttls[name] = float(seconds)
+        except ValueError:
+            parser.error(f"--cache-ttl {override}: seconds must be a number")
+    
+    retention = {}
+    for override in args.retention:
+        name, _, duration = override.partition('=')
+        try:
+            tier = parse_tier(name)
+            retention[tier] = None if duration == 'forever' else parse_duration(duration).total_seconds()
+        except ValueError as e:
+            parser.error(f"--retention {override}: {e}")
+    if retention and not args.store:
+        parser.error("--retention needs --store")
+    
     if args.debug:
         logging.getLogger().setLevel(logging.DEBUG)
     
@@ -513,26 +3221,205 @@ def main():
     client = RunAIAPIClient(
         base_url=args.base_url,
         token=args.token,
-        verify_ssl=not args.no_ssl_verify
+        verify_ssl=not args.no_ssl_verify,
+        pool_maxsize=max(10, args.max_concurrency),
+        cache=ResponseCache(args.cache_file, args.cache_max_entries) if args.cache_file else None,
+        cache_ttls=cache_ttls,
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout,
+        # Raw metrics payloads are only kept by the series and full profiles
+        prune_metrics=args.output_profile != 'full',
+        rate_limiter=shared_rate_limiter(
+            args.base_url,
+            rate=args.rate_limit,
+            max_concurrency=args.max_concurrency,
+            target_latency=args.target_latency
+        ) if args.rate_limit else None
     )
     
+    # Open the local metrics history, if requested
+    store = MetricsStore(args.store, retention) if args.store else None
+    
+    # Scrape DCGM exporters alongside the API, if requested
+    dcgm = DCGMScraper(
+        dcgm_targets,
+        fields=dcgm_fields,
+        namespace_prefix=args.dcgm_namespace_prefix,
+        include_pods=args.output_profile != 'summary',
+        max_workers=args.dcgm_max_workers,
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout
+    ) if dcgm_targets else None
+    
+    # Push the collected series from a background thread, if requested
+    exporter = PushExporter(
+        args.push_url,
+        headers=push_headers,
+        batch_size=args.push_batch_size,
+        flush_interval=args.push_flush_interval,
+        max_queue=args.push_queue_size,
+        spill_dir=args.push_spill_dir,
+        timeout=args.read_timeout
+    ) if args.push_url else None
+    
+    circuit_breaker = None
+    if not args.no_circuit_breaker:
+        circuit_breaker = CircuitBreaker(
+            error_rate=args.breaker_error_rate,
+            min_calls=args.breaker_min_calls,
+            cooldown=args.breaker_cooldown
+        )
+        if args.breaker_state:
+            circuit_breaker.load(args.breaker_state)
+    
     # Initialize metrics collector
-    collector = GPUMetricsCollector(client)
+    collector = GPUMetricsCollector(
+        client,
+        max_concurrency=args.max_concurrency,
+        parallel_clusters=args.parallel_clusters,
+        output_profile=args.output_profile,
+        store=store,
+        step=args.step,
+        max_samples_per_request=args.max_samples_per_request,
+        circuit_breaker=circuit_breaker,
+        skip_idle_projects=args.skip_idle_projects,
+        nodepool_breakdown=args.nodepool_breakdown,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count,
+        # Every output path encodes with json_default
+        compact_series=True
+    )
     
     try:
-        # Collect all metrics
-        metrics = collector.collect_all_metrics(
-            cluster_uuid=args.cluster_uuid,
-            hours_back=args.hours_back
-        )
+        if args.serve:
+            daemon = CollectorDaemon(
+                collector,
+                interval=args.interval,
+                hours_back=args.hours_back,
+                cluster_uuid=args.cluster_uuid,
+                ledger=ledger,
+                ledger_path=args.accounting,
+                exporter=exporter,
+                dcgm=dcgm,
+                statistics=statistics,
+                idle_threshold=args.idle_threshold
+            )
+            # A missing cluster is fetched on demand at most once per interval
+            service = QueryService(daemon.snapshot, store=store, fetch_cluster=daemon.fetch_cluster,
+                                   min_fetch_interval=args.interval)
+            server = start_http_server(daemon.snapshot, args.listen_address, args.listen_port, service)
+            try:
+                daemon.run_forever()
+            except KeyboardInterrupt:
+                logger.info("Stopping collector daemon")
+            finally:
+                server.shutdown()
+            return 0
+        
+        if args.output_format == 'ndjson':
+            # Stream records as they are collected instead of building one document
+            stream = open(args.output_file, 'w') if args.output_file else sys.stdout
+            writer = NDJSONWriter(stream)
+            write_record = writer.write
+            dcgm_scrape = dcgm.scrape_async() if dcgm is not None else None
+            if statistics or ledger is not None or exporter is not None or dcgm is not None:
+                def write_record(record: Dict):
+                    # Wrap the record as a one-cluster document for the stats and accounting stages
+                    if record['record_type'] == 'cluster':
+                        document = {'clusters': [record]}
+                    elif record['record_type'] == 'project':
+                        document = {'clusters': [{'project_level_metrics': [record]}]}
+                    else:
+                        document = None
+                    if record['record_type'] == 'project' and dcgm is not None:
+                        # The first project record waits for the scrape
+                        dcgm.annotate(document, dcgm_scrape.result())
+                    if document is not None and statistics:
+                        annotate_statistics(document, statistics, args.idle_threshold)
+                    if document is not None and ledger is not None:
+                        ledger.account(document)
+                    if exporter is not None and record['record_type'] == 'cluster':
+                        exporter.submit(record)
+                    elif exporter is not None and record['record_type'] == 'project':
+                        exporter.submit({
+                            'cluster_uuid': record.get('cluster_uuid'),
+                            'cluster_name': record.get('cluster_name'),
+                            'project_level_metrics': [record]
+                        })
+                    writer.write(record)
+            try:
+                summary = collector.stream_all_metrics(
+                    write_record,
+                    cluster_uuid=args.cluster_uuid,
+                    hours_back=args.hours_back,
+                    deadline=args.deadline
+                )
+            finally:
+                if stream is not sys.stdout:
+                    stream.close()
+            if args.output_file:
+                logger.info(f"Metrics saved to {args.output_file}")
+            logger.info(f"Streamed {summary['clusters']} clusters and "
+                        f"{summary['projects']} projects")
+            if summary['incomplete']:
+                logger.warning(f"Collection deadline exceeded; {summary['incomplete']} "
+                               f"records are incomplete")
+            return 0
+        
+        # Collect all metrics, scraping the DCGM exporters meanwhile
+        dcgm_scrape = dcgm.scrape_async() if dcgm is not None else None
+        if args.use_async:
+            metrics = run_async_collection(
+                base_url=args.base_url,
+                token=args.token,
+                verify_ssl=not args.no_ssl_verify,
+                max_concurrency=args.max_concurrency,
+                cluster_uuid=args.cluster_uuid,
+                hours_back=args.hours_back,
+                output_profile=args.output_profile,
+                store=store,
+                step=args.step,
+                max_samples_per_request=args.max_samples_per_request,
+                circuit_breaker=circuit_breaker,
+                connect_timeout=args.connect_timeout,
+                read_timeout=args.read_timeout,
+                deadline=args.deadline,
+                skip_idle_projects=args.skip_idle_projects,
+                nodepool_breakdown=args.nodepool_breakdown,
+                shard_index=args.shard_index,
+                shard_count=args.shard_count,
+                prune_metrics=args.output_profile != 'full',
+                compact_series=True,
+                cache=client.cache,
+                cache_ttls=cache_ttls,
+                parallel_clusters=args.parallel_clusters
+            )
+        else:
+            metrics = collector.collect_all_metrics(
+                cluster_uuid=args.cluster_uuid,
+                hours_back=args.hours_back,
+                deadline=args.deadline
+            )
+        
+        if dcgm_scrape is not None:
+            matched = dcgm.annotate(metrics, dcgm_scrape.result())
+            logger.info(f"Joined DCGM metrics onto {matched} projects")
+        if statistics:
+            annotate_statistics(metrics, statistics, args.idle_threshold)
+        if ledger is not None:
+            added = ledger.account(metrics)
+            logger.info(f"Accounted {added['allocated']:.2f} allocated and "
+                        f"{added['used']:.2f} used project GPU-hours")
+        if exporter is not None:
+            exporter.submit_collection(metrics)
         
         # Output results
         if args.output_file:
             with open(args.output_file, 'w') as f:
-                json.dump(metrics, f, indent=2)
+                json.dump(metrics, f, indent=2, default=json_default)
             logger.info(f"Metrics saved to {args.output_file}")
         else:
-            print(json.dumps(metrics, indent=2))
+            print(json.dumps(metrics, indent=2, default=json_default))
         
         # Print summary
         logger.info("=== METRICS COLLECTION SUMMARY ===")
@@ -568,6 +3455,32 @@ def main():
     except Exception as e:
         logger.error(f"Failed to collect metrics: {e}")
         return 1
+    
+    finally:
+        collector.close()
+        if dcgm is not None:
+            dcgm.close()
+        if exporter is not None:
+            # Flush what is still queued; undelivered batches go to the spill directory
+            exporter.close(timeout=args.push_flush_interval + args.read_timeout)
+        if circuit_breaker is not None and args.breaker_state:
+            try:
+                circuit_breaker.save(args.breaker_state)
+            except OSError as e:
+                logger.warning(f"Failed to save circuit breaker state: {e}")
+        if ledger is not None:
+            try:
+                ledger.save(args.accounting)
+            except OSError as e:
+                logger.warning(f"Failed to save GPU-hour ledger: {e}")
+        if store is not None:
+            try:
+                store.apply_retention()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to apply metrics store retention: {e}")
+            store.close()
+        if client.cache is not None:
+            client.cache.close()
 
 
 if __name__ == '__main__':
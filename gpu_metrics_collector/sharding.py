@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Horizontal sharding for the RunAI GPU Metrics Collector
+
+With --shard-index I --shard-count N, each of N collector instances collects
+a deterministic share of the work:
+
+- project-level metrics of the projects whose stable hash of
+  (cluster UUID, project ID) falls on shard I
+- cluster-level metrics of the clusters whose hash of the cluster UUID falls
+  on shard I
+
+The hash is SHA-256 based, so every instance (and every run) agrees on the
+assignment regardless of PYTHONHASHSEED or listing order. merge_shard_documents
+combines the N shard outputs into one standard collect_all_metrics document.
+"""
+
+import hashlib
+import logging
+from typing import Any, Dict, List
+
+from metrics_store import to_epoch
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(key: str, shard_count: int) -> int:
+    """
+    Get the shard a key belongs to
+    
+    Args:
+        key: Stable identifier (e.g. from project_shard_key)
+        shard_count: Number of shards
+    
+    Returns:
+        Shard index in [0, shard_count)
+    """
+    digest = hashlib.sha256(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shard_count
+
+
+def project_shard_key(cluster_uuid: str, project_id: Any) -> str:
+    """Sharding key of a project; IDs are only unique within a cluster"""
+    return f"{cluster_uuid}/{project_id}"
+
+
+def cluster_shard_key(cluster_uuid: str) -> str:
+    """Sharding key of the cluster-level metrics of a cluster"""
+    return str(cluster_uuid)
+
+
+def merge_shard_documents(documents: List[Dict], max_skew: float = 60.0) -> Dict:
+    """
+    Combine the outputs of all shards into one collect_all_metrics document
+    
+    Shards started apart collect slightly different windows. The merged
+    'time_range' is their union; if the starts or ends are more than
+    max_skew seconds apart the document is flagged with
+    'time_range_mismatch' and lists every shard's 'shard_time_ranges'.
+    
+    Args:
+        documents: One collect_all_metrics document per shard, in any order
+        max_skew: Seconds the windows of the shards may differ unflagged
+    
+    Returns:
+        Document with every cluster once, its cluster-level metrics taken
+        from the owning shard, and the projects of all shards in shard order
+    
+    Raises:
+        ValueError: If the documents are not exactly one of each shard
+    """
+    if not documents:
+        raise ValueError("No shard outputs to merge")
+    
+    shard_count = None
+    by_index: Dict[int, Dict] = {}
+    for document in documents:
+        shard = document.get('shard')
+        if not shard:
+            raise ValueError("Input is not a sharded collection (missing 'shard')")
+        if shard_count is None:
+            shard_count = shard['count']
+        elif shard['count'] != shard_count:
+            raise ValueError(f"Shard counts differ: {shard_count} and {shard['count']}")
+        if shard['index'] in by_index:
+            raise ValueError(f"Shard {shard['index']} given more than once")
+        by_index[shard['index']] = document
+    
+    missing = sorted(set(range(shard_count)) - set(by_index))
+    if missing:
+        raise ValueError(f"Missing shard outputs: {', '.join(str(index) for index in missing)}")
+    
+    ordered = [by_index[index] for index in range(shard_count)]
+    time_ranges = [document['time_range'] for document in ordered]
+    starts = [to_epoch(time_range['start']) for time_range in time_ranges]
+    ends = [to_epoch(time_range['end']) for time_range in time_ranges]
+    merged = {
+        'collection_timestamp': max(document['collection_timestamp'] for document in ordered),
+        'time_range': {
+            'start': time_ranges[starts.index(min(starts))]['start'],
+            'end': time_ranges[ends.index(max(ends))]['end']
+        },
+        'clusters': []
+    }
+    if max(starts) - min(starts) > max_skew or max(ends) - min(ends) > max_skew:
+        logger.warning(f"Shard time ranges differ by more than {max_skew:g}s; "
+                       f"the merged document covers their union")
+        merged['time_range_mismatch'] = True
+        merged['shard_time_ranges'] = time_ranges
+    
+    clusters: Dict[str, Dict] = {}
+    for index, document in enumerate(ordered):
+        for cluster in document.get('clusters', []):
+            cluster_uuid = cluster['cluster_uuid']
+            entry = clusters.get(cluster_uuid)
+            if entry is None:
+                entry = {
+                    'cluster_uuid': cluster_uuid,
+                    'cluster_name': cluster.get('cluster_name', cluster_uuid),
+                    'cluster_level_metrics': {},
+                    'project_level_metrics': []
+                }
+                clusters[cluster_uuid] = entry
+                merged['clusters'].append(entry)
+            if shard_of(cluster_shard_key(cluster_uuid), shard_count) == index:
+                entry['cluster_level_metrics'] = cluster.get('cluster_level_metrics', {})
+            entry['project_level_metrics'].extend(cluster.get('project_level_metrics', []))
+    
+    if any(document.get('deadline_exceeded') for document in ordered):
+        merged['deadline_exceeded'] = True
+    
+    logger.info(f"Merged {shard_count} shards: {len(merged['clusters'])} clusters, "
+                f"{sum(len(c['project_level_metrics']) for c in merged['clusters'])} projects")
+    return merged
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Simple test script for the circuit breaker
+
+This script validates the per-endpoint circuit breaker used by the
+RunAI GPU Metrics Collector.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# Import the module
+try:
+    from circuit_breaker import CircuitBreaker, CircuitOpenError
+except ImportError:
+    print("Error: Could not import circuit_breaker module")
+    sys.exit(1)
+
+
+def test_open_and_half_open_probe():
+    """Test a circuit opens at the error rate and recovers through a probe"""
+    print("Testing circuit breaker states...")
+    
+    breaker = CircuitBreaker(error_rate=0.5, min_calls=4, cooldown=0.05)
+    name = CircuitBreaker.circuit_name("c1", "project_metrics")
+    assert name == "c1/project_metrics"
+    
+    # 1 failure out of 3 calls: not enough calls yet, still closed
+    for success in (True, False, True):
+        breaker.before_call(name)
+        breaker.record(name, success)
+    assert breaker.state(name) == 'closed'
+    
+    # 2 failures out of 4 reaches the 50% error rate
+    breaker.before_call(name)
+    breaker.record(name, False)
+    assert breaker.state(name) == 'open'
+    try:
+        breaker.before_call(name)
+        raise AssertionError("Open circuit let a call through")
+    except CircuitOpenError as e:
+        assert e.circuit == name
+    
+    # Other circuits are unaffected
+    breaker.before_call("c1/quotas")
+    breaker.record("c1/quotas", True)
+    
+    # After the cooldown exactly one probe is allowed
+    time.sleep(0.06)
+    breaker.before_call(name)
+    assert breaker.state(name) == 'half_open'
+    try:
+        breaker.before_call(name)
+        raise AssertionError("Second call allowed while probing")
+    except CircuitOpenError:
+        pass
+    
+    # A released probe keeps the circuit half-open and lets the next call probe
+    breaker.release(name)
+    assert breaker.state(name) == 'half_open'
+    breaker.before_call(name)
+    
+    # A failed probe restarts the cooldown, a successful one closes the circuit
+    breaker.record(name, False)
+    assert breaker.state(name) == 'open'
+    time.sleep(0.06)
+    breaker.before_call(name)
+    breaker.record(name, True)
+    assert breaker.state(name) == 'closed'
+    breaker.before_call(name)
+    
+    print("✓ Circuit breaker states test passed")
+
+
+def test_state_persistence():
+    """Test open circuits survive a restart and are probed after the cooldown"""
+    print("Testing circuit breaker persistence...")
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "breaker.json")
+        
+        breaker = CircuitBreaker(min_calls=1, cooldown=0.05)
+        breaker.load(path)  # Missing file is ignored
+        breaker.before_call("c1/cluster_metrics")
+        breaker.record("c1/cluster_metrics", False)
+        breaker.before_call("c2/cluster_metrics")
+        breaker.record("c2/cluster_metrics", True)
+        breaker.save(path)
+        
+        restored = CircuitBreaker(min_calls=1, cooldown=0.05)
+        restored.load(path)
+        assert restored.state("c1/cluster_metrics") == 'open'
+        assert restored.state("c2/cluster_metrics") == 'closed'
+        
+        time.sleep(0.06)
+        restored.before_call("c1/cluster_metrics")
+        assert restored.state("c1/cluster_metrics") == 'half_open'
+        
+        with open(path, 'w') as f:
+            f.write("not json")
+        CircuitBreaker().load(path)
+    
+    print("✓ Circuit breaker persistence test passed")
+
+
+def run_all_tests():
+    """Run all test functions"""
+    print("Running Circuit Breaker Tests")
+    print("=" * 50)
+    
+    tests = [
+        test_open_and_half_open_probe,
+        test_state_persistence
+    ]
+    
+    passed = 0
+    failed = 0
+    
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except Exception as e:
+            print(f"✗ {test_func.__name__} failed: {e}")
+            failed += 1
+    
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed} passed, {failed} failed")
+    
+    if failed > 0:
+        print("Some tests failed. Please check the implementation.")
+        return False
+    else:
+        print("All tests passed! ✓")
+        return True
+
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Simple test script for compact time series
+
+This script validates that collected series packed into arrays read and
+serialize like the sample lists they replace.
+"""
+
+import json
+import math
+import sys
+from datetime import datetime
+
+# Import the module
+try:
+    from compact_series import CompactSeries, json_default
+    from metrics_stats import annotate_statistics
+except ImportError:
+    print("Error: Could not import compact_series module")
+    sys.exit(1)
+
+
+def test_round_trip_keeps_json_shape():
+    """Test packed series render back to the same samples"""
+    print("Testing compact series round trip...")
+    
+    samples = [
+        {"timestamp": "2024-01-15T10:30:00Z", "value": 32},
+        {"timestamp": "2024-01-15T10:31:00Z", "value": 16},
+        {"timestamp": "2024-01-15T10:32:00Z", "value": None}
+    ]
+    series = CompactSeries.from_samples(samples)
+    assert isinstance(series, CompactSeries)
+    assert series.value_type == 'int'
+    assert len(series) == 3
+    assert series.nbytes() == 3 * 16
+    assert series[0] == {"timestamp": "2024-01-15T10:30:00Z", "value": 32}
+    assert isinstance(series[0]["value"], int)
+    assert series[-1] == {"timestamp": "2024-01-15T10:32:00Z", "value": None}
+    assert series[1:] == list(series)[1:]
+    
+    document = json.loads(json.dumps({"all_values": series}, default=json_default))
+    # Anything else json cannot encode still fails instead of becoming a string
+    try:
+        json.dumps({"values": {1, 2}}, default=json_default)
+        raise AssertionError("A set was encoded")
+    except TypeError:
+        pass
+    assert json.dumps(document["all_values"]) == json.dumps(samples)
+    
+    floats = [{"timestamp": "2024-01-15T10:30:00Z", "value": 16.5},
+              {"timestamp": "2024-01-15T10:31:00Z", "value": 20.0}]
+    series = CompactSeries.from_samples(floats)
+    assert series.value_type == 'float'
+    assert json.dumps(series.to_list()) == json.dumps(floats)
+    
+    # Naive local timestamps (datetime.isoformat()) and epoch numbers
+    local = datetime(2024, 1, 15, 12, 0).isoformat()
+    series = CompactSeries.from_samples([{"timestamp": local, "value": 1}])
+    assert series.timestamp_format == 'local'
+    assert series[0]["timestamp"] == local
+    series = CompactSeries.from_samples([{"timestamp": 1705314600, "value": 1}])
+    assert json.dumps(series.to_list()) == '[{"timestamp": 1705314600, "value": 1}]'
+    
+    # Samples that would not render back exactly stay a list
+    for unsupported in (
+        [{"timestamp": "2024-01-15T10:30:00.123Z", "value": 1}],
+        [{"timestamp": "t1", "value": 1}],
+        [{"timestamp": 1, "value": 1}, {"timestamp": "2024-01-15T10:30:00Z", "value": 2}],
+        # Sub-second precision on a sample in the middle only
+        [{"timestamp": "2024-01-15T10:30:00Z", "value": 1},
+         {"timestamp": "2024-01-15T10:31:00.500Z", "value": 2},
+         {"timestamp": "2024-01-15T10:32:00Z", "value": 3}],
+        # Values of other or mixed types
+        [{"timestamp": "2024-01-15T10:30:00Z", "value": "16.5"}],
+        [{"timestamp": "2024-01-15T10:30:00Z", "value": 1},
+         {"timestamp": "2024-01-15T10:31:00Z", "value": 1.5}],
+        [{"timestamp": "2024-01-15T10:30:00Z", "value": True}]
+    ):
+        assert CompactSeries.from_samples(unsupported) is unsupported
+    
+    print("✓ Compact series round trip test passed")
+
+
+def test_statistics_read_compact_series():
+    """Test statistics are computed from the value arrays"""
+    print("Testing statistics over compact series...")
+    
+    utilization = CompactSeries.from_samples([
+        {"timestamp": 1705314600 + 60 * index, "value": value}
+        for index, value in enumerate([0, 50, 100, None])
+    ])
+    collection = {"clusters": [{
+        "cluster_level_metrics": {"metrics": {"GPU_UTILIZATION": {"all_values": utilization}}},
+        "project_level_metrics": [{"gpu_utilization_series": utilization}]
+    }]}
+    annotate_statistics(collection, ["mean", "count", "idle_fraction"], idle_threshold=1.0)
+    
+    cluster = collection["clusters"][0]
+    statistics = cluster["cluster_level_metrics"]["metrics"]["GPU_UTILIZATION"]["statistics"]
+    assert math.isclose(statistics["mean"], 50.0)
+    assert statistics["count"] == 3
+    assert math.isclose(statistics["idle_fraction"], 1 / 3)
+    assert cluster["project_level_metrics"][0]["gpu_statistics"]["gpu_utilization"] == statistics
+    
+    print("✓ Statistics over compact series test passed")
+
+
+def run_all_tests():
+    """Run all test functions"""
+    print("Running Compact Series Tests")
+    print("=" * 50)
+    
+    tests = [
+        test_round_trip_keeps_json_shape,
+        test_statistics_read_compact_series
+    ]
+    
+    passed = 0
+    failed = 0
+    
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except Exception as e:
+            print(f"✗ {test_func.__name__} failed: {e}")
+            failed += 1
+    
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed} passed, {failed} failed")
+    
+    if failed > 0:
+        print("Some tests failed. Please check the implementation.")
+        return False
+    else:
+        print("All tests passed! ✓")
+        return True
+
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Simple test script for DCGM exporter ingestion
+
+This script validates the exposition parser, the per-pod aggregation and
+the join onto project records against local stub dcgm-exporter endpoints.
+"""
+
+import math
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Import the module
+try:
+    from dcgm_ingest import DCGMScraper, annotate_dcgm, parse_exposition, parse_target
+except ImportError:
+    print("Error: Could not import dcgm_ingest module")
+    sys.exit(1)
+
+
+def _exposition(node: str, pods) -> bytes:
+    """dcgm-exporter output of one node; pods maps GPU index to (namespace, pod) or None"""
+    lines = []
+    for field, scale in (("DCGM_FI_PROF_SM_ACTIVE", 0.1), ("DCGM_FI_DEV_FB_USED", 1000),
+                         ("DCGM_FI_DEV_GPU_TEMP", 1)):
+        lines.append(f"# HELP {field} help.")
+        lines.append(f"# TYPE {field} gauge")
+        for gpu, owner in pods.items():
+            namespace, pod = owner or ("", "")
+            lines.append(
+                f'{field}{{gpu="{gpu}",UUID="GPU-{node}-{gpu}",Hostname="{node}",'
+                f'modelName="NVIDIA H100",container="main",namespace="{namespace}",pod="{pod}"}} '
+                f'{scale * (gpu + 1)}'
+            )
+    lines.append('go_goroutines 12')
+    return ("\n".join(lines) + "\n").encode()
+
+
+class StubExporters:
+    """One HTTP server serving an exposition per path, /fail answers 500"""
+    
+    def __init__(self, documents):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = documents.get(self.path)
+                self.send_response(200 if body is not None else 500)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body or b'')))
+                self.end_headers()
+                self.wfile.write(body or b'')
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+    
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_parse_exposition():
+    """Test the parser keeps only asked-for fields and handles escapes and timestamps"""
+    print("Testing exposition parsing...")
+    
+    text = [
+        b'# HELP DCGM_FI_PROF_SM_ACTIVE ratio',
+        b'DCGM_FI_PROF_SM_ACTIVE{gpu="0",pod="a \\"b\\"",namespace="runai-x"} 0.5 1705312800000',
+        b'DCGM_FI_PROF_SM_ACTIVE_OTHER{gpu="0"} 1',
+        b'DCGM_FI_DEV_FB_USED 2048',
+        b'DCGM_FI_PROF_SM_ACTIVE{gpu="1"} NaN',
+        b'DCGM_FI_PROF_SM_ACTIVE{gpu="2"}',
+        b''
+    ]
+    parsed = list(parse_exposition(text, ["DCGM_FI_PROF_SM_ACTIVE", "DCGM_FI_DEV_FB_USED"]))
+    assert parsed == [
+        ("DCGM_FI_PROF_SM_ACTIVE", {"gpu": "0", "pod": 'a "b"', "namespace": "runai-x"}, 0.5),
+        ("DCGM_FI_DEV_FB_USED", {}, 2048.0)
+    ]
+    
+    assert parse_target("http://n1:9400/metrics?a=b") == (None, "http://n1:9400/metrics?a=b")
+    assert parse_target("c1=http://n1:9400/metrics") == ("c1", "http://n1:9400/metrics")
+    
+    print("✓ Exposition parsing test passed")
+
+
+def test_scrape_and_join():
+    """Test pods of several nodes are aggregated and joined onto their projects"""
+    print("Testing DCGM scrape and project join...")
+    
+    exporters = StubExporters({
+        "/n1": _exposition("n1", {0: ("runai-team-a", "train-0"), 1: ("runai-team-a", "train-0"),
+                                  2: ("runai-team-b", "infer-0"), 3: None}),
+        "/n2": _exposition("n2", {0: ("runai-team-a", "train-1"), 1: ("kube-system", "other")})
+    })
+    try:
+        scraper = DCGMScraper(
+            [f"{exporters.base}/n1", f"c1={exporters.base}/n2", f"c2={exporters.base}/fail"],
+            fields=["DCGM_FI_PROF_SM_ACTIVE", "DCGM_FI_DEV_FB_USED"]
+        )
+        aggregate = scraper.scrape_async().result()
+        assert aggregate.targets == 2
+        assert list(aggregate.errors) == [f"{exporters.base}/fail"]
+        
+        collection = {"clusters": [{
+            "cluster_uuid": "c1",
+            "project_level_metrics": [
+                {"project_name": "team-a", "cluster_uuid": "c1"},
+                {"project_name": "team-c", "cluster_uuid": "c1"},
+                {"cluster_uuid": "c1", "error": "listing failed"}
+            ]
+        }]}
+        assert scraper.annotate(collection, aggregate) == 1
+        
+        team_a = collection["clusters"][0]["project_level_metrics"][0]["dcgm_metrics"]
+        assert team_a["pods"] == 2 and team_a["gpus"] == 3
+        # SM active of n1 GPUs 0 and 1 (0.1, 0.2) and n2 GPU 0 (0.1)
+        assert math.isclose(team_a["sm_active"]["mean"], 0.4 / 3)
+        assert math.isclose(team_a["sm_active"]["max"], 0.2)
+        assert math.isclose(team_a["fb_used"]["sum"], 4000.0)
+        assert team_a["per_pod"]["train-0"]["gpus"] == 2
+        assert collection["clusters"][0]["project_level_metrics"][1]["dcgm_metrics"]["pods"] == 0
+        assert "dcgm_metrics" not in collection["clusters"][0]["project_level_metrics"][2]
+        
+        # Targets of another cluster are neither scraped nor joined
+        aggregate = scraper.scrape("c2")
+        assert aggregate.targets == 1
+        other = {"clusters": [{"project_level_metrics": [
+            {"project_name": "team-a", "cluster_uuid": "c2"}
+        ]}]}
+        annotate_dcgm(other, aggregate, include_pods=False)
+        assert other["clusters"][0]["project_level_metrics"][0]["dcgm_metrics"]["pods"] == 1
+        assert "per_pod" not in other["clusters"][0]["project_level_metrics"][0]["dcgm_metrics"]
+        
+        # Closing stops the background thread; no scrape can be started after it
+        scraper.close()
+        try:
+            scraper.scrape_async()
+            raise AssertionError("Scrape started after close()")
+        except RuntimeError:
+            pass
+    finally:
+        exporters.close()
+    
+    print("✓ DCGM scrape and project join test passed")
+
+
+def run_all_tests():
+    """Run all test functions"""
+    print("Running DCGM Ingestion Tests")
+    print("=" * 50)
+    
+    tests = [
+        test_parse_exposition,
+        test_scrape_and_join
+    ]
+    
+    passed = 0
+    failed = 0
+    
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except Exception as e:
+            print(f"✗ {test_func.__name__} failed: {e}")
+            failed += 1
+    
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed} passed, {failed} failed")
+    
+    if failed > 0:
+        print("Some tests failed. Please check the implementation.")
+        return False
+    else:
+        print("All tests passed! ✓")
+        return True
+
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Simple test script for GPU-hour accounting
+
+This script validates the trapezoidal integration and the ledger carried
+between collection runs.
+"""
+
+import math
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+# Import the module
+try:
+    from gpu_accounting import GPUHourLedger, integrate_series
+    from compact_series import CompactSeries
+except ImportError:
+    print("Error: Could not import gpu_accounting module")
+    sys.exit(1)
+
+
+def _epoch(*args) -> int:
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp())
+
+
+def test_integrate_series():
+    """Test trapezoids, month splits, gaps and NaN samples"""
+    print("Testing series integration...")
+    
+    # 2 GPUs ramping to 4 over one hour: (2 + 4) / 2 = 3 GPU-hours
+    start = _epoch(2024, 1, 15, 10)
+    result = integrate_series([([start, start + 3600], [[2.0, 4.0]])])
+    assert result == [{"2024-01": [3.0]}]
+    
+    # A constant 2 GPUs from 23:30 to 00:30 over a month boundary
+    boundary = _epoch(2024, 2, 1)
+    t = list(range(boundary - 1800, boundary + 1801, 300))
+    result = integrate_series([(t, [[2.0] * len(t)])])[0]
+    assert math.isclose(result["2024-01"][0], 1.0)
+    assert math.isclose(result["2024-02"][0], 1.0)
+    
+    # Intervals past max_gap and intervals ending at NaN are not counted
+    t = [start, start + 600, start + 600 + 7200, start + 600 + 7500]
+    result = integrate_series([(t, [[6.0, 6.0, 6.0, math.nan]])], max_gap=3600)[0]
+    assert math.isclose(result["2024-01"][0], 1.0)
+    
+    # Series too short to integrate give empty results, in input order
+    assert integrate_series([([start], [[1.0]]), ([], [[]])]) == [{}, {}]
+    
+    print("✓ Series integration test passed")
+
+
+def _collection(timestamp: str, allocated_gpu: float, requested: float, utilization: float,
+                series=None):
+    project = {
+        "cluster_uuid": "c1",
+        "project_id": "p1",
+        "project_name": "team-a",
+        "timestamp": timestamp,
+        "gpu_metrics": {"gpu_requested": requested, "gpu_utilization": utilization}
+    }
+    if series is not None:
+        project["gpu_utilization_series"] = series
+    return {"clusters": [{
+        "cluster_uuid": "c1",
+        "cluster_level_metrics": {"metrics": {
+            "ALLOCATED_GPU": {"current_value": allocated_gpu, "timestamp": timestamp}
+        }},
+        "project_level_metrics": [
+            project,
+            {"cluster_uuid": "c1", "project_id": "p2", "error": "timeout"}
+        ]
+    }]}
+
+
+def test_ledger_carries_intervals_between_runs():
+    """Test runs add up through the saved ledger without double counting"""
+    print("Testing GPU-hour ledger across runs...")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "ledger.json")
+        
+        # First run only records the starting point
+        ledger = GPUHourLedger()
+        ledger.load(path)
+        added = ledger.account(_collection("2024-01-15T10:00:00Z", 8, 4, 50))
+        assert added == {"allocated": 0.0, "used": 0.0, "cluster_allocated": 0.0}
+        ledger.save(path)
+        
+        # Second run, in a new process, integrates the interval since the first
+        ledger = GPUHourLedger()
+        ledger.load(path)
+        collection = _collection("2024-01-15T10:30:00Z", 8, 4, 100)
+        added = ledger.account(collection)
+        assert added == {"allocated": 2.0, "used": 1.5, "cluster_allocated": 4.0}
+        cluster = collection["clusters"][0]
+        assert cluster["cluster_level_metrics"]["gpu_hours"] == {"allocated": 4.0}
+        assert cluster["project_level_metrics"][0]["gpu_hours"] == {"allocated": 2.0, "used": 1.5}
+        assert "gpu_hours" not in cluster["project_level_metrics"][1]
+        
+        # Seeing the same point again adds nothing
+        assert ledger.account(_collection("2024-01-15T10:30:00Z", 8, 4, 100))["used"] == 0.0
+        ledger.save(path)
+        
+        # Per-sample series overlapping the previous run only count new samples
+        series = CompactSeries.from_samples([
+            {"timestamp": "2024-01-15T10:00:00Z", "value": 0},
+            {"timestamp": "2024-01-15T10:30:00Z", "value": 100},
+            {"timestamp": "2024-01-15T11:00:00Z", "value": 0}
+        ])
+        ledger = GPUHourLedger()
+        ledger.load(path)
+        added = ledger.account(_collection("2024-01-15T11:00:00Z", 8, 4, 0, series))
+        assert added["allocated"] == 2.0 and added["used"] == 1.0
+        
+        totals = {(entry["project_id"], entry["period"]): entry for entry in ledger.totals()}
+        assert totals[("p1", "2024-01")]["allocated_gpu_hours"] == 4.0
+        assert totals[("p1", "2024-01")]["used_gpu_hours"] == 2.5
+        assert totals[("p1", "2024-01")]["project_name"] == "team-a"
+        assert totals[(None, "2024-01")]["allocated_gpu_hours"] == 8.0
+        assert "used_gpu_hours" not in totals[(None, "2024-01")]
+        assert ledger.totals("2023-12") == []
+    
+    print("✓ GPU-hour ledger test passed")
+
+
+def run_all_tests():
+    """Run all test functions"""
+    print("Running GPU Accounting Tests")
+    print("=" * 50)
+    
+    tests = [
+        test_integrate_series,
+        test_ledger_carries_intervals_between_runs
+    ]
+    
+    passed = 0
+    failed = 0
+    
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except Exception as e:
+            print(f"✗ {test_func.__name__} failed: {e}")
+            failed += 1
+    
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed} passed, {failed} failed")
+    
+    if failed > 0:
+        print("Some tests failed. Please check the implementation.")
+        return False
+    else:
+        print("All tests passed! ✓")
+        return True
+
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Simple test script for the collector daemon and Prometheus endpoint
+
+This script validates the daemon mode of the RunAI GPU Metrics Collector
+without making actual API calls.
+"""
+
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from unittest.mock import Mock
+
+# Import the module
+try:
+    from metrics_server import (
+        CollectorDaemon, MetricsSnapshot, QueryService, render_prometheus, start_http_server
+    )
+    from metrics_store import MetricsStore
+except ImportError:
+    print("Error: Could not import metrics_server module")
+    sys.exit(1)
+
+
+SAMPLE_CLUSTER = {
+    "cluster_uuid": "c1",
+    "cluster_name": "prod \"east\"",
+    "cluster_level_metrics": {
+        "metrics": {
+            "TOTAL_GPU": {"current_value": 32},
+            "ALLOCATED_GPU": {"current_value": "24"},
+            "GPU_UTILIZATION": {"current_value": 75.5}
+        }
+    },
+    "project_level_metrics": [
+        {
+            "project_name": "team-a",
+            "project_id": "proj-1",
+            "gpu_metrics": {"gpu_limit": 8, "gpu_requested": 6, "gpu_utilization": 80.2}
+        },
+        {
+            "project_name": "team-b",
+            "project_id": "proj-2",
+            "error": "boom",
+            "gpu_metrics": {"gpu_limit": 4, "gpu_requested": 0, "gpu_utilization": 0}
+        }
+    ]
+}
+
+
+def test_render_prometheus():
+    """Test Prometheus text rendering"""
+    print("Testing Prometheus rendering...")
+    
+    text = render_prometheus([SAMPLE_CLUSTER])
+    
+    assert '# TYPE runai_cluster_total_gpu gauge' in text
+    assert 'runai_cluster_total_gpu{cluster_uuid="c1",cluster_name="prod \\"east\\""} 32.0' in text
+    assert 'runai_cluster_allocated_gpu{cluster_uuid="c1",cluster_name="prod \\"east\\""} 24.0' in text
+    assert ('runai_project_gpu_utilization{cluster_uuid="c1",cluster_name="prod \\"east\\"",'
+            'project_name="team-a",project_id="proj-1"} 80.2') in text
+    # Failed projects export their quota but no utilization
+    assert 'project_name="team-b",project_id="proj-2"} 4.0' in text
+    assert text.count('runai_project_gpu_utilization{') == 1
+    assert text.endswith('\n')
+    
+    # Per-nodepool utilization gets its own family with a nodepool label
+    cluster = dict(SAMPLE_CLUSTER, project_level_metrics=[
+        dict(SAMPLE_CLUSTER['project_level_metrics'][0], nodepool_metrics={
+            "a100": {"gpu_utilization": 91.0},
+            "default": {"error": "timeout"}
+        })
+    ])
+    text = render_prometheus([cluster])
+    assert 'project_id="proj-1",nodepool="a100"} 91.0' in text
+    assert text.count('runai_project_nodepool_gpu_utilization{') == 1
+    
+    print("✓ Prometheus rendering test passed")
+
+
+def test_daemon_cycle_and_endpoint():
+    """Test a daemon cycle updates the snapshot served over HTTP"""
+    print("Testing daemon cycle and metrics endpoint...")
+    
+    collector = Mock()
+    collector.client.get_clusters.return_value = [{"uuid": "c1", "name": "one"}, {"uuid": "c2"}]
+    collector.collect_cluster.side_effect = [SAMPLE_CLUSTER, RuntimeError("down")]
+    
+    daemon = CollectorDaemon(collector, interval=0, hours_back=1)
+    daemon.run_cycle()
+    
+    assert collector.collect_cluster.call_count == 2
+    assert [c['cluster_uuid'] for c in daemon.snapshot.clusters()] == ["c1"]
+    
+    server = start_http_server(daemon.snapshot, '127.0.0.1', 0)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            body = response.read().decode()
+        assert 'runai_cluster_gpu_utilization{cluster_uuid="c1"' in body
+        assert 'runai_collector_last_update_timestamp_seconds{cluster_uuid="c1"}' in body
+    finally:
+        server.shutdown()
+        server.server_close()
+    
+    print("✓ Daemon cycle and metrics endpoint test passed")
+
+
+def test_daemon_statistics():
+    """Test a daemon with statistics annotates every collected cluster"""
+    print("Testing daemon statistics...")
+    
+    cluster = json.loads(json.dumps(SAMPLE_CLUSTER))
+    cluster["cluster_level_metrics"]["metrics"]["GPU_UTILIZATION"]["all_values"] = [
+        {"timestamp": 1705314600 + 60 * index, "value": value}
+        for index, value in enumerate([0, 50, 100])
+    ]
+    collector = Mock()
+    collector.client.get_clusters.return_value = [{"uuid": "c1"}]
+    collector.collect_cluster.return_value = cluster
+    
+    daemon = CollectorDaemon(collector, interval=0, statistics=["mean", "idle_fraction"],
+                             idle_threshold=1.0)
+    daemon.run_cycle()
+    
+    metric = daemon.snapshot.clusters()[0]["cluster_level_metrics"]["metrics"]["GPU_UTILIZATION"]
+    assert metric["statistics"]["mean"] == 50.0
+    assert abs(metric["statistics"]["idle_fraction"] - 1 / 3) < 1e-9
+    
+    print("✓ Daemon statistics test passed")
+
+
+def test_daemon_stop():
+    """Test the daemon stops without collecting when asked to"""
+    print("Testing daemon stop...")
+    
+    collector = Mock()
+    collector.client.get_clusters.return_value = [{"uuid": "c1"}]
+    daemon = CollectorDaemon(collector, interval=60, snapshot=MetricsSnapshot())
+    daemon.stop()
+    daemon.run_forever()
+    
+    assert collector.collect_cluster.call_count == 0
+    
+    print("✓ Daemon stop test passed")
+
+
+def test_query_service_coalesces_misses():
+    """Test concurrent misses share one upstream fetch and reads are cached"""
+    print("Testing query service request coalescing...")
+    
+    calls = []
+    
+    def collect_cluster(cluster, start_time, end_time):
+        calls.append(cluster['uuid'])
+        time.sleep(0.2)
+        return SAMPLE_CLUSTER
+    
+    collector = Mock()
+    collector.client.get_clusters.return_value = [{"uuid": "c1"}]
+    collector.collect_cluster.side_effect = collect_cluster
+    daemon = CollectorDaemon(collector, interval=0)
+    daemon._list_clusters()
+    service = QueryService(daemon.snapshot, fetch_cluster=daemon.fetch_cluster)
+    
+    # Eight dashboards ask for the same cluster before it was ever collected
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(service.get('/clusters/c1/projects/proj-1')))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert calls == ["c1"]
+    assert len(set(results)) == 1
+    status, body = results[0]
+    assert status == 200
+    assert json.loads(body)['gpu_metrics']['gpu_utilization'] == 80.2
+    
+    # Later reads come from the cache until the snapshot changes
+    flights = service.flights.calls
+    assert service.get('/clusters/c1/projects/proj-1') == results[0]
+    assert service.flights.calls == flights
+    daemon.snapshot.update_cluster({**SAMPLE_CLUSTER, "project_level_metrics": []})
+    status, _ = service.get('/clusters/c1/projects/proj-1')
+    assert status == 404
+    
+    # Unknown clusters are not fetched
+    for _ in range(2):
+        status, body = service.get('/clusters/nope')
+        assert status == 404 and 'error' in json.loads(body)
+    assert calls == ["c1"]
+    
+    # A cluster whose collection fails is not fetched again within the interval
+    collector.client.get_clusters.return_value = [{"uuid": "c1"}, {"uuid": "c2"}]
+    collector.collect_cluster.side_effect = RuntimeError("down")
+    daemon._list_clusters()
+    assert service.get('/clusters/c2')[0] == 502
+    assert service.get('/clusters/c2/projects')[0] == 503
+    assert collector.collect_cluster.call_count == 2
+    service.min_fetch_interval = 0
+    assert service.get('/clusters/c2')[0] == 502
+    assert collector.collect_cluster.call_count == 3
+    
+    print("✓ Query service request coalescing test passed")
+
+
+def test_query_api_endpoint():
+    """Test the JSON API served next to /metrics, including stored history"""
+    print("Testing JSON query API...")
+    
+    snapshot = MetricsSnapshot()
+    snapshot.update_cluster(SAMPLE_CLUSTER)
+    store = MetricsStore(':memory:')
+    store.add_samples("c1", None, "GPU_UTILIZATION", [
+        (1705312800 + 60 * minute, minute) for minute in range(10)
+    ])
+    server = start_http_server(snapshot, '127.0.0.1', 0, QueryService(snapshot, store=store))
+    
+    def get(path):
+        url = f"http://127.0.0.1:{server.server_address[1]}/api/v1{path}"
+        try:
+            with urllib.request.urlopen(url) as response:
+                assert response.headers['Content-Type'] == 'application/json'
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+    
+    try:
+        status, document = get('/clusters')
+        assert status == 200
+        assert document['clusters'][0]['metrics']['GPU_UTILIZATION'] == 75.5
+        assert document['clusters'][0]['projects'] == 2
+        
+        status, document = get('/history?cluster_uuid=c1&metric=GPU_UTILIZATION&start=1705312800')
+        assert status == 200 and document['resolution'] == 0
+        assert [point['mean'] for point in document['points']] == list(range(10))
+        
+        status, document = get('/history?cluster_uuid=c1&metric=GPU_UTILIZATION'
+                               '&start=1705312800&resolution=300')
+        assert document['resolution'] == 300
+        assert [point['count'] for point in document['points']] == [5, 5]
+        
+        assert get('/history?metric=GPU_UTILIZATION')[0] == 400
+        assert get('/history?cluster_uuid=c1&metric=x&start=soon')[0] == 400
+        assert get('/nothing')[0] == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+        store.close()
+    
+    print("✓ JSON query API test passed")
+
+
+def run_all_tests():
+    """Run all test functions"""
+    print("Running Collector Daemon Tests")
+    print("=" * 50)
+    
+    tests = [
+        test_render_prometheus,
+        test_daemon_cycle_and_endpoint,
+        test_daemon_statistics,
+        test_daemon_stop,
+        test_query_service_coalesces_misses,
+        test_query_api_endpoint
+    ]
+    
+    passed = 0
+    failed = 0
+    
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except Exception as e:
+            print(f"✗ {test_func.__name__} failed: {e}")
+            failed += 1
+    
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed} passed, {failed} failed")
+    
+    if failed > 0:
+        print("Some tests failed. Please check the implementation.")
+        return False
+    else:
+        print("All tests passed! ✓")
+        return True
+
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Simple test script for the statistics stage
+
+This script validates the batch statistics computed for collected
+GPU time series.
+"""
+
+import math
+import sys
+
+# Import the module
+try:
+    from metrics_stats import annotate_statistics, compute_statistics, validate_statistics
+except ImportError:
+    print("Error: Could not import metrics_stats module")
+    sys.exit(1)
+
+
+def test_compute_statistics():
+    """Test statistics for several series in one batch"""
+    print("Testing batch statistics...")
+    
+    results = compute_statistics(
+        [[0, 10, 20, 30, 40], [50.0, math.nan, 0.5], []],
+        ['mean', 'min', 'max', 'p50', 'p95', 'std', 'count', 'idle_fraction'],
+        idle_threshold=1.0
+    )
+    
+    first, second, empty = results
+    assert first['mean'] == 20.0
+    assert first['min'] == 0.0 and first['max'] == 40.0
+    assert first['p50'] == 20.0
+    assert abs(first['p95'] - 38.0) < 1e-9
+    assert abs(first['std'] - math.sqrt(200)) < 1e-9
+    assert first['count'] == 5.0
+    assert first['idle_fraction'] == 0.2
+    
+    # NaN samples are ignored
+    assert second['count'] == 2.0
+    assert second['mean'] == 25.25
+    assert second['idle_fraction'] == 0.5
+    
+    assert empty['count'] == 0.0
+    assert empty['mean'] is None and empty['p95'] is None
+    
+    assert compute_statistics([]) == []
+    for invalid in (['median'], ['p101']):
+        try:
+            validate_statistics(invalid)
+            raise AssertionError(f"{invalid} was accepted")
+        except ValueError:
+            pass
+    
+    print("✓ Batch statistics test passed")
+
+
+def test_annotate_collection():
+    """Test statistics are added next to the collected metrics"""
+    print("Testing collection annotation...")
+    
+    collection = {
+        "clusters": [{
+            "cluster_level_metrics": {"metrics": {
+                "TOTAL_GPU": {"current_value": 8, "all_values": [{"value": 8}, {"value": "8"}]},
+                "GPU_UTILIZATION": {"current_value": 0, "all_values": [{"value": 0}, {"value": 60}]}
+            }},
+            "project_level_metrics": [
+                {
+                    "project_name": "team-a",
+                    "gpu_metrics": {"gpu_utilization": 30},
+                    "gpu_utilization_series": [{"value": 10}, {"value": 50}]
+                },
+                {
+                    "project_name": "team-c",
+                    "gpu_metrics": {"gpu_utilization": 30},
+                    "raw_metrics": {"timeRange": {"data": [{"gpu_utilization": 50}]}}
+                },
+                {"project_name": "team-b", "error": "boom", "gpu_metrics": {}}
+            ]
+        }]
+    }
+    
+    annotate_statistics(collection, ['mean', 'max', 'idle_fraction'])
+    cluster = collection['clusters'][0]
+    metrics = cluster['cluster_level_metrics']['metrics']
+    
+    assert metrics['TOTAL_GPU']['statistics'] == {'mean': 8.0, 'max': 8.0}
+    assert metrics['GPU_UTILIZATION']['statistics'] == {'mean': 30.0, 'max': 60.0, 'idle_fraction': 0.5}
+    projects = cluster['project_level_metrics']
+    assert projects[0]['gpu_statistics']['gpu_utilization'] == {'mean': 30.0, 'max': 50.0, 'idle_fraction': 0.0}
+    assert 'gpu_statistics' not in projects[1]
+    assert 'gpu_statistics' not in projects[2]
+    
+    print("✓ Collection annotation test passed")
+
+
+def run_all_tests():
+    """Run all test functions"""
+    print("Running Statistics Stage Tests")
+    print("=" * 50)
+    
+    tests = [
+        test_compute_statistics,
+        test_annotate_collection
+    ]
+    
+    passed = 0
+    failed = 0
+    
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except Exception as e:
+            print(f"✗ {test_func.__name__} failed: {e}")
+            failed += 1
+    
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed} passed, {failed} failed")
+    
+    if failed > 0:
+        print("Some tests failed. Please check the implementation.")
+        return False
+    else:
+        print("All tests passed! ✓")
+        return True
+
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Simple test script for the local metrics store
+
+This script validates the SQLite time-series store used by the
+RunAI GPU Metrics Collector.
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime
+
+# Import the module
+try:
+    from metrics_store import RAW, MetricsStore, from_epoch, to_epoch
+except ImportError:
+    print("Error: Could not import metrics_store module")
+    sys.exit(1)
+
+
+def test_timestamp_conversion():
+    """Test timestamp conversion helpers"""
+    print("Testing timestamp conversion...")
+    
+    assert to_epoch("1970-01-01T00:01:00Z") == 60
+    assert to_epoch("1970-01-01T00:01:00+00:00") == 60
+    assert to_epoch(60.7) == 60
+    now = datetime.now().replace(microsecond=0)
+    assert from_epoch(to_epoch(now)) == now
+    assert to_epoch(now.isoformat()) == to_epoch(now)
+    
+    print("✓ Timestamp conversion test passed")
+
+
+def test_samples_and_watermarks():
+    """Test sample de-duplication, watermarks and persistence"""
+    print("Testing samples and watermarks...")
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "metrics.db")
+        
+        with MetricsStore(path) as store:
+            store.add_samples("c1", None, "TOTAL_GPU", [(100, 8.0), (160, 8.0)])
+            # Overlapping window: the sample at 160 must not be duplicated
+            store.add_samples("c1", None, "TOTAL_GPU", [(160, 8.0), (220, 16.0)])
+            store.add_samples("c1", None, "ALLOCATED_GPU", [(100, 2.0)])
+            store.add_samples("c1", "proj-1", "gpu_requested", [(150, 1.0)])
+            
+            assert store.get_series("c1", "TOTAL_GPU") == [(100, 8.0), (160, 8.0), (220, 16.0)]
+            assert store.get_series("c1", "TOTAL_GPU", start=150, end=200) == [(160, 8.0)]
+            assert store.watermark("c1", None, ["TOTAL_GPU"]) == 220
+            # The oldest watermark wins when series are fetched together
+            assert store.watermark("c1", None, ["TOTAL_GPU", "ALLOCATED_GPU"]) == 100
+            # Any unseen series means the full window must be fetched
+            assert store.watermark("c1", None, ["TOTAL_GPU", "GPU_UTILIZATION"]) is None
+            assert store.watermark("c1", "proj-1", ["gpu_requested"]) == 150
+        
+        # History survives reopening the store
+        with MetricsStore(path) as store:
+            assert store.watermark("c1", None, ["TOTAL_GPU"]) == 220
+            assert len(store.list_series()) == 3
+    
+    print("✓ Samples and watermarks test passed")
+
+
+def test_rollups_and_retention():
+    """Test incremental rollups, retention and tier selection"""
+    print("Testing rollups and retention...")
+    
+    day = 86400
+    now = 400 * day
+    with MetricsStore(":memory:") as store:
+        # 1-minute samples over two hours, written as overlapping windows
+        samples = [(now - 7200 + 60 * i, float(i % 10)) for i in range(120)]
+        store.add_samples("c1", "p1", "gpu_utilization", samples[:70])
+        store.add_samples("c1", "p1", "gpu_utilization", samples[50:] + [(now - 30, None)])
+        
+        tier, rows = store.query_series("c1", "gpu_utilization", "p1", start=now - 7200,
+                                        resolution=3600)
+        assert tier == 3600
+        assert [row[0] for row in rows] == [now - 7200, now - 3600]
+        assert [row[4] for row in rows] == [60, 60]
+        assert rows[0][1:4] == (0.0, 9.0, 4.5)
+        
+        # Rollups match the raw samples however the writes overlapped
+        tier, rows = store.query_series("c1", "gpu_utilization", "p1", start=now - 7200,
+                                        resolution=600)
+        assert tier == 300 and len(rows) == 24 and sum(row[4] for row in rows) == 120
+        tier, rows = store.query_series("c1", "gpu_utilization", "p1", start=now - 7200)
+        assert tier == RAW and len(rows) == 121
+        
+        # A range older than a tier's retention is served by a coarser tier
+        assert store.select_resolution(now - 60 * day, 3600, now=now) == 3600
+        assert store.select_resolution(now - 60 * day, 300, now=now) == 300
+        assert store.select_resolution(now - 2 * 365 * day, 3600, now=now) == 3600
+        assert store.select_resolution(now - 2 * 365 * day, day, now=now) == day
+        assert store.select_resolution(None, day, now=now) == day
+        
+        deleted = store.apply_retention(now=now + 8 * day)
+        assert deleted[RAW] == 121 and deleted[300] == 0
+        assert store.get_series("c1", "gpu_utilization", "p1") == []
+        tier, rows = store.query_series("c1", "gpu_utilization", "p1", resolution=day)
+        assert tier == day and rows[0][4] == 120
+    
+    # Stores written before rollups existed are rolled up when opened
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "metrics.db")
+        with MetricsStore(path) as store:
+            store.add_samples("c1", None, "TOTAL_GPU", [(0, 8.0), (60, 16.0)])
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.execute('DELETE FROM rollups')
+        conn.close()
+        with MetricsStore(path) as store:
+            assert store.query_series("c1", "TOTAL_GPU", resolution=day)[1] == [(0, 8.0, 16.0, 12.0, 2)]
+    
+    print("✓ Rollups and retention test passed")
+
+
+def run_all_tests():
+    """Run all test functions"""
+    print("Running Metrics Store Tests")
+    print("=" * 50)
+    
+    tests = [
+        test_timestamp_conversion,
+        test_samples_and_watermarks,
+        test_rollups_and_retention
+    ]
+    
+    passed = 0
+    failed = 0
+    
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except Exception as e:
+            print(f"✗ {test_func.__name__} failed: {e}")
+            failed += 1
+    
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed} passed, {failed} failed")
+    
+    if failed > 0:
+        print("Some tests failed. Please check the implementation.")
+        return False
+    else:
+        print("All tests passed! ✓")
+        return True
+
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
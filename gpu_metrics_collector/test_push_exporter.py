@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Simple test script for the push exporter
+
+This script validates batching, compression, spilling and replay of the
+push exporter against a local stub OTLP receiver.
+"""
+
+import gzip
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Import the module
+try:
+    from push_exporter import PushExporter, cluster_points, encode_otlp
+    from compact_series import CompactSeries
+except ImportError:
+    print("Error: Could not import push_exporter module")
+    sys.exit(1)
+
+
+def _cluster(values, cluster_uuid="c1"):
+    """Cluster entry with a utilization series, a project and a failed project"""
+    return {
+        "cluster_uuid": cluster_uuid,
+        "cluster_name": "one",
+        "cluster_level_metrics": {"metrics": {
+            "TOTAL_GPU": {"current_value": 8, "timestamp": "2024-01-15T10:00:00Z"},
+            "GPU_UTILIZATION": {"current_value": values[-1], "all_values": CompactSeries.from_samples([
+                {"timestamp": 1705312800 + 60 * index, "value": value}
+                for index, value in enumerate(values)
+            ])}
+        }},
+        "project_level_metrics": [
+            {"project_name": "team-a", "project_id": 7, "timestamp": "2024-01-15T10:00:00Z",
+             "gpu_metrics": {"gpu_limit": 4, "gpu_requested": 2, "gpu_utilization": 50}},
+            {"project_name": "team-b", "project_id": 8, "timestamp": "2024-01-15T10:00:00Z",
+             "error": "boom", "gpu_metrics": {"gpu_limit": 1, "gpu_requested": 0, "gpu_utilization": 0}}
+        ]
+    }
+
+
+class StubReceiver:
+    """OTLP/HTTP receiver recording decoded requests; fails while 'down' is set"""
+    
+    def __init__(self):
+        self.requests = []
+        self.down = threading.Event()
+        receiver = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if receiver.down.is_set():
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                assert self.headers['Content-Encoding'] == 'gzip'
+                receiver.requests.append((dict(self.headers), json.loads(gzip.decompress(body))))
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'{}')
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/metrics"
+    
+    def points(self):
+        """Data points received, as (metric name, attributes, value)"""
+        return [
+            (metric['name'], {a['key']: a['value']['stringValue'] for a in point['attributes']},
+             point['asDouble'])
+            for _, document in self.requests
+            for scope in document['resourceMetrics'][0]['scopeMetrics']
+            for metric in scope['metrics']
+            for point in metric['gauge']['dataPoints']
+        ]
+    
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _wait(condition, timeout=5.0):
+    """Wait until condition() is true"""
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.01)
+
+
+def test_points_and_encoding():
+    """Test clusters convert to gauge points and OTLP JSON"""
+    print("Testing point conversion and OTLP encoding...")
+    
+    points = cluster_points(_cluster([10, None, 30]))
+    names = [point[0] for point in points]
+    assert names.count('runai_cluster_gpu_utilization') == 2
+    assert names.count('runai_cluster_total_gpu') == 1
+    # Failed projects export quota only
+    assert [point[3] for point in points if point[0] == 'runai_project_gpu_utilization'] == [50.0]
+    assert len([point for point in points if point[0] == 'runai_project_gpu_limit']) == 2
+    
+    document = json.loads(encode_otlp(points[:1]))
+    metric = document['resourceMetrics'][0]['scopeMetrics'][0]['metrics'][0]
+    point = metric['gauge']['dataPoints'][0]
+    assert metric['name'] == 'runai_cluster_total_gpu'
+    assert point['timeUnixNano'] == str(1705312800 * 10 ** 9)
+    assert {'key': 'cluster_uuid', 'value': {'stringValue': 'c1'}} in point['attributes']
+    
+    print("✓ Point conversion and OTLP encoding test passed")
+
+
+def test_batching_and_deduplication():
+    """Test size- and time-based flushing, headers and repeated samples"""
+    print("Testing batching and deduplication...")
+    
+    receiver = StubReceiver()
+    try:
+        exporter = PushExporter(receiver.url, headers={'Authorization': 'Bearer t'},
+                                batch_size=4, flush_interval=0.2)
+        submitted = exporter.submit(_cluster([10, 20, 30]))
+        assert submitted == 9
+        
+        # Two full batches are sent at once, the rest after flush_interval
+        _wait(lambda: len(receiver.requests) == 2)
+        _wait(lambda: len(receiver.points()) == 9)
+        assert len(receiver.requests) == 3
+        assert receiver.requests[0][0]['Authorization'] == 'Bearer t'
+        
+        # A cycle repeating the same window only pushes new samples
+        assert exporter.submit(_cluster([10, 20, 30, 40])) == 1
+        exporter.close()
+        assert [point[2] for point in receiver.points()[9:]] == [40.0]
+        assert exporter.stats['sent'] == 10 and exporter.stats['spilled'] == 0
+    finally:
+        receiver.close()
+    
+    print("✓ Batching and deduplication test passed")
+
+
+def test_spill_and_replay():
+    """Test a slow sink spills to disk without blocking and is caught up later"""
+    print("Testing spill to disk and replay...")
+    
+    receiver = StubReceiver()
+    receiver.down.set()
+    with tempfile.TemporaryDirectory() as spill_dir:
+        try:
+            exporter = PushExporter(receiver.url, batch_size=100, flush_interval=0.05,
+                                    max_queue=10, spill_dir=spill_dir, max_retries=2,
+                                    retry_backoff=0.01)
+            
+            # Submitting never waits for the failing sink
+            start = time.monotonic()
+            for index in range(20):
+                exporter.submit(_cluster([index], cluster_uuid=f"c{index}"))
+            assert time.monotonic() - start < 1.0
+            _wait(lambda: exporter.stats['spilled'] == 20 * 7)
+            assert os.listdir(spill_dir)
+            assert receiver.requests == []
+            
+            # Once the sink recovers the spilled batches are delivered
+            receiver.down.clear()
+            _wait(lambda: not os.listdir(spill_dir))
+            exporter.close()
+            assert exporter.stats['replayed'] == 140
+            assert len(receiver.points()) == 140
+            assert exporter.stats['dropped'] == 0
+        finally:
+            receiver.close()
+    
+    print("✓ Spill and replay test passed")
+
+
+def run_all_tests():
+    """Run all test functions"""
+    print("Running Push Exporter Tests")
+    print("=" * 50)
+    
+    tests = [
+        test_points_and_encoding,
+        test_batching_and_deduplication,
+        test_spill_and_replay
+    ]
+    
+    passed = 0
+    failed = 0
+    
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except Exception as e:
+            print(f"✗ {test_func.__name__} failed: {e}")
+            failed += 1
+    
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed} passed, {failed} failed")
+    
+    if failed > 0:
+        print("Some tests failed. Please check the implementation.")
+        return False
+    else:
+        print("All tests passed! ✓")
+        return True
+
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Simple test script for the adaptive rate limiter
+
+This script validates the request pacing and concurrency adjustment used by
+the RunAI GPU Metrics Collector.
+"""
+
+import sys
+import time
+from email.utils import formatdate
+
+# Import the module
+try:
+    from rate_limiter import AdaptiveRateLimiter, parse_retry_after, shared_rate_limiter
+except ImportError:
+    print("Error: Could not import rate_limiter module")
+    sys.exit(1)
+
+
+def test_parse_retry_after():
+    """Test Retry-After values in seconds and HTTP-date form"""
+    print("Testing Retry-After parsing...")
+    
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(" 1.5 ") == 1.5
+    assert parse_retry_after("-4") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    
+    delay = parse_retry_after(formatdate(time.time() + 30, usegmt=True))
+    assert 25 <= delay <= 31
+    assert parse_retry_after(formatdate(time.time() - 30, usegmt=True)) == 0.0
+    
+    print("✓ Retry-After parsing test passed")
+
+
+def test_pacing_and_aimd():
+    """Test the request rate cap and the AIMD concurrency limit"""
+    print("Testing rate limiter pacing and AIMD...")
+    
+    # Burst of 1 at 50 requests/s: five requests need at least 80ms
+    limiter = AdaptiveRateLimiter(rate=50, burst=1, max_concurrency=8, target_latency=0.5)
+    started = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release(200, 0.01)
+    assert time.monotonic() - started >= 0.075
+    assert limiter.in_flight == 0
+    
+    # Throttling halves the limit once per latency window and pauses requests
+    limiter = AdaptiveRateLimiter(rate=1000, max_concurrency=8, target_latency=0.5)
+    limiter.acquire()
+    limiter.acquire()
+    limiter.release(429, 0.01, retry_after="0.1")
+    limiter.release(429, 0.01, retry_after="0.1")
+    assert limiter.concurrency_limit == 4
+    assert limiter.throttled == 2
+    started = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - started >= 0.05
+    limiter.release(200, 0.01)
+    
+    # Fast successes grow the limit additively up to the maximum
+    for _ in range(100):
+        limiter.acquire()
+        limiter.release(200, 0.01)
+    assert limiter.concurrency_limit == 8
+    
+    # Slow responses count as congestion
+    limiter._last_decrease = 0.0
+    limiter.acquire()
+    limiter.release(200, 1.0)
+    assert limiter.concurrency_limit == 4
+    
+    # One limiter per base URL
+    first = shared_rate_limiter("https://limits.run.ai/", rate=5)
+    assert shared_rate_limiter("https://limits.run.ai", rate=10) is first
+    assert first.rate == 5
+    
+    print("✓ Rate limiter pacing and AIMD test passed")
+
+
+def run_all_tests():
+    """Run all test functions"""
+    print("Running Rate Limiter Tests")
+    print("=" * 50)
+    
+    tests = [
+        test_parse_retry_after,
+        test_pacing_and_aimd
+    ]
+    
+    passed = 0
+    failed = 0
+    
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except Exception as e:
+            print(f"✗ {test_func.__name__} failed: {e}")
+            failed += 1
+    
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed} passed, {failed} failed")
+    
+    if failed > 0:
+        print("Some tests failed. Please check the implementation.")
+        return False
+    else:
+        print("All tests passed! ✓")
+        return True
+
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
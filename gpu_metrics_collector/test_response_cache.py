@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Simple test script for the on-disk response cache
+
+This script validates the inventory response cache used by the
+RunAI GPU Metrics Collector.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# Import the module
+try:
+    from response_cache import ResponseCache
+except ImportError:
+    print("Error: Could not import response_cache module")
+    sys.exit(1)
+
+
+def test_put_get_and_persistence():
+    """Test entries survive reopening the cache"""
+    print("Testing cache persistence...")
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "cache.db")
+        
+        cache = ResponseCache(path)
+        assert cache.get("missing") is None
+        cache.put("clusters", '[{"uuid": "c1"}]', etag='"v1"', last_modified=None)
+        cache.close()
+        
+        cache = ResponseCache(path)
+        entry = cache.get("clusters")
+        assert entry['body'] == '[{"uuid": "c1"}]'
+        assert entry['etag'] == '"v1"'
+        assert entry['last_modified'] is None
+        assert 0 <= entry['age'] < 60
+        cache.close()
+    
+    print("✓ Cache persistence test passed")
+
+
+def test_lru_eviction_and_refresh():
+    """Test the least recently used entries are evicted first"""
+    print("Testing cache eviction...")
+    
+    cache = ResponseCache(':memory:', max_entries=2)
+    cache.put("a", "1")
+    time.sleep(0.01)
+    cache.put("b", "2")
+    time.sleep(0.01)
+    # Reading "a" makes "b" the least recently used entry
+    cache.get("a")
+    time.sleep(0.01)
+    cache.put("c", "3")
+    
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a")['body'] == "1"
+    assert cache.get("c")['body'] == "3"
+    
+    age_before = cache.get("a")['age']
+    time.sleep(0.01)
+    cache.refresh("a")
+    assert cache.get("a")['age'] < age_before
+    cache.close()
+    
+    print("✓ Cache eviction test passed")
+
+
+def run_all_tests():
+    """Run all test functions"""
+    print("Running Response Cache Tests")
+    print("=" * 50)
+    
+    tests = [
+        test_put_get_and_persistence,
+        test_lru_eviction_and_refresh
+    ]
+    
+    passed = 0
+    failed = 0
+    
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except Exception as e:
+            print(f"✗ {test_func.__name__} failed: {e}")
+            failed += 1
+    
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed} passed, {failed} failed")
+    
+    if failed > 0:
+        print("Some tests failed. Please check the implementation.")
+        return False
+    else:
+        print("All tests passed! ✓")
+        return True
+
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
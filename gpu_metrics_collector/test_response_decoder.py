@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Simple test script for the response decoder
+
+This script validates the JSON decoding and field pruning used by the
+RunAI GPU Metrics Collector.
+"""
+
+import asyncio
+import io
+import json
+import sys
+from unittest.mock import patch
+
+# Import the module
+try:
+    import response_decoder
+    from response_decoder import (
+        CLUSTER_METRICS_FIELDS, PROJECT_METRICS_FIELDS,
+        decode_fields, decode_fields_async, loads, prune
+    )
+except ImportError:
+    print("Error: Could not import response_decoder module")
+    sys.exit(1)
+
+
+CLUSTER_RESPONSE = {
+    "measurements": [
+        {"type": "GPU_UTILIZATION", "labels": {"a": "b"}, "values": [
+            {"timestamp": "2024-01-15T10:00:00Z", "value": "12.5"},
+            {"timestamp": "2024-01-15T10:05:00Z", "value": "20"}
+        ]},
+        {"type": "TOTAL_GPU", "values": []}
+    ],
+    "metadata": {"query": "x" * 1000, "series": [[1, 2], [3, 4]]}
+}
+
+PROJECT_RESPONSE = {
+    "current": {"resources": [{"type": "gpu", "utilization": {"percentage": 42.5}}],
+                "podCount": 3},
+    "timeRange": {"start": "t0", "data": [
+        {"timestamp": "t1", "resources": [{"type": "gpu", "utilization": {"value": 1.5}}]}
+    ]},
+    "workloads": [{"name": "w", "status": "Running"}]
+}
+
+
+def test_prune_keeps_used_fields():
+    """Test pruning keeps the fields read by the collector and nothing else"""
+    print("Testing field pruning...")
+    
+    assert prune(CLUSTER_RESPONSE, CLUSTER_METRICS_FIELDS) == {"measurements": [
+        {"type": "GPU_UTILIZATION", "values": CLUSTER_RESPONSE["measurements"][0]["values"]},
+        {"type": "TOTAL_GPU", "values": []}
+    ]}
+    assert prune(PROJECT_RESPONSE, PROJECT_METRICS_FIELDS) == {
+        "current": {"resources": PROJECT_RESPONSE["current"]["resources"]},
+        "timeRange": {"data": PROJECT_RESPONSE["timeRange"]["data"]}
+    }
+    # A path inside a kept field does not narrow it
+    assert prune({"a": {"b": 1, "c": 2}}, ("a", "a.b")) == {"a": {"b": 1, "c": 2}}
+    assert prune([], PROJECT_METRICS_FIELDS) == []
+    assert loads(b'{"x": [1, 2.5]}') == {"x": [1, 2.5]}
+    
+    print("✓ Field pruning test passed")
+
+
+def test_decode_fields_from_stream():
+    """Test every decoding path returns the pruned document"""
+    print(f"Testing streamed decoding (ijson: {response_decoder.ijson is not None})...")
+    
+    # The incremental parser is only used if ijson is installed
+    modes = [False, True] if response_decoder.ijson is not None else [False]
+    for incremental in modes:
+        for document, fields in ((CLUSTER_RESPONSE, CLUSTER_METRICS_FIELDS),
+                                 (PROJECT_RESPONSE, PROJECT_METRICS_FIELDS)):
+            body = json.dumps(document).encode()
+            expected = prune(document, fields)
+            
+            class AsyncStream:
+                def __init__(self):
+                    self._buffer = io.BytesIO(body)
+                
+                async def read(self, size=-1):
+                    return self._buffer.read(size)
+            
+            with patch.object(response_decoder, 'INCREMENTAL', incremental):
+                assert decode_fields(io.BytesIO(body), fields) == expected
+                assert asyncio.run(decode_fields_async(AsyncStream(), fields)) == expected
+    
+    print("✓ Streamed decoding test passed")
+
+
+def run_all_tests():
+    """Run all test functions"""
+    print("Running Response Decoder Tests")
+    print("=" * 50)
+    
+    tests = [
+        test_prune_keeps_used_fields,
+        test_decode_fields_from_stream
+    ]
+    
+    passed = 0
+    failed = 0
+    
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except Exception as e:
+            print(f"✗ {test_func.__name__} failed: {e}")
+            failed += 1
+    
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed} passed, {failed} failed")
+    
+    if failed > 0:
+        print("Some tests failed. Please check the implementation.")
+        return False
+    else:
+        print("All tests passed! ✓")
+        return True
+
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
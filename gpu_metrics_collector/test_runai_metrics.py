@@ -6,15 +6,32 @@ This script performs basic validation of the metrics collector
 without making actual API calls.
 """
 
+import asyncio
+import io
 import json
 import sys
 import tempfile
+import threading
+import time
 from datetime import datetime, timedelta
-from unittest.mock import Mock, patch
+from unittest.mock import MagicMock, Mock, patch
+
+import requests
 
 # Import the main module
 try:
-    from runai_gpu_metrics_collector import RunAIAPIClient, GPUMetricsCollector
+    from runai_gpu_metrics_collector import (
+        RunAIAPIClient, GPUMetricsCollector, AsyncGPUMetricsCollector, NDJSONWriter,
+        DeadlineExceeded,
+        parse_duration, plan_time_windows, plan_project_requests,
+        merge_cluster_metrics, merge_project_metrics
+    )
+    from compact_series import json_default
+    from circuit_breaker import CircuitBreaker
+    from metrics_store import MetricsStore, to_epoch
+    from rate_limiter import AdaptiveRateLimiter
+    from response_cache import ResponseCache
+    from sharding import merge_shard_documents
 except ImportError:
     print("Error: Could not import runai_gpu_metrics_collector module")
     sys.exit(1)
@@ -224,6 +241,923 @@ def test_mock_data_processing():
     print("✓ Mock data processing test passed")
 
 
+def test_concurrent_project_collection():
+    """Test concurrent project collection keeps sequential order and errors"""
+    print("Testing concurrent project collection...")
+    
+    mock_projects = [{"name": f"project-{i}", "id": f"proj-{i}"} for i in range(8)]
+    mock_quotas = [
+        {"name": f"project-{i}", "deservedGpus": i, "allocatedGpus": i}
+        for i in range(8)
+    ]
+    
+    def fake_project_metrics(cluster_uuid, project_id, start_time, end_time):
+        index = int(project_id.split('-')[1])
+        # Later projects finish first to shake out any ordering assumptions
+        time.sleep(0.01 * (8 - index))
+        if index == 3:
+            raise RuntimeError("boom")
+        return {"current": {"resources": [
+            {"type": "gpu", "utilization": {"percentage": float(index * 10)}}
+        ]}}
+    
+    start_time = datetime.now() - timedelta(hours=1)
+    end_time = datetime.now()
+    results = {}
+    
+    for concurrency in (1, 4):
+        client = RunAIAPIClient("https://test.run.ai", "test-token")
+        collector = GPUMetricsCollector(client, max_concurrency=concurrency)
+        with patch.object(client, 'get_projects', return_value=mock_projects), \
+             patch.object(client, 'get_projects_quotas', return_value=mock_quotas), \
+             patch.object(client, 'get_project_metrics', side_effect=fake_project_metrics):
+            results[concurrency] = collector.collect_project_gpu_metrics(
+                cluster_uuid="test-cluster",
+                start_time=start_time,
+                end_time=end_time
+            )
+    
+    sequential, concurrent = results[1], results[4]
+    assert [p['project_id'] for p in concurrent] == [p['project_id'] for p in sequential]
+    assert [p['gpu_metrics'] for p in concurrent] == [p['gpu_metrics'] for p in sequential]
+    assert concurrent[3]['error'] == "boom"
+    assert concurrent[3]['gpu_metrics']['gpu_limit'] == 3
+    assert concurrent[5]['gpu_metrics']['gpu_utilization'] == 50.0
+    
+    print("✓ Concurrent project collection test passed")
+
+
+def test_parallel_cluster_collection():
+    """Test parallel cluster collection respects the budget and keeps order"""
+    print("Testing parallel cluster collection...")
+    
+    mock_clusters = [{"uuid": f"cluster-{i}", "name": f"cluster-{i}"} for i in range(4)]
+    in_flight = {"current": 0, "peak": 0}
+    lock = threading.Lock()
+    
+    def tracked(result):
+        def call(*args, **kwargs):
+            with lock:
+                in_flight["current"] += 1
+                in_flight["peak"] = max(in_flight["peak"], in_flight["current"])
+            time.sleep(0.02)
+            with lock:
+                in_flight["current"] -= 1
+            return result(*args, **kwargs) if callable(result) else result
+        return call
+    
+    def fake_projects(cluster_uuid):
+        return [{"name": f"{cluster_uuid}-p{i}", "id": f"{cluster_uuid}-p{i}"} for i in range(3)]
+    
+    client = RunAIAPIClient("https://test.run.ai", "test-token")
+    collector = GPUMetricsCollector(client, max_concurrency=3, parallel_clusters=True)
+    
+    with patch.object(client, 'get_clusters', return_value=mock_clusters), \
+         patch.object(client, 'get_cluster_metrics', side_effect=tracked({"measurements": []})), \
+         patch.object(client, 'get_projects', side_effect=tracked(fake_projects)), \
+         patch.object(client, 'get_projects_quotas', side_effect=tracked([])), \
+         patch.object(client, 'get_project_metrics', side_effect=tracked({})):
+        metrics = collector.collect_all_metrics()
+    
+    assert [c['cluster_uuid'] for c in metrics['clusters']] == [c['uuid'] for c in mock_clusters]
+    for cluster in metrics['clusters']:
+        names = [p['project_name'] for p in cluster['project_level_metrics']]
+        assert names == [f"{cluster['cluster_uuid']}-p{i}" for i in range(3)]
+    assert 1 < in_flight["peak"] <= 3
+    
+    print("✓ Parallel cluster collection test passed")
+
+
+def test_async_collection():
+    """Test the async collector with a fake async client"""
+    print("Testing async collection...")
+    
+    in_flight = {"current": 0, "peak": 0}
+    calls = []
+    
+    class FakeAsyncClient:
+        async def _tracked(self, result):
+            in_flight["current"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["current"])
+            await asyncio.sleep(0.01)
+            in_flight["current"] -= 1
+            if isinstance(result, Exception):
+                raise result
+            return result
+        
+        async def get_clusters(self):
+            return await self._tracked([{"uuid": "c1", "name": "one"}, {"uuid": "c2", "name": "two"}])
+        
+        async def get_cluster_metrics(self, cluster_uuid, metric_types, start_time, end_time):
+            return await self._tracked({"measurements": [
+                {"type": "TOTAL_GPU", "values": [{"timestamp": "t", "value": 8}]}
+            ]})
+        
+        async def get_projects(self, cluster_uuid):
+            calls.append(cluster_uuid)
+            return await self._tracked([
+                {"name": f"{cluster_uuid}-p{i}", "id": f"{cluster_uuid}-p{i}"} for i in range(20)
+            ])
+        
+        async def get_projects_quotas(self, cluster_uuid):
+            return await self._tracked([{"name": f"{cluster_uuid}-p0", "deservedGpus": 4}])
+        
+        async def get_project_metrics(self, cluster_uuid, project_id, start_time, end_time):
+            calls.append(cluster_uuid)
+            if project_id.endswith("p1"):
+                return await self._tracked(RuntimeError("boom"))
+            return await self._tracked({"current": {"resources": [
+                {"type": "gpu", "utilization": {"percentage": 42.0}}
+            ]}})
+    
+    collector = AsyncGPUMetricsCollector(FakeAsyncClient(), max_concurrency=5)
+    metrics = asyncio.run(collector.collect_all_metrics())
+    
+    assert [c['cluster_name'] for c in metrics['clusters']] == ["one", "two"]
+    cluster = metrics['clusters'][0]
+    assert cluster['cluster_level_metrics']['metrics']['TOTAL_GPU']['current_value'] == 8
+    projects = cluster['project_level_metrics']
+    assert [p['project_id'] for p in projects] == [f"c1-p{i}" for i in range(20)]
+    assert projects[0]['gpu_metrics'] == {"gpu_limit": 4, "gpu_requested": 0, "gpu_utilization": 42.0}
+    assert projects[1]['error'] == "boom"
+    assert 1 < in_flight["peak"] <= 5
+    
+    # Without parallel_clusters the second cluster starts after the first
+    calls.clear()
+    collector = AsyncGPUMetricsCollector(FakeAsyncClient(), max_concurrency=5,
+                                         parallel_clusters=False)
+    metrics = asyncio.run(collector.collect_all_metrics())
+    assert [c['cluster_name'] for c in metrics['clusters']] == ["one", "two"]
+    assert calls == sorted(calls) and calls.count("c2") == 21
+    
+    # Streaming is a coroutine too; the thread-based fan-out is not available
+    written = []
+    summary = asyncio.run(collector.stream_all_metrics(written.append))
+    assert summary == {'clusters': 2, 'projects': 40, 'incomplete': 0}
+    assert [r['record_type'] for r in written[:3]] == ['collection', 'cluster', 'project']
+    try:
+        collector._iter_clusters_parallel([], datetime.now(), datetime.now())
+        assert False, "Expected NotImplementedError"
+    except NotImplementedError:
+        pass
+    
+    print("✓ Async collection test passed")
+
+
+def test_ndjson_streaming():
+    """Test streaming collection writes one compact record per line"""
+    print("Testing NDJSON streaming output...")
+    
+    mock_projects = [{"name": "project-1", "id": "proj-1"}, {"name": "project-2", "id": "proj-2"}]
+    mock_cluster_metrics = {"measurements": [
+        {"type": "TOTAL_GPU", "values": [{"timestamp": "2024-01-15T10:30:00Z", "value": 32}]}
+    ]}
+    
+    client = RunAIAPIClient("https://test.run.ai", "test-token")
+    collector = GPUMetricsCollector(client)
+    output = io.StringIO()
+    writer = NDJSONWriter(output)
+    
+    with patch.object(client, 'get_clusters', return_value=[{"uuid": "c1", "name": "one"}]), \
+         patch.object(client, 'get_cluster_metrics', return_value=mock_cluster_metrics), \
+         patch.object(client, 'get_projects', return_value=mock_projects), \
+         patch.object(client, 'get_projects_quotas', return_value=[]), \
+         patch.object(client, 'get_project_metrics', side_effect=[{}, RuntimeError("boom")]):
+        summary = collector.stream_all_metrics(writer.write)
+    
+    lines = output.getvalue().splitlines()
+    records = [json.loads(line) for line in lines]
+    
+    assert summary == {"clusters": 1, "projects": 2, "incomplete": 0}
+    assert writer.records_written == 4
+    assert [r['record_type'] for r in records] == ["collection", "cluster", "project", "project"]
+    assert records[1]['cluster_level_metrics']['metrics']['TOTAL_GPU']['current_value'] == 32
+    assert records[2]['project_name'] == "project-1"
+    assert records[2]['cluster_name'] == "one"
+    assert records[3]['error'] == "boom"
+    assert all(": " not in line for line in lines)
+    
+    print("✓ NDJSON streaming output test passed")
+
+
+def test_output_profiles():
+    """Test output profiles control which raw payloads are retained"""
+    print("Testing output profiles...")
+    
+    mock_cluster_metrics = {"measurements": [
+        {"type": "TOTAL_GPU", "values": [{"timestamp": "2024-01-15T10:30:00Z", "value": 32}]}
+    ]}
+    mock_project_metrics = {"current": {"resources": [
+        {"type": "gpu", "utilization": {"percentage": 80.2}}
+    ]}}
+    start_time = datetime.now() - timedelta(hours=1)
+    end_time = datetime.now()
+    retained = {}
+    
+    for profile in ("summary", "series", "full"):
+        client = RunAIAPIClient("https://test.run.ai", "test-token")
+        collector = GPUMetricsCollector(client, output_profile=profile)
+        with patch.object(client, 'get_cluster_metrics', return_value=mock_cluster_metrics), \
+             patch.object(client, 'get_projects', return_value=[{"name": "project-1", "id": "proj-1"}]), \
+             patch.object(client, 'get_projects_quotas', return_value=[{"name": "project-1", "deservedGpus": 8}]), \
+             patch.object(client, 'get_project_metrics', return_value=mock_project_metrics):
+            cluster = collector.collect_cluster_gpu_metrics("c1", start_time, end_time)
+            project = collector.collect_project_gpu_metrics("c1", start_time, end_time)[0]
+        
+        assert cluster['metrics']['TOTAL_GPU']['current_value'] == 32
+        assert project['gpu_metrics']['gpu_limit'] == 8
+        assert project['gpu_metrics']['gpu_utilization'] == 80.2
+        retained[profile] = (
+            'all_values' in cluster['metrics']['TOTAL_GPU'],
+            'gpu_utilization_series' in project,
+            'raw_metrics' in project,
+            'raw_quota' in project
+        )
+    
+    assert retained == {
+        "summary": (False, False, False, False),
+        "series": (True, True, False, False),
+        "full": (True, True, True, True)
+    }
+    
+    try:
+        GPUMetricsCollector(RunAIAPIClient("https://test.run.ai", "test-token"), output_profile="tiny")
+        raise AssertionError("Unknown profile was accepted")
+    except ValueError:
+        pass
+    
+    print("✓ Output profiles test passed")
+
+
+def test_collected_records_are_plain_json():
+    """Test library callers can json.dumps collected records without json_default"""
+    print("Testing plain JSON serialization of collected records...")
+    
+    mock_cluster_metrics = {"measurements": [
+        {"type": "GPU_UTILIZATION", "values": [
+            {"timestamp": "2024-01-15T10:30:00Z", "value": 40},
+            {"timestamp": "2024-01-15T10:31:00Z", "value": 60}
+        ]}
+    ]}
+    mock_project_metrics = {"current": {"resources": [
+        {"type": "gpu", "utilization": {"percentage": 80.2}}
+    ]}, "timeRange": {"data": [
+        {"timestamp": "2024-01-15T10:30:00Z",
+         "resources": [{"type": "gpu", "utilization": {"value": 70.5}}]}
+    ]}}
+    
+    for compact in (False, True):
+        client = RunAIAPIClient("https://test.run.ai", "test-token")
+        collector = GPUMetricsCollector(client, compact_series=compact)
+        with patch.object(client, 'get_clusters', return_value=[{"uuid": "c1", "name": "one"}]), \
+             patch.object(client, 'get_cluster_metrics', return_value=mock_cluster_metrics), \
+             patch.object(client, 'get_projects', return_value=[{"name": "project-1", "id": "proj-1"}]), \
+             patch.object(client, 'get_projects_quotas', return_value=[]), \
+             patch.object(client, 'get_project_metrics', return_value=mock_project_metrics):
+            metrics = collector.collect_all_metrics()
+        
+        if compact:
+            document = json.loads(json.dumps(metrics, default=json_default))
+        else:
+            document = json.loads(json.dumps(metrics))
+        cluster = document['clusters'][0]
+        assert cluster['cluster_level_metrics']['metrics']['GPU_UTILIZATION']['all_values'] == \
+            mock_cluster_metrics['measurements'][0]['values']
+        assert cluster['project_level_metrics'][0]['gpu_metrics']['gpu_utilization'] == 80.2
+    
+    print("✓ Plain JSON serialization test passed")
+
+
+def test_incremental_collection_with_store():
+    """Test that a second run only requests data newer than the watermark"""
+    print("Testing incremental collection with the metrics store...")
+    
+    now = datetime.now().replace(microsecond=0)
+    latest = now - timedelta(minutes=10)
+    mock_cluster_metrics = {"measurements": [
+        {"type": metric_type, "values": [
+            {"timestamp": (latest - timedelta(minutes=5)).isoformat(), "value": 16},
+            {"timestamp": latest.isoformat(), "value": 32}
+        ]}
+        for metric_type in GPUMetricsCollector.CLUSTER_METRIC_TYPES
+    ]}
+    mock_project_metrics = {"timeRange": {"data": [
+        {"timestamp": (latest - timedelta(minutes=5)).isoformat(),
+         "resources": [{"type": "gpu", "utilization": {"value": 40.0}}]},
+        {"timestamp": latest.isoformat(),
+         "resources": [{"type": "gpu", "utilization": {"value": 60.0}}]}
+    ]}}
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = MetricsStore(f"{tmpdir}/metrics.db")
+        client = RunAIAPIClient("https://test.run.ai", "test-token")
+        collector = GPUMetricsCollector(client, store=store)
+        
+        with patch.object(client, 'get_cluster_metrics', return_value=mock_cluster_metrics) as cluster_call, \
+             patch.object(client, 'get_projects', return_value=[{"name": "project-1", "id": "proj-1"}]), \
+             patch.object(client, 'get_projects_quotas', return_value=[{"name": "project-1", "allocatedGpus": 2}]), \
+             patch.object(client, 'get_project_metrics', return_value=mock_project_metrics) as project_call:
+            first = collector.collect_all_metrics(cluster_uuid="c1", hours_back=24)
+            second = collector.collect_all_metrics(cluster_uuid="c1", hours_back=24)
+        
+        first_start = cluster_call.call_args_list[0].kwargs['start_time']
+        second_start = cluster_call.call_args_list[1].kwargs['start_time']
+        assert first_start < now - timedelta(hours=23)
+        assert to_epoch(second_start) == to_epoch(latest)
+        
+        # Utilization samples are stored with their own timestamps
+        project_start = project_call.call_args_list[1].kwargs['start_time']
+        assert to_epoch(project_start) == to_epoch(latest)
+        assert store.get_series("c1", "gpu_utilization", project_id="proj-1") == [
+            (to_epoch(latest - timedelta(minutes=5)), 40.0), (to_epoch(latest), 60.0)
+        ]
+        
+        # Narrowed windows keep the requested start
+        cluster_range = second['clusters'][0]['cluster_level_metrics']['time_range']
+        assert cluster_range['start'] == second_start.isoformat()
+        assert cluster_range['requested_start'] < second_start.isoformat()
+        assert 'requested_start' not in first['clusters'][0]['cluster_level_metrics']['time_range']
+        project_range = second['clusters'][0]['project_level_metrics'][0]['time_range']
+        assert project_range['start'] == project_start.isoformat()
+        assert project_range['requested_start'] < project_range['start']
+        
+        assert [v for _, v in store.get_series("c1", "TOTAL_GPU")] == [16.0, 32.0]
+        assert store.get_series("c1", "gpu_requested", project_id="proj-1")[-1][1] == 2.0
+        store.close()
+    
+    print("✓ Incremental collection test passed")
+
+
+def test_store_skips_null_quota_values():
+    """Test null quota values are not stored and do not fail the project"""
+    print("Testing null quota values with the metrics store...")
+    
+    projects = [{"name": "busy", "id": "p1"}, {"name": "idle", "id": "p2"}]
+    quotas = [
+        {"name": "busy", "deservedGpus": None, "allocatedGpus": 2},
+        {"name": "idle", "deservedGpus": None, "allocatedGpus": None}
+    ]
+    mock_project_metrics = {"current": {"resources": [
+        {"type": "gpu", "utilization": {"percentage": 50.0}}
+    ]}}
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = MetricsStore(f"{tmpdir}/metrics.db")
+        client = RunAIAPIClient("https://test.run.ai", "test-token")
+        collector = GPUMetricsCollector(client, store=store, skip_idle_projects=True)
+        with patch.object(client, 'get_projects', return_value=projects), \
+             patch.object(client, 'get_projects_quotas', return_value=quotas), \
+             patch.object(client, 'get_project_metrics', return_value=mock_project_metrics):
+            start_time = datetime.now() - timedelta(hours=1)
+            results = collector.collect_project_gpu_metrics("c1", start_time, datetime.now())
+        
+        # Both the fetched and the idle project are recorded without an error
+        assert [r['project_id'] for r in results] == ["p1", "p2"]
+        assert not any('error' in r for r in results)
+        assert results[1]['skipped_idle'] is True
+        assert store.get_series("c1", "gpu_limit", project_id="p1") == []
+        assert store.get_series("c1", "gpu_requested", project_id="p1")[-1][1] == 2.0
+        assert store.get_series("c1", "gpu_utilization", project_id="p1")[-1][1] == 50.0
+        assert store.get_series("c1", "gpu_requested", project_id="p2") == []
+        store.close()
+    
+    print("✓ Null quota values test passed")
+
+
+def test_inventory_cache_with_revalidation():
+    """Test inventory responses are cached and revalidated with ETags"""
+    print("Testing inventory response cache...")
+    
+    def make_response(status, body=None, headers=None):
+        response = Mock()
+        response.status_code = status
+        response.headers = headers or {}
+        response.text = json.dumps(body)
+        response.content = response.text.encode()
+        response.raise_for_status.return_value = None
+        return response
+    
+    cache = ResponseCache(':memory:')
+    client = RunAIAPIClient("https://test.run.ai", "test-token", cache=cache,
+                            cache_ttls={'clusters': 3600, 'projects': 0})
+    clusters = [{"uuid": "c1", "name": "one"}]
+    projects = [{"name": "project-1", "id": "proj-1"}]
+    
+    with patch.object(client.session, 'request', side_effect=[
+        make_response(200, clusters, {'ETag': '"c-v1"'}),
+        make_response(200, projects, {'ETag': '"p-v1"', 'Last-Modified': 'Mon, 15 Jan 2024 10:30:00 GMT'}),
+        make_response(304),
+        make_response(200, {"current": {}})
+    ]) as request:
+        assert client.get_clusters() == clusters
+        # Fresh entry: served without touching the network
+        assert client.get_clusters() == clusters
+        assert request.call_count == 1
+        
+        assert client.get_projects("c1") == projects
+        # TTL 0: revalidated with a conditional request, 304 serves the cache
+        assert client.get_projects("c1") == projects
+        assert request.call_count == 3
+        conditional_headers = request.call_args_list[2].kwargs['headers']
+        assert conditional_headers['If-None-Match'] == '"p-v1"'
+        assert conditional_headers['If-Modified-Since'] == 'Mon, 15 Jan 2024 10:30:00 GMT'
+        
+        # Metrics are never cached
+        start_time = datetime.now() - timedelta(hours=1)
+        client.get_project_metrics("c1", "proj-1", start_time, datetime.now())
+        assert request.call_count == 4
+        assert request.call_args_list[3].kwargs['headers'] == {}
+    
+    # Another token does not see the cached entries
+    other = RunAIAPIClient("https://test.run.ai", "other-token", cache=cache)
+    with patch.object(other.session, 'request', return_value=make_response(200, [])) as request:
+        assert other.get_clusters() == []
+        assert request.call_count == 1
+    cache.close()
+    
+    print("✓ Inventory response cache test passed")
+
+
+def test_time_window_planning():
+    """Test long ranges are split into fixed-resolution windows"""
+    print("Testing time window planning...")
+    
+    assert parse_duration("5m") == timedelta(minutes=5)
+    assert parse_duration("1.5h") == timedelta(minutes=90)
+    for invalid in ("5", "0m", "5w", ""):
+        try:
+            parse_duration(invalid)
+            raise AssertionError(f"{invalid!r} was accepted")
+        except ValueError:
+            pass
+    
+    end_time = datetime(2024, 2, 1)
+    start_time = end_time - timedelta(days=30)
+    windows = plan_time_windows(start_time, end_time, timedelta(minutes=5), 500)
+    
+    # 30 days at 5m = 8640 samples -> 17 full windows and one of 140
+    assert len(windows) == 18
+    assert windows[0] == (start_time, start_time + timedelta(minutes=2500), 500)
+    assert windows[-1][2] == 140
+    assert windows[-1][1] == end_time
+    assert all(a[1] == b[0] for a, b in zip(windows, windows[1:]))
+    
+    short = plan_time_windows(end_time - timedelta(hours=1), end_time, timedelta(minutes=5), 500)
+    assert short == [(end_time - timedelta(hours=1), end_time, 12)]
+    
+    print("✓ Time window planning test passed")
+
+
+def test_windowed_fetch_merges_series():
+    """Test windowed responses are merged, ordered and de-duplicated"""
+    print("Testing windowed metric fetching...")
+    
+    merged = merge_cluster_metrics([
+        {"measurements": [{"type": "TOTAL_GPU", "values": [
+            {"timestamp": "2024-01-15T10:00:00Z", "value": 8},
+            {"timestamp": "2024-01-15T10:05:00Z", "value": 8}
+        ]}]},
+        {"measurements": [{"type": "TOTAL_GPU", "values": [
+            {"timestamp": "2024-01-15T10:10:00Z", "value": 16},
+            {"timestamp": "2024-01-15T10:05:00Z", "value": 12}
+        ]}]}
+    ])
+    assert merged["measurements"][0]["values"] == [
+        {"timestamp": "2024-01-15T10:00:00Z", "value": 8},
+        {"timestamp": "2024-01-15T10:05:00Z", "value": 12},
+        {"timestamp": "2024-01-15T10:10:00Z", "value": 16}
+    ]
+    
+    project = merge_project_metrics([
+        {"current": {"old": True}, "timeRange": {"data": [{"timestamp": 2}, {"timestamp": 1}]}},
+        {"current": {"old": False}, "timeRange": {"data": [{"timestamp": 3}, {"timestamp": 2}]}}
+    ])
+    assert project["current"] == {"old": False}
+    assert [p["timestamp"] for p in project["timeRange"]["data"]] == [1, 2, 3]
+    
+    def fake_cluster_metrics(cluster_uuid, metric_types, start_time, end_time, number_of_samples):
+        return {"measurements": [{"type": "TOTAL_GPU", "values": [
+            {"timestamp": start_time.isoformat(), "value": number_of_samples},
+            {"timestamp": end_time.isoformat(), "value": number_of_samples}
+        ]}]}
+    
+    client = RunAIAPIClient("https://test.run.ai", "test-token")
+    collector = GPUMetricsCollector(client, max_concurrency=4, step=timedelta(minutes=5),
+                                    max_samples_per_request=12)
+    end_time = datetime(2024, 1, 15, 12, 0)
+    with patch.object(client, 'get_cluster_metrics', side_effect=fake_cluster_metrics) as call:
+        metrics = collector.collect_cluster_gpu_metrics("c1", end_time - timedelta(hours=3), end_time)
+        executor = collector._window_executor
+        collector.collect_cluster_gpu_metrics("c1", end_time - timedelta(hours=3), end_time)
+    
+    # Every call fetches its windows on the collector's one executor
+    assert executor is not None and collector._window_executor is executor
+    collector.close()
+    assert collector._window_executor is None
+    assert call.call_count == 6
+    assert all(c.kwargs['number_of_samples'] == 12 for c in call.call_args_list)
+    values = metrics['metrics']['TOTAL_GPU']['all_values']
+    # 3 windows share 2 boundaries, which are de-duplicated
+    assert len(values) == 4
+    assert values[-1]['timestamp'] == end_time.isoformat()
+    
+    print("✓ Windowed metric fetching test passed")
+
+
+def test_rate_limited_client_retries_throttled_requests():
+    """Test a rate-limited client honours Retry-After and retries on 429"""
+    print("Testing rate-limited API client...")
+    
+    def make_response(status, body=None, headers=None):
+        response = Mock()
+        response.status_code = status
+        response.headers = headers or {}
+        response.text = json.dumps(body)
+        response.content = response.text.encode()
+        response.raise_for_status.return_value = None
+        return response
+    
+    limiter = AdaptiveRateLimiter(rate=1000, max_concurrency=4, target_latency=5)
+    client = RunAIAPIClient("https://test.run.ai", "test-token", rate_limiter=limiter)
+    # 429 is left to the limiter instead of urllib3's retries
+    adapter_retry = client.session.get_adapter("https://test.run.ai").max_retries
+    assert 429 not in adapter_retry.status_forcelist
+    
+    clusters = [{"uuid": "c1", "name": "one"}]
+    with patch.object(client.session, 'request', side_effect=[
+        make_response(429, headers={'Retry-After': '0.1'}),
+        make_response(200, clusters)
+    ]) as request:
+        started = time.monotonic()
+        assert client.get_clusters() == clusters
+        assert time.monotonic() - started >= 0.05
+        assert request.call_count == 2
+    
+    assert limiter.throttled == 1
+    assert limiter.in_flight == 0
+    assert limiter.concurrency_limit < 4
+    
+    print("✓ Rate-limited API client test passed")
+
+
+def test_circuit_breaker_short_circuits_projects():
+    """Test an open circuit skips the remaining projects of a cluster"""
+    print("Testing circuit breaker in the collector...")
+    
+    client = RunAIAPIClient("https://test.run.ai", "test-token")
+    breaker = CircuitBreaker(error_rate=0.5, min_calls=3, cooldown=60)
+    collector = GPUMetricsCollector(client, circuit_breaker=breaker)
+    projects = [{"name": f"project-{i}", "id": f"proj-{i}"} for i in range(10)]
+    outage = requests.ConnectionError("connection refused")
+    
+    with patch.object(client, 'get_projects', return_value=projects), \
+         patch.object(client, 'get_projects_quotas', return_value=[]), \
+         patch.object(client, 'get_project_metrics', side_effect=outage) as metrics_call:
+        start_time = datetime.now() - timedelta(hours=1)
+        results = collector.collect_project_gpu_metrics("c1", start_time, datetime.now())
+    
+    # The circuit opens after 3 failed calls; the other 7 projects are skipped
+    assert metrics_call.call_count == 3
+    assert len(results) == 10
+    assert all('error' in result for result in results)
+    assert not any(result.get('circuit_open') for result in results[:3])
+    assert all(result.get('circuit_open') for result in results[3:])
+    assert breaker.state("c1/project_metrics") == 'open'
+    assert breaker.state("c1/projects") == 'closed'
+    
+    # Client errors of single projects do not count as an outage
+    not_found = requests.HTTPError("404", response=Mock(status_code=404))
+    assert not GPUMetricsCollector._is_outage(not_found)
+    assert GPUMetricsCollector._is_outage(requests.HTTPError("503", response=Mock(status_code=503)))
+    
+    print("✓ Collector circuit breaker test passed")
+
+
+def test_deadline_does_not_change_circuits():
+    """Test calls cut off by the deadline neither open nor close a circuit"""
+    print("Testing circuit breaker with a collection deadline...")
+    
+    client = RunAIAPIClient("https://test.run.ai", "test-token")
+    breaker = CircuitBreaker(error_rate=0.5, min_calls=1, cooldown=0.05)
+    collector = GPUMetricsCollector(client, circuit_breaker=breaker)
+    circuit = ("c1", "project_metrics")
+    name = CircuitBreaker.circuit_name(*circuit)
+    
+    def call(error):
+        try:
+            collector._guarded_call(circuit, Mock(side_effect=error))
+            raise AssertionError("Call did not fail")
+        except type(error):
+            pass
+    
+    # A request the deadline cut off does not open the circuit
+    client.deadline = time.monotonic() - 1
+    call(requests.ReadTimeout("read timed out"))
+    assert breaker.state(name) == 'closed'
+    client.deadline = None
+    call(requests.ReadTimeout("read timed out"))
+    assert breaker.state(name) == 'open'
+    
+    # A probe stopped by the deadline leaves the circuit half-open for the next probe
+    time.sleep(0.06)
+    call(DeadlineExceeded("Collection deadline exceeded"))
+    assert breaker.state(name) == 'half_open'
+    assert collector._guarded_call(circuit, Mock(return_value={})) == {}
+    assert breaker.state(name) == 'closed'
+    
+    print("✓ Circuit breaker deadline test passed")
+
+
+def test_request_timeouts_and_deadline():
+    """Test requests carry timeouts and a deadline returns partial results"""
+    print("Testing request timeouts and collection deadline...")
+    
+    client = RunAIAPIClient("https://test.run.ai", "test-token",
+                            connect_timeout=3, read_timeout=7)
+    response = Mock(status_code=200, headers={}, content=b"[]")
+    with patch.object(client.session, 'request', return_value=response) as request:
+        client.get_clusters()
+        assert request.call_args.kwargs['timeout'] == (3, 7)
+        
+        # In-flight requests are cut short by the deadline
+        client.deadline = time.monotonic() + 0.5
+        client.get_clusters()
+        assert all(t <= 0.5 for t in request.call_args.kwargs['timeout'])
+        
+        client.deadline = time.monotonic() - 1
+        try:
+            client.get_clusters()
+            raise AssertionError("Request sent after the deadline")
+        except DeadlineExceeded:
+            pass
+        assert request.call_count == 2
+    client.deadline = None
+    
+    projects = [{"name": f"project-{i}", "id": f"proj-{i}"} for i in range(6)]
+    
+    def slow_project_metrics(cluster_uuid, project_id, start_time, end_time):
+        client._request_timeout()  # Raises like a real request once the deadline passed
+        time.sleep(0.1)
+        return {"current": {"resources": [{"type": "gpu", "utilization": {"percentage": 50}}]}}
+    
+    collector = GPUMetricsCollector(client)
+    with patch.object(client, 'get_cluster_metrics', return_value={"measurements": []}), \
+         patch.object(client, 'get_projects', return_value=projects), \
+         patch.object(client, 'get_projects_quotas', return_value=[]), \
+         patch.object(client, 'get_project_metrics', side_effect=slow_project_metrics):
+        started = time.monotonic()
+        result = collector.collect_all_metrics(cluster_uuid="c1", deadline=0.25)
+        elapsed = time.monotonic() - started
+    
+    assert elapsed < 0.5
+    assert result['deadline_exceeded'] is True
+    project_entries = result['clusters'][0]['project_level_metrics']
+    assert len(project_entries) == 6
+    finished = [p for p in project_entries if 'error' not in p]
+    missing = [p for p in project_entries if p.get('deadline_exceeded')]
+    assert finished and missing
+    assert len(finished) + len(missing) == 6
+    assert client.deadline is None
+    
+    print("✓ Request timeouts and deadline test passed")
+
+
+def test_quota_planner_skips_idle_projects():
+    """Test idle projects are filled in without requests and busy ones go first"""
+    print("Testing quota-driven project planner...")
+    
+    projects = [{"name": name, "id": f"id-{name}"} for name in ("a", "b", "c", "d", "e")]
+    quotas = [
+        {"name": "a", "deservedGpus": 4, "allocatedGpus": 0},
+        {"name": "b", "deservedGpus": 4, "allocatedGpus": 2},
+        {"name": "c", "deservedGpus": 8, "allocatedGpus": 8},
+        {"name": "d", "deservedGpus": 2, "allocatedGpus": None}
+    ]
+    quota_lookup = {quota["name"]: quota for quota in quotas}
+    fetch, idle = plan_project_requests(projects, quota_lookup)
+    # Busiest first, then projects without a quota entry
+    assert [p["name"] for p in fetch] == ["c", "b", "e"]
+    assert [p["name"] for p in idle] == ["a", "d"]
+    
+    client = RunAIAPIClient("https://test.run.ai", "test-token")
+    collector = GPUMetricsCollector(client, skip_idle_projects=True)
+    metrics = {"current": {"resources": [{"type": "gpu", "utilization": {"percentage": 60}}]}}
+    with patch.object(client, 'get_projects', return_value=projects), \
+         patch.object(client, 'get_projects_quotas', return_value=quotas), \
+         patch.object(client, 'get_project_metrics', return_value=metrics) as metrics_call:
+        start_time = datetime.now() - timedelta(hours=1)
+        results = collector.collect_project_gpu_metrics("c1", start_time, datetime.now())
+    
+    assert [c.kwargs['project_id'] for c in metrics_call.call_args_list] == ["id-c", "id-b", "id-e"]
+    assert [r["project_name"] for r in results] == ["c", "b", "e", "a", "d"]
+    assert results[0]["gpu_metrics"]["gpu_utilization"] == 60
+    idle_record = results[3]
+    assert idle_record["skipped_idle"] is True
+    assert idle_record["gpu_metrics"] == {"gpu_limit": 4, "gpu_requested": 0, "gpu_utilization": 0.0}
+    
+    print("✓ Quota-driven project planner test passed")
+
+
+def test_nodepool_breakdown():
+    """Test project metrics are fetched per nodepool next to the totals"""
+    print("Testing nodepool breakdown...")
+    
+    threads = {}
+    
+    def fake_project_metrics(cluster_uuid, project_id, start_time, end_time, nodepool_name=None):
+        threads.setdefault(project_id, set()).add(threading.current_thread().name)
+        utilization = {None: 40, "default": 10, "a100": 70}[nodepool_name]
+        return {"current": {"resources": [{"type": "gpu", "utilization": {"percentage": utilization}}]}}
+    
+    client = RunAIAPIClient("https://test.run.ai", "test-token")
+    collector = GPUMetricsCollector(client, max_concurrency=4, output_profile='summary',
+                                    nodepool_breakdown=True)
+    projects = [{"name": "project-1", "id": "proj-1"}, {"name": "project-2", "id": "proj-2"}]
+    with patch.object(client, 'get_projects', return_value=projects), \
+         patch.object(client, 'get_projects_quotas', return_value=[]), \
+         patch.object(client, 'get_nodepools', return_value=[{"name": "default"}, {"name": "a100"}]), \
+         patch.object(client, 'get_project_metrics', side_effect=fake_project_metrics) as metrics_call:
+        start_time = datetime.now() - timedelta(hours=1)
+        results = collector.collect_project_gpu_metrics("c1", start_time, datetime.now())
+    
+    # One rolled-up request plus one per nodepool for every project, all
+    # sent by the worker collecting the project
+    assert metrics_call.call_count == 6
+    assert all(len(names) == 1 for names in threads.values())
+    for result in results:
+        assert result["gpu_metrics"]["gpu_utilization"] == 40
+        assert result["nodepool_metrics"] == {
+            "default": {"gpu_utilization": 10.0},
+            "a100": {"gpu_utilization": 70.0}
+        }
+    
+    # Without the option no nodepool requests are made
+    collector = GPUMetricsCollector(client)
+    with patch.object(client, 'get_projects', return_value=projects[:1]), \
+         patch.object(client, 'get_projects_quotas', return_value=[]), \
+         patch.object(client, 'get_nodepools') as nodepools_call, \
+         patch.object(client, 'get_project_metrics', side_effect=fake_project_metrics):
+        results = collector.collect_project_gpu_metrics("c1", start_time, datetime.now())
+    assert nodepools_call.call_count == 0
+    assert 'nodepool_metrics' not in results[0]
+    
+    print("✓ Nodepool breakdown test passed")
+
+
+def test_sharded_collection_merges_to_full_document():
+    """Test shards split the projects and their merge matches an unsharded run"""
+    print("Testing sharded collection...")
+    
+    clusters = [{"uuid": "c1", "name": "cluster-1"}, {"uuid": "c2", "name": "cluster-2"}]
+    projects = [{"name": f"project-{i}", "id": f"proj-{i}"} for i in range(12)]
+    cluster_metrics = {"measurements": [{"type": "TOTAL_GPU", "values": [{"value": "8"}]}]}
+    project_metrics = {"current": {"resources": [{"type": "gpu", "utilization": {"percentage": 50}}]}}
+    
+    def collect(shard_index=0, shard_count=1):
+        client = RunAIAPIClient("https://test.run.ai", "test-token")
+        collector = GPUMetricsCollector(client, output_profile='summary',
+                                        shard_index=shard_index, shard_count=shard_count)
+        with patch.object(client, 'get_clusters', return_value=clusters), \
+             patch.object(client, 'get_projects', return_value=projects), \
+             patch.object(client, 'get_projects_quotas', return_value=[]), \
+             patch.object(client, 'get_cluster_metrics', return_value=cluster_metrics) as cluster_call, \
+             patch.object(client, 'get_project_metrics', return_value=project_metrics) as project_call:
+            document = collector.collect_all_metrics()
+        return document, cluster_call.call_count, project_call.call_count
+    
+    full, _, _ = collect()
+    assert 'shard' not in full
+    
+    shards = [collect(index, 3) for index in range(3)]
+    # Every cluster and project is requested by exactly one shard
+    assert sum(cluster_calls for _, cluster_calls, _ in shards) == 2
+    assert sum(project_calls for _, _, project_calls in shards) == 24
+    assert all(project_calls < 24 for _, _, project_calls in shards)
+    assert shards[1][0]['shard'] == {'index': 1, 'count': 3}
+    
+    merged = merge_shard_documents([document for document, _, _ in reversed(shards)])
+    assert [c['cluster_uuid'] for c in merged['clusters']] == ["c1", "c2"]
+    for merged_cluster, full_cluster in zip(merged['clusters'], full['clusters']):
+        assert merged_cluster['cluster_level_metrics']['metrics'] == \
+            full_cluster['cluster_level_metrics']['metrics']
+        values = lambda cluster: sorted(
+            (p['project_id'], p['gpu_metrics']) for p in cluster['project_level_metrics']
+        )
+        assert values(merged_cluster) == values(full_cluster)
+    
+    try:
+        GPUMetricsCollector(RunAIAPIClient("https://test.run.ai", "t"), shard_index=3, shard_count=3)
+        assert False, "Expected ValueError"
+    except ValueError:
+        pass
+    
+    print("✓ Sharded collection test passed")
+
+
+def test_generator_api_applies_backpressure():
+    """Test the record iterators only fetch a bounded number of projects ahead"""
+    print("Testing generator API backpressure...")
+    
+    clusters = [{"uuid": "c1", "name": "one"}, {"uuid": "c2", "name": "two"}]
+    projects = [{"name": f"project-{i}", "id": f"proj-{i}"} for i in range(40)]
+    project_metrics = {"current": {"resources": [{"type": "gpu", "utilization": {"percentage": 5}}]}}
+    
+    client = RunAIAPIClient("https://test.run.ai", "test-token")
+    collector = GPUMetricsCollector(client, max_concurrency=2, parallel_clusters=True)
+    with patch.object(client, 'get_clusters', return_value=clusters), \
+         patch.object(client, 'get_cluster_metrics', return_value={"measurements": []}), \
+         patch.object(client, 'get_projects', return_value=projects), \
+         patch.object(client, 'get_projects_quotas', return_value=[]), \
+         patch.object(client, 'get_project_metrics', return_value=project_metrics) as metrics_call:
+        records = collector.iter_all_metrics(deadline=60)
+        header, cluster, first_project = next(records), next(records), next(records)
+        assert header['record_type'] == "collection"
+        assert cluster['record_type'] == "cluster" and cluster['cluster_uuid'] == "c1"
+        assert first_project['project_id'] == "proj-0"
+        
+        # A stalled consumer stops the fetching well short of the 80 projects
+        time.sleep(0.2)
+        fetched = metrics_call.call_count
+        assert fetched < 30
+        time.sleep(0.1)
+        assert metrics_call.call_count == fetched
+        
+        # Closing the iterator stops the collection and clears the deadline
+        records.close()
+        stopped = metrics_call.call_count
+        time.sleep(0.1)
+        assert metrics_call.call_count == stopped
+        assert client.deadline is None
+        
+        # Consumed to the end, the records are those of collect_all_metrics
+        records = list(collector.iter_all_metrics())
+    assert [r['record_type'] for r in records].count("project") == 80
+    assert [r['cluster_uuid'] for r in records if r['record_type'] == "cluster"] == ["c1", "c2"]
+    c2_start = next(i for i, r in enumerate(records) if r.get('cluster_uuid') == "c2")
+    assert all(r['cluster_uuid'] == "c1" for r in records[2:c2_start])
+    
+    class FakeAsyncClient:
+        calls = 0
+        
+        async def get_projects(self, cluster_uuid):
+            return projects
+        
+        async def get_projects_quotas(self, cluster_uuid):
+            return []
+        
+        async def get_project_metrics(self, cluster_uuid, project_id, start_time, end_time):
+            FakeAsyncClient.calls += 1
+            return project_metrics
+    
+    async def consume_two():
+        collector = AsyncGPUMetricsCollector(FakeAsyncClient(), max_concurrency=3)
+        start_time = datetime.now() - timedelta(hours=1)
+        iterator = collector.iter_project_gpu_metrics("c1", start_time, datetime.now())
+        taken = [await iterator.__anext__(), await iterator.__anext__()]
+        await asyncio.sleep(0.05)
+        await iterator.aclose()
+        return taken
+    
+    taken = asyncio.run(consume_two())
+    assert [r['project_id'] for r in taken] == ["proj-0", "proj-1"]
+    assert FakeAsyncClient.calls <= 2 + 2 * 3
+    
+    print("✓ Generator API backpressure test passed")
+
+
+def test_pruned_metrics_decoding():
+    """Test a pruning client decodes only the used fields of metrics responses"""
+    print("Testing pruned metrics decoding...")
+    
+    body = {
+        "current": {"resources": [{"type": "gpu", "utilization": {"percentage": 30}}]},
+        "workloads": [{"name": f"w{i}", "pods": list(range(20))} for i in range(50)]
+    }
+    
+    def make_response(payload):
+        response = MagicMock(status_code=200, headers={})
+        response.raw = io.BytesIO(json.dumps(payload).encode())
+        response.content = json.dumps(payload).encode()
+        return response
+    
+    client = RunAIAPIClient("https://test.run.ai", "test-token", prune_metrics=True)
+    start_time = datetime.now() - timedelta(hours=1)
+    with patch.object(client.session, 'request',
+                      side_effect=[make_response(body), make_response([{"name": "p"}])]) as request:
+        metrics = client.get_project_metrics("c1", "p1", start_time, datetime.now())
+        projects = client.get_projects("c1")
+    
+    assert metrics == {"current": body["current"]}
+    assert request.call_args_list[0].kwargs['stream'] is True
+    assert request.call_args_list[1].kwargs['stream'] is False
+    assert projects == [{"name": "p"}]
+    
+    collector = GPUMetricsCollector(client, output_profile='summary')
+    assert collector._extract_gpu_utilization(metrics) == 30.0
+    
+    print("✓ Pruned metrics decoding test passed")
+
+
 def test_json_output():
     """Test JSON output formatting"""
     print("Testing JSON output formatting...")
@@ -282,6 +1216,26 @@ def run_all_tests():
         test_metrics_collector_initialization,
         test_gpu_utilization_extraction,
         test_mock_data_processing,
+        test_concurrent_project_collection,
+        test_parallel_cluster_collection,
+        test_async_collection,
+        test_ndjson_streaming,
+        test_output_profiles,
+        test_collected_records_are_plain_json,
+        test_incremental_collection_with_store,
+        test_store_skips_null_quota_values,
+        test_inventory_cache_with_revalidation,
+        test_time_window_planning,
+        test_windowed_fetch_merges_series,
+        test_rate_limited_client_retries_throttled_requests,
+        test_circuit_breaker_short_circuits_projects,
+        test_deadline_does_not_change_circuits,
+        test_request_timeouts_and_deadline,
+        test_quota_planner_skips_idle_projects,
+        test_nodepool_breakdown,
+        test_sharded_collection_merges_to_full_document,
+        test_generator_api_applies_backpressure,
+        test_pruned_metrics_decoding,
         test_json_output
     ]
     
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Simple test script for collector sharding
+
+This script validates the shard assignment and the merge of shard outputs
+used by the RunAI GPU Metrics Collector.
+"""
+
+import sys
+
+# Import the module
+try:
+    from sharding import cluster_shard_key, merge_shard_documents, project_shard_key, shard_of
+except ImportError:
+    print("Error: Could not import sharding module")
+    sys.exit(1)
+
+
+def test_shard_assignment_is_stable():
+    """Test keys map to a fixed shard and spread over all shards"""
+    print("Testing shard assignment...")
+    
+    keys = [project_shard_key("c1", f"proj-{i}") for i in range(300)]
+    shards = [shard_of(key, 4) for key in keys]
+    # Same answer every time (no dependency on hash randomization)
+    assert shards == [shard_of(key, 4) for key in keys]
+    assert shard_of("c1/proj-0", 4) == shards[0]
+    assert all(0 <= shard < 4 for shard in shards)
+    # Roughly even split
+    for shard in range(4):
+        assert 50 <= shards.count(shard) <= 100
+    assert all(shard_of(key, 1) == 0 for key in keys)
+    
+    print("✓ Shard assignment test passed")
+
+
+def test_merge_shard_documents():
+    """Test shard outputs merge into one document and incomplete sets are rejected"""
+    print("Testing shard merge...")
+    
+    owner = shard_of(cluster_shard_key("c1"), 2)
+    
+    def document(index, projects, **extra):
+        cluster_level = {'metrics': {'TOTAL_GPU': {'current_value': 8}}} \
+            if index == owner else {'shard': owner}
+        return {
+            'collection_timestamp': f"2024-01-01T00:00:0{index}",
+            'time_range': {'start': "2023-12-31T23:00:00", 'end': "2024-01-01T00:00:00"},
+            'shard': {'index': index, 'count': 2},
+            'clusters': [{
+                'cluster_uuid': "c1",
+                'cluster_name': "cluster-1",
+                'cluster_level_metrics': cluster_level,
+                'project_level_metrics': [{'project_name': name} for name in projects]
+            }],
+            **extra
+        }
+    
+    merged = merge_shard_documents([
+        document(1, ["b"], deadline_exceeded=True),
+        document(0, ["a", "c"])
+    ])
+    assert 'shard' not in merged
+    assert merged['collection_timestamp'] == "2024-01-01T00:00:01"
+    assert merged['deadline_exceeded'] is True
+    assert len(merged['clusters']) == 1
+    cluster = merged['clusters'][0]
+    assert cluster['cluster_level_metrics'] == {'metrics': {'TOTAL_GPU': {'current_value': 8}}}
+    assert [p['project_name'] for p in cluster['project_level_metrics']] == ["a", "c", "b"]
+    assert merged['time_range'] == {'start': "2023-12-31T23:00:00", 'end': "2024-01-01T00:00:00"}
+    assert 'time_range_mismatch' not in merged
+    
+    # Windows further apart than max_skew merge to their union and are flagged
+    late = {'start': "2024-01-01T00:00:00", 'end': "2024-01-01T01:00:00"}
+    merged = merge_shard_documents([document(0, ["a"]), document(1, ["b"], time_range=late)])
+    assert merged['time_range'] == {'start': "2023-12-31T23:00:00", 'end': "2024-01-01T01:00:00"}
+    assert merged['time_range_mismatch'] is True
+    assert merged['shard_time_ranges'][1] == late
+    
+    for documents in ([document(0, [])], [document(0, []), document(0, [])], []):
+        try:
+            merge_shard_documents(documents)
+            assert False, "Expected ValueError"
+        except ValueError:
+            pass
+    
+    print("✓ Shard merge test passed")
+
+
+def run_all_tests():
+    """Run all test functions"""
+    print("Running Sharding Tests")
+    print("=" * 50)
+    
+    tests = [
+        test_shard_assignment_is_stable,
+        test_merge_shard_documents
+    ]
+    
+    passed = 0
+    failed = 0
+    
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except Exception as e:
+            print(f"✗ {test_func.__name__} failed: {e}")
+            failed += 1
+    
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed} passed, {failed} failed")
+    
+    if failed > 0:
+        print("Some tests failed. Please check the implementation.")
+        return False
+    else:
+        print("All tests passed! ✓")
+        return True
+
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Simple test script for GPU utilization resolution
+
+This script validates the layout detection, the compiled accessors and the
+schema mismatch reporting used by the RunAI GPU Metrics Collector.
+"""
+
+import sys
+
+# Import the module
+try:
+    from utilization_resolver import UtilizationResolver
+except ImportError:
+    print("Error: Could not import utilization_resolver module")
+    sys.exit(1)
+
+
+def _gpu(key, value):
+    """Resource list with one gpu utilization entry"""
+    return [{"type": "cpu"}, {"type": "gpu", "utilization": {key: value}}]
+
+
+def test_compiled_layout():
+    """Test the layout is compiled from the first response and returns full series"""
+    print("Testing compiled utilization layout...")
+    
+    resolver = UtilizationResolver()
+    response = {
+        "current": {"resources": _gpu("percentage", 42.0)},
+        "timeRange": {"data": [
+            {"timestamp": "t1", "resources": _gpu("percentage", 10)},
+            {"timestamp": "t2", "resources": _gpu("percentage", "20.5")}
+        ]}
+    }
+    
+    current, series = resolver.resolve(response)
+    assert current == 42.0
+    assert series == [{"timestamp": "t1", "value": 10.0}, {"timestamp": "t2", "value": 20.5}]
+    assert resolver.current_layout == 'percentage'
+    assert resolver.series_layout == 'percentage'
+    
+    # Without a current value the latest sample is used
+    current, series = resolver.resolve({"timeRange": {"data": [
+        {"timestamp": "t1", "resources": _gpu("percentage", 5)},
+        {"timestamp": "t2", "resources": _gpu("percentage", 7)}
+    ]}})
+    assert current == 7.0 and len(series) == 2
+    
+    # Idle projects without gpu entries are not mismatches
+    assert resolver.resolve({"current": {"resources": []}}) == (0.0, [])
+    assert resolver.resolve({}) == (0.0, [])
+    
+    report = resolver.report()
+    assert report['resolved'] == 4
+    assert report['mismatches'] == {}
+    
+    # Flat gpu_utilization samples
+    resolver = UtilizationResolver()
+    current, series = resolver.resolve({"timeRange": {"data": [
+        {"timestamp": 1, "gpu_utilization": 30}, {"timestamp": 2, "gpu_utilization": 60}
+    ]}})
+    assert resolver.series_layout == 'gpu_utilization'
+    assert current == 60.0
+    assert [sample['value'] for sample in series] == [30.0, 60.0]
+    
+    print("✓ Compiled utilization layout test passed")
+
+
+def test_schema_mismatch_reported():
+    """Test responses of another layout are resolved generically and reported"""
+    print("Testing schema mismatch reporting...")
+    
+    resolver = UtilizationResolver()
+    resolver.resolve({
+        "current": {"resources": _gpu("percentage", 1)},
+        "timeRange": {"data": [{"timestamp": "t1", "resources": _gpu("percentage", 1)}]}
+    })
+    
+    # Current value under another key
+    current, _ = resolver.resolve({"current": {"resources": _gpu("value", 55)}})
+    assert current == 55.0
+    
+    # Mixed sample layouts keep every sample
+    current, series = resolver.resolve({"timeRange": {"data": [
+        {"timestamp": "t1", "resources": _gpu("percentage", 10)},
+        {"timestamp": "t2", "gpu_utilization": 20}
+    ]}})
+    assert [sample['value'] for sample in series] == [10.0, 20.0]
+    assert current == 20.0
+    
+    # Not an object at all
+    assert resolver.resolve([]) == (0.0, [])
+    
+    report = resolver.report()
+    assert report['mismatches'] == {'current': 1, 'series': 1, 'response': 1}
+    assert report['resolved'] == 3
+    
+    # Counts are reset by report, the compiled layouts are kept
+    report = resolver.report()
+    assert report['mismatches'] == {} and report['resolved'] == 0
+    assert report['current_layout'] == 'percentage'
+    
+    print("✓ Schema mismatch reporting test passed")
+
+
+def run_all_tests():
+    """Run all test functions"""
+    print("Running Utilization Resolver Tests")
+    print("=" * 50)
+    
+    tests = [
+        test_compiled_layout,
+        test_schema_mismatch_reported
+    ]
+    
+    passed = 0
+    failed = 0
+    
+    for test_func in tests:
+        try:
+            test_func()
+            passed += 1
+        except Exception as e:
+            print(f"✗ {test_func.__name__} failed: {e}")
+            failed += 1
+    
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed} passed, {failed} failed")
+    
+    if failed > 0:
+        print("Some tests failed. Please check the implementation.")
+        return False
+    else:
+        print("All tests passed! ✓")
+        return True
+
+
+if __name__ == '__main__':
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+GPU utilization extraction for the RunAI GPU Metrics Collector
+
+Project metrics responses carry GPU utilization in one of several layouts:
+
+- current:    current.resources[type=gpu].utilization.{percentage|value}
+- per sample: timeRange.data[*].resources[type=gpu].utilization.{percentage|value}
+              or timeRange.data[*].gpu_utilization
+
+A deployment answers every request with the same layout, so instead of
+probing all of them for every response, UtilizationResolver detects the
+layout from the first responses that contain data and compiles a direct
+accessor for it. Responses that do not fit the compiled accessor are counted
+as schema mismatches, resolved with the generic probing and reported.
+"""
+
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Keys of the utilization object of a gpu resource, in order of preference
+UTILIZATION_KEYS = ('percentage', 'value')
+
+
+class SchemaMismatch(Exception):
+    """Raised by a compiled accessor for a response of another layout"""
+
+
+def _gpu_utilization(resources: List[Dict]) -> Optional[Dict]:
+    """Utilization object of the gpu entry of a resource list, if any"""
+    for resource in resources:
+        if resource.get('type') == 'gpu':
+            return resource.get('utilization') or {}
+    return None
+
+
+def _detect_resource_key(resources: Any) -> Optional[str]:
+    """Utilization key used by a resource list, or None if it has no gpu value"""
+    if not isinstance(resources, list):
+        return None
+    utilization = _gpu_utilization(resources)
+    if utilization is None:
+        return None
+    for key in UTILIZATION_KEYS:
+        if key in utilization:
+            return key
+    return None
+
+
+def _detect_point_layout(point: Any) -> Optional[str]:
+    """Layout of one timeRange.data point ('percentage', 'value' or 'gpu_utilization')"""
+    if not isinstance(point, dict):
+        return None
+    key = _detect_resource_key(point.get('resources'))
+    if key is not None:
+        return key
+    if point.get('gpu_utilization') is not None:
+        return 'gpu_utilization'
+    return None
+
+
+def _compile_current(key: str) -> Callable[[Dict], Optional[float]]:
+    """Accessor of the current utilization for a utilization key"""
+    def current(metrics_data: Dict) -> Optional[float]:
+        try:
+            resources = metrics_data['current']['resources']
+        except (KeyError, TypeError):
+            return None
+        for resource in resources:
+            if resource.get('type') == 'gpu':
+                utilization = resource.get('utilization') or {}
+                if key not in utilization:
+                    raise SchemaMismatch(f"gpu resource without utilization.{key}")
+                return float(utilization[key])
+        return None
+    return current
+
+
+def _compile_series(layout: str) -> Callable[[List[Dict]], List[Dict]]:
+    """Accessor of the per-sample series of timeRange.data points for a layout"""
+    if layout == 'gpu_utilization':
+        def series(points: List[Dict]) -> List[Dict]:
+            try:
+                return [
+                    {'timestamp': point.get('timestamp'), 'value': float(point['gpu_utilization'])}
+                    for point in points
+                ]
+            except (KeyError, TypeError, ValueError) as e:
+                raise SchemaMismatch(f"sample without gpu_utilization ({e})")
+        return series
+    
+    def series(points: List[Dict]) -> List[Dict]:
+        samples = []
+        for point in points:
+            try:
+                for resource in point['resources']:
+                    if resource['type'] == 'gpu':
+                        samples.append({
+                            'timestamp': point.get('timestamp'),
+                            'value': float(resource['utilization'][layout])
+                        })
+                        break
+            except (KeyError, TypeError, ValueError) as e:
+                raise SchemaMismatch(f"sample without resources[gpu].utilization.{layout} ({e})")
+        return samples
+    return series
+
+
+def _generic_series(points: List[Any]) -> List[Dict]:
+    """Per-sample series of points of any layout, skipping points without a value"""
+    samples = []
+    for point in points:
+        layout = _detect_point_layout(point)
+        if layout is None:
+            continue
+        if layout == 'gpu_utilization':
+            value = point['gpu_utilization']
+        else:
+            value = _gpu_utilization(point['resources'])[layout]
+        try:
+            samples.append({'timestamp': point.get('timestamp'), 'value': float(value)})
+        except (TypeError, ValueError):
+            continue
+    return samples
+
+
+def _points(metrics_data: Dict) -> List[Any]:
+    """timeRange.data of a response, or an empty list"""
+    time_range = metrics_data.get('timeRange')
+    points = time_range.get('data') if isinstance(time_range, dict) else None
+    return points if isinstance(points, list) else []
+
+
+class UtilizationResolver:
+    """Extract GPU utilization with accessors compiled for the detected layout"""
+    
+    def __init__(self):
+        self.current_layout: Optional[str] = None
+        self.series_layout: Optional[str] = None
+        self._current: Optional[Callable[[Dict], Optional[float]]] = None
+        self._series: Optional[Callable[[List[Dict]], List[Dict]]] = None
+        self._lock = threading.Lock()
+        self._resolved = 0
+        self._mismatches: Dict[str, int] = {}
+    
+    def resolve(self, metrics_data: Dict) -> Tuple[float, List[Dict]]:
+        """
+        Extract the utilization of a project metrics response
+        
+        Args:
+            metrics_data: Response of get_project_metrics
+        
+        Returns:
+            (current utilization, per-sample series as {'timestamp', 'value'}
+            dicts). The current value comes from 'current', falling back to
+            the latest sample; it is 0.0 if the response has no utilization.
+        """
+        if not isinstance(metrics_data, dict):
+            self._record_mismatch('response', f"expected an object, got {type(metrics_data).__name__}")
+            return 0.0, []
+        
+        if self._current is None or self._series is None:
+            self._compile(metrics_data)
+        
+        current = self._resolve_current(metrics_data)
+        series = self._resolve_series(_points(metrics_data))
+        with self._lock:
+            self._resolved += 1
+        
+        if current is None:
+            current = series[-1]['value'] if series else 0.0
+        return current, series
+    
+    def _compile(self, metrics_data: Dict):
+        """Compile accessors for the layouts found in a response"""
+        with self._lock:
+            if self._current is None:
+                current = metrics_data.get('current')
+                key = _detect_resource_key(current.get('resources') if isinstance(current, dict) else None)
+                if key is not None:
+                    self.current_layout = key
+                    self._current = _compile_current(key)
+                    logger.debug(f"Current GPU utilization read from resources[gpu].utilization.{key}")
+            if self._series is None:
+                for point in _points(metrics_data):
+                    layout = _detect_point_layout(point)
+                    if layout is not None:
+                        self.series_layout = layout
+                        self._series = _compile_series(layout)
+                        logger.debug(f"GPU utilization samples read from the '{layout}' layout")
+                        break
+    
+    def _resolve_current(self, metrics_data: Dict) -> Optional[float]:
+        """Current utilization, or None if the response has none"""
+        mismatch = None
+        if self._current is not None:
+            try:
+                value = self._current(metrics_data)
+            except (SchemaMismatch, TypeError, ValueError) as e:
+                mismatch = str(e)
+            else:
+                if value is not None:
+                    return value
+        
+        current = metrics_data.get('current')
+        resources = current.get('resources') if isinstance(current, dict) else None
+        key = _detect_resource_key(resources)
+        if self._current is not None and (mismatch or key is not None):
+            # The compiled accessor failed, or found nothing where another layout has a value
+            self._record_mismatch('current', mismatch or f"utilization.{key} instead of "
+                                                          f"utilization.{self.current_layout}")
+        if key is None:
+            return None
+        try:
+            return float(_gpu_utilization(resources)[key])
+        except (TypeError, ValueError):
+            return None
+    
+    def _resolve_series(self, points: List[Any]) -> List[Dict]:
+        """Per-sample series of timeRange.data points"""
+        if not points:
+            return []
+        if self._series is not None:
+            try:
+                series = self._series(points)
+            except SchemaMismatch as e:
+                self._record_mismatch('series', str(e))
+            else:
+                if len(series) == len(points):
+                    return series
+                # Points the compiled layout skipped may hold values in another layout
+                generic = _generic_series(points)
+                if len(generic) > len(series):
+                    self._record_mismatch('series', f"samples outside the '{self.series_layout}' layout")
+                return generic
+        return _generic_series(points)
+    
+    def _record_mismatch(self, part: str, detail: str):
+        """Count a response that did not match the compiled layout"""
+        with self._lock:
+            count = self._mismatches.get(part, 0) + 1
+            self._mismatches[part] = count
+        if count == 1:
+            logger.warning(f"GPU utilization schema mismatch in {part}: {detail}; "
+                           f"falling back to generic extraction")
+    
+    def report(self) -> Dict[str, Any]:
+        """
+        Log and reset the mismatch counts since the last report
+        
+        Returns:
+            Dictionary with the compiled layouts, the number of responses
+            resolved and the mismatches per part ('current', 'series', 'response')
+        """
+        with self._lock:
+            summary = {
+                'current_layout': self.current_layout,
+                'series_layout': self.series_layout,
+                'resolved': self._resolved,
+                'mismatches': dict(self._mismatches)
+            }
+            self._resolved = 0
+            self._mismatches = {}
+        for part, count in summary['mismatches'].items():
+            logger.warning(f"{count} of {summary['resolved']} project metrics responses did not "
+                           f"match the detected GPU utilization schema ({part})")
+        return summary